@@ -15,22 +15,32 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import logging
+from base64 import urlsafe_b64decode
 from datetime import datetime, timezone
 from re import finditer
+from time import time
 
 import requests
 from tools.announcements import EmptyAnnouncementMessage, make_message
+from tools.json_store import JsonStore
 
 LOG = logging.getLogger("Bluesky")
 
+XRPC_URL = "https://bsky.social/xrpc/"
+DEFAULT_SESSION_CACHE = "~/.cache/voctopublish/bluesky_sessions.json"
+# seconds, access tokens get refreshed this long before they expire
+TOKEN_REFRESH_MARGIN = 60
+# seconds to wait for bluesky to answer
+TIMEOUT = 30
+
 
 def send_post(ticket, config):
     LOG.info("post the release to bluesky")
 
-    try:
-        message = make_message(ticket, config, 280)
-    except EmptyAnnouncementMessage:
+    message = make_post(ticket, config)
+    if message is None:
         return
 
     try:
@@ -39,6 +49,26 @@ def send_post(ticket, config):
         LOG.exception("Posting failed")
 
 
+def make_post(ticket, config):
+    """
+    :return: the announcement message or None if there is nothing to announce
+    """
+    try:
+        return make_message(ticket, config, 280)
+    except EmptyAnnouncementMessage:
+        return None
+
+
+def post(payload, config):
+    """
+    post a message created by make_post(). Raises if posting fails.
+    :param payload: dict with the message
+    """
+    result = _send_bluesky_post(payload["message"], config)
+    LOG.info(result)
+    return result
+
+
 def _send_bluesky_post(message, config):
     post = {
         "$type": "app.bsky.feed.post",
@@ -79,20 +109,22 @@ def _send_bluesky_post(message, config):
             }
         )
 
-    r = requests.post(
-        "https://bsky.social/xrpc/com.atproto.server.createSession",
-        json={
-            "identifier": config["bluesky"]["username"],
-            "password": config["bluesky"]["app_password"],
-        },
-    )
+    LOG.debug(post)
+
+    session = _get_session(config)
+    r = _create_record(session, post)
+    if r.status_code in (400, 401) and "ExpiredToken" in r.text:
+        # revoked or expired earlier than announced, try again with a new one
+        session = _get_session(config, expired=session)
+        r = _create_record(session, post)
+    LOG.debug(r.text)
     r.raise_for_status()
-    session = r.json()
+    return r.json()
 
-    LOG.debug(post)
 
-    r = requests.post(
-        "https://bsky.social/xrpc/com.atproto.repo.createRecord",
+def _create_record(session, post):
+    return requests.post(
+        XRPC_URL + "com.atproto.repo.createRecord",
         headers={
             "Authorization": f"Bearer {session['accessJwt']}",
         },
@@ -101,10 +133,81 @@ def _send_bluesky_post(message, config):
             "record": post,
             "repo": session["did"],
         },
+        timeout=TIMEOUT,
     )
-    LOG.debug(r.text)
-    r.raise_for_status()
-    return r.json()
+
+
+def _get_session(config, expired=None):
+    """
+    get a session for the configured account. Sessions are cached and
+    shared between processes, their access token gets refreshed using the
+    refresh token when it expires. Only if that fails, we log in again
+    using the app password.
+    :param expired: session which was rejected by the server
+    :return: dict with accessJwt, refreshJwt and did
+    """
+    cache = JsonStore(config["bluesky"].get("session_cache", DEFAULT_SESSION_CACHE))
+    key = JsonStore.key(config["bluesky"]["username"])
+    with cache.entries() as entries:
+        session = entries.get(key)
+
+    if (
+        session
+        and session != expired
+        and _jwt_expires_at(session["accessJwt"]) - TOKEN_REFRESH_MARGIN > time()
+    ):
+        return session
+
+    # the store stays unlocked while talking to bluesky, other processes
+    # would wait for the network otherwise
+    if session:
+        LOG.debug("refreshing bluesky session")
+        r = requests.post(
+            XRPC_URL + "com.atproto.server.refreshSession",
+            headers={
+                "Authorization": f"Bearer {session['refreshJwt']}",
+            },
+            timeout=TIMEOUT,
+        )
+        if r.ok:
+            session = r.json()
+        else:
+            LOG.info(f"could not refresh bluesky session: {r.text}")
+            session = None
+
+    if not session:
+        LOG.debug("creating new bluesky session")
+        r = requests.post(
+            XRPC_URL + "com.atproto.server.createSession",
+            json={
+                "identifier": config["bluesky"]["username"],
+                "password": config["bluesky"]["app_password"],
+            },
+            timeout=TIMEOUT,
+        )
+        r.raise_for_status()
+        session = r.json()
+
+    session = {
+        "accessJwt": session["accessJwt"],
+        "refreshJwt": session["refreshJwt"],
+        "did": session["did"],
+    }
+    with cache.entries() as entries:
+        entries[key] = session
+    return session
+
+
+def _jwt_expires_at(token):
+    """
+    :return: expiry timestamp of a JWT, 0 if it can't be determined
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(urlsafe_b64decode(payload))["exp"]
+    except (IndexError, KeyError, ValueError):
+        return 0
 
 
 def _parse_urls(text):
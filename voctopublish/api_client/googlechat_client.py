@@ -24,6 +24,31 @@ def send_chat_message(ticket, config):
     LOG = logging.getLogger("GoogleChat")
     LOG.info("posting message to google chat")
 
+    payload = make_chat_message(ticket, config)
+    try:
+        post_chat_message(payload, config)
+    except Exception as e_:
+        LOG.error("failed: " + repr(e_))
+        if getattr(e_, "response", None) is not None:
+            LOG.error(e_.response.text)
+        LOG.debug(payload)
+
+
+def post_chat_message(payload, config):
+    """
+    post a message created by make_chat_message(). Raises if posting fails.
+    :param payload: dict with the webhook url and the message
+    """
+    LOG = logging.getLogger("GoogleChat")
+    r = post(payload["url"], json=payload["message"])
+    r.raise_for_status()
+    LOG.debug(repr(r.json()))
+
+
+def make_chat_message(ticket, config):
+    """
+    :return: dict with the webhook url and the card message to post to it
+    """
     buttons = []
     if ticket.voctoweb_enable:
         buttons.append(
@@ -127,48 +152,38 @@ def send_chat_message(ticket, config):
             }
         )
 
-    payload = None
-    try:
-        payload = {
-            "cardsV2": [
-                {
-                    "cardId": ticket.slug,
-                    "card": {
-                        "header": {
-                            "title": ticket.title,
-                            "subtitle": ticket.acronym,
-                        },
-                        "sections": [
-                            {
-                                "header": "Infos",
-                                "collapsible": False,
-                                "widgets": [
-                                    {
-                                        "textParagraph": {
-                                            "text": (
-                                                ticket.abstract
-                                                if ticket.abstract
-                                                else ""
-                                            ),
-                                        },
+    message = {
+        "cardsV2": [
+            {
+                "cardId": ticket.slug,
+                "card": {
+                    "header": {
+                        "title": ticket.title,
+                        "subtitle": ticket.acronym,
+                    },
+                    "sections": [
+                        {
+                            "header": "Infos",
+                            "collapsible": False,
+                            "widgets": [
+                                {
+                                    "textParagraph": {
+                                        "text": (
+                                            ticket.abstract if ticket.abstract else ""
+                                        ),
                                     },
-                                    *key_value,
-                                    {
-                                        "buttonList": {
-                                            "buttons": buttons,
-                                        },
+                                },
+                                *key_value,
+                                {
+                                    "buttonList": {
+                                        "buttons": buttons,
                                     },
-                                ],
-                            },
-                        ],
-                    },
+                                },
+                            ],
+                        },
+                    ],
                 },
-            ],
-        }
-        r = post(ticket.googlechat_webhook_url, json=payload)
-        r.raise_for_status()
-        LOG.debug(repr(r.json()))
-    except Exception as e_:
-        LOG.error("failed: " + repr(e_))
-        LOG.error(e_.response.text)
-        LOG.debug(payload)
+            },
+        ],
+    }
+    return {"url": ticket.googlechat_webhook_url, "message": message}
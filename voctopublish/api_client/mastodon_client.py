@@ -17,21 +17,78 @@
 
 import logging
 from pathlib import Path
+from threading import Lock
 
-from mastodon import Mastodon
 from tools.announcements import EmptyAnnouncementMessage, make_message
 
+# authenticated client, shared by all toots of this process
+_CLIENT = None
+_CLIENT_LOCK = Lock()
+
 
 def send_toot(ticket, config):
     LOG = logging.getLogger("Mastodon")
     LOG.info("toot the release")
 
+    message = make_toot(ticket, config)
+    if message is None:
+        return
+
+    try:
+        return post_toot({"message": message}, config)
+    except Exception:
+        # we don't care if tooting fails here.
+        LOG.exception("Tooting failed")
+
+
+def make_toot(ticket, config):
+    """
+    :return: the announcement message or None if there is nothing to announce
+    """
     try:
-        message = make_message(ticket, config, 500)
+        return make_message(ticket, config, 500)
     except EmptyAnnouncementMessage:
-        return
+        return None
+
+
+def post_toot(payload, config):
+    """
+    toot a message created by make_toot(). Raises if tooting fails.
+    :param payload: dict with the message
+    """
+    LOG = logging.getLogger("Mastodon")
+
+    client = _client(config)
+    from mastodon import MastodonUnauthorizedError
 
     try:
+        toot = client.status_post(
+            payload["message"],
+            language="en",  # announcements are always in english
+        )
+    except MastodonUnauthorizedError:
+        LOG.warning("mastodon rejected our access token, logging in again")
+        _reset_client(client)
+        raise
+    LOG.debug(toot)
+    return {
+        "id": toot["id"],
+        "uri": toot["uri"],
+    }
+
+
+def _client(config):
+    """
+    log in once and return the same client for every toot of this process
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            return _CLIENT
+
+        # Mastodon.py takes long to import and make_toot() doesn't need it
+        from mastodon import Mastodon
+
         # check if we already have our client token and secret and if not get a new one
         if not Path("./mastodon_clientcred.secret").exists():
             logging.debug("no mastodon client credentials found, get fresh ones")
@@ -43,14 +100,13 @@ def send_toot(ticket, config):
         else:
             logging.debug("Using existing Mastodon client credentials")
 
-        mastodon = Mastodon(
-            client_id="mastodon_clientcred.secret",
-            api_base_url=config["mastodon"]["api_base_url"],
-        )
-
         # check if we already have an access token, if not get a fresh one
         if not Path("./mastodon_usercred.secret").exists():
             logging.debug("no mastodon user credentials found, getting a fresh token")
+            mastodon = Mastodon(
+                client_id="mastodon_clientcred.secret",
+                api_base_url=config["mastodon"]["api_base_url"],
+            )
             mastodon.log_in(
                 config["mastodon"]["email"],
                 config["mastodon"]["password"],
@@ -60,19 +116,22 @@ def send_toot(ticket, config):
             logging.debug("Using existing Mastodon user token")
 
         # Create actual API instance
-        mastodon = Mastodon(
+        _CLIENT = Mastodon(
             access_token="mastodon_usercred.secret",
             api_base_url=config["mastodon"]["api_base_url"],
         )
-        toot = mastodon.status_post(
-            message,
-            language="en",  # announcements are always in english
-        )
-        LOG.debug(toot)
-        return {
-            "id": toot["id"],
-            "uri": toot["uri"],
-        }
-    except Exception:
-        # we don't care if tooting fails here.
-        LOG.exception("Tooting failed")
+        return _CLIENT
+
+
+def _reset_client(client):
+    """
+    forget a client whose access token got rejected, the next toot logs in
+    again and gets a new token
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not client:
+            # someone else has logged in again already
+            return
+        _CLIENT = None
+        Path("./mastodon_usercred.secret").unlink(missing_ok=True)
@@ -1,32 +1,206 @@
+import atexit
+import json
 import logging
+import os
+import socket
 from datetime import datetime
-from os.path import join
-from subprocess import CalledProcessError, check_output
+from glob import glob
+from os.path import basename, dirname, join
+from secrets import token_hex
+from subprocess import DEVNULL, CalledProcessError, Popen, check_output, run
+from threading import Lock
+from time import monotonic, sleep
 
+import requests
 from model.ticket_module import Ticket
 
 LOG = logging.getLogger(__name__)
 
+# seconds between two progress reports of rcd jobs
+RCD_POLL_INTERVAL = 5
+# seconds to wait for a freshly started rcd to answer
+RCD_STARTUP_TIMEOUT = 30
+# parallel transfers when copying artifacts
+DEFAULT_TRANSFERS = 4
+
+# per-file results of upload_artifacts()
+COPIED = "copied"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
+
+class RCloneException(Exception):
+    pass
+
+
+class RCloneDaemon:
+    """
+    rclone remote control daemon (rclone rcd). Started once per process
+    and used for all transfers, so rclone doesn't have to read its config
+    and authenticate to the backends for every file.
+
+    If rclone.rcd_url is configured, an already running daemon gets used
+    instead of starting one.
+    """
+
+    _instance = None
+    _lock = Lock()
+
+    @classmethod
+    def get(cls, config):
+        """
+        :param config: [rclone] table of the config
+        :return: the daemon of this process, starting it if needed
+        """
+        with cls._lock:
+            if cls._instance is None or not cls._instance.running:
+                cls._instance = cls(config)
+            return cls._instance
+
+    def __init__(self, config):
+        self.process = None
+        if config.get("rcd_url"):
+            self.url = config["rcd_url"].rstrip("/") + "/"
+            self.auth = None
+            if config.get("rcd_user"):
+                self.auth = (config["rcd_user"], config.get("rcd_pass", ""))
+            return
+
+        # only we should be able to use our daemon
+        self.auth = ("voctopublish", token_hex(16))
+        addr = f"127.0.0.1:{_free_port()}"
+        self.url = f"http://{addr}/"
+        LOG.info(f"starting rclone rcd on {addr}")
+        self.process = Popen(
+            [
+                config["exe_path"],
+                "rcd",
+                "--config",
+                config["config_path"],
+                "--rc-addr",
+                addr,
+                "--rc-user",
+                self.auth[0],
+            ],
+            # command lines can be read by every user of the machine
+            env=dict(os.environ, RCLONE_RC_PASS=self.auth[1]),
+            stdout=DEVNULL,
+        )
+        atexit.register(self.stop)
+
+        deadline = monotonic() + RCD_STARTUP_TIMEOUT
+        while True:
+            try:
+                self.call("rc/noop")
+                break
+            except requests.ConnectionError:
+                if self.process.poll() is not None or monotonic() > deadline:
+                    self.stop()
+                    raise RCloneException("rclone rcd did not start")
+                sleep(0.2)
+
+    @property
+    def running(self):
+        return self.process is None or self.process.poll() is None
+
+    def call(self, method, **params):
+        """
+        call a method of the remote control API
+        :return: the decoded response
+        """
+        r = requests.post(self.url + method, json=params, auth=self.auth)
+        if not r.ok:
+            raise RCloneException(f"{method} failed: {r.status_code} {r.text}")
+        return r.json()
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            LOG.info("stopping rclone rcd")
+            self.process.terminate()
+            self.process.wait()
+
+
+def _split_remote(destination):
+    """
+    :return: tuple of the directory and the file name of a remote path
+    """
+    if ":" in destination and "/" in destination.split(":", 1)[1]:
+        return tuple(destination.rsplit("/", 1))
+    fs, remote = destination.split(":", 1)
+    return fs + ":", remote
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
 
 class RCloneClient:
     def __init__(self, t: Ticket, config):
         self.ticket = t
+        self.config = config["rclone"]
         self.rclone_path = config["rclone"]["exe_path"]
         self.rclone_config = config["rclone"]["config_path"]
+        # transfer statistics of the last rcd job
+        self.stats = {}
 
         date_time = datetime.strptime(t.date, "%Y-%m-%dT%H:%M:%S%z")
-        self.destination = self.ticket.rclone_destination.format(
-            day=date_time.strftime("%d"),
-            event=self.ticket.acronym,
-            fahrplan_day=self.ticket.day,
-            filename_full=self.ticket.filename,
-            filename_short=self.ticket.local_filename,
-            format=self.ticket.folder,
-            month=date_time.strftime("%m"),
-            year=date_time.strftime("%Y"),
+        self.fields = {
+            "day": date_time.strftime("%d"),
+            "event": self.ticket.acronym,
+            "fahrplan_day": self.ticket.day,
+            "filename_full": self.ticket.filename,
+            "filename_short": self.ticket.local_filename,
+            "format": self.ticket.folder,
+            "month": date_time.strftime("%m"),
+            "year": date_time.strftime("%Y"),
+        }
+        self.destination = self.ticket.rclone_destination.format(**self.fields)
+        self.artifacts = self._artifacts(config["rclone"].get("artifacts", []))
+
+    def _artifacts(self, manifest):
+        """
+        resolve the artifact manifest of the config
+        :param manifest: list of dicts with source and destination templates.
+            source is a glob relative to the publishing path, destination
+            may additionally use {name}, the file name of the source. The
+            optional name identifies the entry in the ticket properties, it
+            defaults to the position of the entry in the manifest.
+        :return: list of (name of the entry, source path, destination) tuples
+        """
+        fields = dict(
+            self.fields,
+            fahrplan_id=self.ticket.fahrplan_id,
+            slug=self.ticket.slug,
         )
+        artifacts = []
+        for i, artifact in enumerate(manifest, 1):
+            pattern = join(
+                self.ticket.publishing_path, artifact["source"].format(**fields)
+            )
+            sources = sorted(glob(pattern))
+            if not sources:
+                LOG.debug(f"no artifact matches {pattern}, skipping")
+            for source in sources:
+                destination = artifact["destination"].format(
+                    name=basename(source), **fields
+                )
+                artifacts.append((artifact.get("name", str(i)), source, destination))
+        return artifacts
 
     def upload(self):
+        """
+        copy the release to the destination
+        :return: exit code like rclone would return it. 9 means the file was
+            not transferred, because it already exists at the destination.
+        """
+        if self.config.get("backend", "process") == "rcd":
+            return self._upload_rcd(
+                join(self.ticket.publishing_path, self.ticket.local_filename),
+                self.destination,
+            )
+
         try:
             out = check_output(
                 [
@@ -57,3 +231,203 @@ class RCloneClient:
         else:
             LOG.info(f"uploaded to {self.destination}")
             return 0
+
+    def _upload_rcd(self, source, destination):
+        """
+        copy source to destination using an operations/copyfile job of
+        the rclone rcd and report its progress while it runs
+        """
+        daemon = RCloneDaemon.get(self.config)
+        group = f"voctopublish/{self.ticket.id}/{basename(source)}"
+        dst_fs, dst_remote = _split_remote(destination)
+
+        try:
+            job = daemon.call(
+                "operations/copyfile",
+                srcFs=dirname(source),
+                srcRemote=basename(source),
+                dstFs=dst_fs,
+                dstRemote=dst_remote,
+                _async=True,
+                _group=group,
+            )
+            while True:
+                status = daemon.call("job/status", jobid=job["jobid"])
+                self.stats = daemon.call("core/stats", group=group)
+                if status["finished"]:
+                    break
+                LOG.info(
+                    f"rclone job {job['jobid']}: "
+                    f"{self.stats.get('bytes', 0) / 2**20:.1f}/"
+                    f"{self.stats.get('totalBytes', 0) / 2**20:.1f} MiB, "
+                    f"{self.stats.get('speed', 0) / 2**20:.1f} MiB/s, "
+                    f"ETA {self.stats.get('eta')}s"
+                )
+                sleep(RCD_POLL_INTERVAL)
+            daemon.call("core/stats-delete", group=group)
+        except (RCloneException, requests.RequestException):
+            LOG.exception("rclone rcd failed")
+            return 1
+
+        if not status["success"]:
+            LOG.error(f"rclone job {job['jobid']} failed: {status['error']}")
+            return 1
+        if not self.stats.get("transfers"):
+            LOG.warning("rclone reported no transferred files (return code 9)!")
+            return 9
+        LOG.info(
+            f"uploaded to {destination} in {status.get('duration', 0):.1f}s "
+            f"({self.stats.get('speed', 0) / 2**20:.1f} MiB/s)"
+        )
+        return 0
+
+    def upload_artifacts(self):
+        """
+        copy all artifacts of the manifest in one go. Files which already
+        exist at the destination with the same checksum are skipped.
+        :return: dict of destination => COPIED, UNCHANGED or FAILED
+        """
+        if not self.artifacts:
+            return {}
+        LOG.info(f"copying {len(self.artifacts)} artifacts")
+        if self.config.get("backend", "process") == "rcd":
+            results = self._copy_artifacts_rcd()
+        else:
+            results = self._copy_artifacts_process()
+        for destination, result in results.items():
+            log = LOG.error if result == FAILED else LOG.info
+            log(f"{destination}: {result}")
+        return results
+
+    def artifact_properties(self, results):
+        """
+        :param results: return value of upload_artifacts()
+        :return: dict of ticket properties, Rclone.Artifact.<name> lists the
+            destinations of an entry of the manifest with their results
+        """
+        properties = {}
+        for name, _, destination in self.artifacts:
+            properties.setdefault(f"Rclone.Artifact.{name}", []).append(
+                f"{results[destination]} {destination}"
+            )
+        return {k: ", ".join(v) for k, v in properties.items()}
+
+    def _copy_artifacts_process(self):
+        # rclone copy keeps the file names, so all artifacts which go from the
+        # same directory to the same directory under their own name get
+        # copied in one run. Renamed artifacts need a copyto each.
+        groups = {}
+        renamed = []
+        for _, source, destination in self.artifacts:
+            dst_dir, dst_name = _split_remote(destination)
+            if dst_name == basename(source):
+                groups.setdefault((dirname(source), dst_dir), []).append(dst_name)
+            else:
+                renamed.append((source, destination))
+
+        results = {}
+        for (src_dir, dst_dir), names in groups.items():
+            objects = self._run_rclone(
+                ["copy", "--files-from-raw", "-", src_dir, dst_dir],
+                "\n".join(names) + "\n",
+                len(names),
+            )
+            sep = "" if dst_dir.endswith(":") else "/"
+            for name in names:
+                results[dst_dir + sep + name] = objects.get(name, objects[None])
+        for source, destination in renamed:
+            objects = self._run_rclone(["copyto", source, destination])
+            results[destination] = objects.get(
+                _split_remote(destination)[1], objects[None]
+            )
+        return results
+
+    def _run_rclone(self, args, stdin=None, count=1):
+        """
+        run rclone and collect the per-file results from its json log
+        :return: dict of object name => result, None holds the result of
+            all files rclone did not log anything about
+        """
+        proc = run(
+            [
+                self.rclone_path,
+                "--config",
+                self.rclone_config,
+                "--checksum",
+                "--transfers",
+                str(min(self.config.get("transfers", DEFAULT_TRANSFERS), count)),
+                "--use-json-log",
+                "--verbose",
+                *args,
+            ],
+            input=stdin,
+            capture_output=True,
+            check=False,
+            text=True,
+        )
+        objects = {None: UNCHANGED if proc.returncode == 0 else FAILED}
+        for line in proc.stderr.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                LOG.debug(line)
+                continue
+            LOG.debug(f"{entry.get('object', '')}: {entry.get('msg')}")
+            if not entry.get("object"):
+                continue
+            if entry.get("level") == "error":
+                objects[entry["object"]] = FAILED
+            elif entry.get("msg", "").startswith("Copied"):
+                objects[entry["object"]] = COPIED
+        if proc.returncode != 0:
+            LOG.error(f"rclone exited {proc.returncode}!")
+        return objects
+
+    def _copy_artifacts_rcd(self):
+        # submit all jobs at once, the daemon runs them in parallel
+        daemon = RCloneDaemon.get(self.config)
+        jobs = {}
+        results = {}
+        for _, source, destination in self.artifacts:
+            dst_fs, dst_remote = _split_remote(destination)
+            group = f"voctopublish/{self.ticket.id}/artifact/{destination}"
+            try:
+                job = daemon.call(
+                    "operations/copyfile",
+                    srcFs=dirname(source),
+                    srcRemote=basename(source),
+                    dstFs=dst_fs,
+                    dstRemote=dst_remote,
+                    _async=True,
+                    _group=group,
+                    _config={"CheckSum": True},
+                )
+                jobs[destination] = (job["jobid"], group)
+            except (RCloneException, requests.RequestException):
+                LOG.exception(f"submitting rclone job for {destination} failed")
+                results[destination] = FAILED
+
+        while jobs:
+            for destination, (jobid, group) in list(jobs.items()):
+                try:
+                    status = daemon.call("job/status", jobid=jobid)
+                    if not status["finished"]:
+                        continue
+                    stats = daemon.call("core/stats", group=group)
+                    daemon.call("core/stats-delete", group=group)
+                except (RCloneException, requests.RequestException):
+                    LOG.exception(f"rclone job {jobid} for {destination} failed")
+                    results[destination] = FAILED
+                else:
+                    if not status["success"]:
+                        LOG.error(f"rclone job {jobid} failed: {status['error']}")
+                        results[destination] = FAILED
+                    elif stats.get("transfers"):
+                        results[destination] = COPIED
+                    else:
+                        results[destination] = UNCHANGED
+                del jobs[destination]
+            if jobs:
+                LOG.info(f"waiting for {len(jobs)} rclone jobs")
+                sleep(RCD_POLL_INTERVAL)
+        return results
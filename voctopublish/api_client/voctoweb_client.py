@@ -30,6 +30,8 @@ from tools.thumbnails import ThumbnailGenerator
 
 LOG = logging.getLogger("Voctoweb")
 
+STREAM_CHUNK_SIZE = 1024 * 1024
+
 
 class VoctowebClient:
     def __init__(
@@ -42,6 +44,7 @@ class VoctowebClient:
         ssh_port,
         ssh_user,
         frontend_url=None,
+        session=None,
     ):
         """
         :param t:
@@ -51,6 +54,8 @@ class VoctowebClient:
         :param ssh_host: SSH Port of the CDN host
         :param ssh_port: SSH Port of the CDN host
         :param ssh_user: SSH user of the CDN host
+        :param session: requests.Session to share connections with other
+            clients, e.g. when creating many events at once
         """
         self.t = t
         self.thumbnail = thumb
@@ -62,8 +67,43 @@ class VoctowebClient:
         self.ssh_port = ssh_port
         self.ssh_user = ssh_user
         self.frontend_url = frontend_url
+        self.http = session or requests
 
     def _connect_ssh(self):
+        """
+        Open an SSH connection to the voctoweb storage host and create the
+        directories of the ticket
+        """
+        self._open_ssh()
+
+        for dir_type, path in {
+            "thumbnail": self.t.voctoweb_thumb_path,
+            "video": self.t.voctoweb_path,
+        }.items():
+            try:
+                self.sftp.stat(path)
+                LOG.debug(f"{dir_type} directory {path} already exists")
+            except IOError as e:
+                if e.errno == errno.ENOENT:
+                    try:
+                        self.sftp.mkdir(path)
+                    except IOError as e:
+                        raise VoctowebException(
+                            f"Could not create {dir_type} dir {path} - {e!r}"
+                        ) from e
+
+    def use_connection(self, other):
+        """
+        Reuse the SSH connection of another client, e.g. when uploading files
+        of many tickets. The directories of the ticket are not created then.
+        :param other: VoctowebClient
+        """
+        if other.sftp is None:
+            other._open_ssh()
+        self.ssh = other.ssh
+        self.sftp = other.sftp
+
+    def _open_ssh(self):
         """
         Open an SSH connection to the voctoweb storage host
         """
@@ -92,22 +132,6 @@ class VoctowebClient:
         self.sftp = self.ssh.open_sftp()
         LOG.info("SSH connection established to " + str(self.ssh_host))
 
-        for dir_type, path in {
-            "thumbnail": self.t.voctoweb_thumb_path,
-            "video": self.t.voctoweb_path,
-        }.items():
-            try:
-                self.sftp.stat(path)
-                LOG.debug(f"{dir_type} directory {path} already exists")
-            except IOError as e:
-                if e.errno == errno.ENOENT:
-                    try:
-                        self.sftp.mkdir(path)
-                    except IOError as e:
-                        raise VoctowebException(
-                            f"Could not create {dir_type} dir {path} - {e!r}"
-                        ) from e
-
     def generate_thumbs(self):
         """
         This function generates thumbnails to be used on voctoweb
@@ -120,12 +144,23 @@ class VoctowebClient:
             self.t.publishing_path, self.t.fahrplan_id + "_voctoweb_preview.jpg"
         )
 
+        self.scale_thumbs(self.thumbnail.path, outjpg, outjpg_preview)
+        LOG.info("thumbnails reformatted for voctoweb")
+
+    @staticmethod
+    def scale_thumbs(source, outjpg, outjpg_preview):
+        """
+        Convert an image to the thumbnail and poster formats of voctoweb
+        :param source: image, usually from ThumbnailGenerator
+        :param outjpg: path of the thumbnail
+        :param outjpg_preview: path of the poster image
+        """
         # lanczos scaling algorithm produces a sharper image for small sizes than the default choice
         # set pix_fmt to create a more compatible output, otherwise the input format would be kept
         try:
-            r = ffmpeg(
+            ffmpeg(
                 "-i",
-                self.thumbnail.path,
+                source,
                 "-filter_complex:v",
                 "scale=400:-1:lanczos",
                 "-f",
@@ -142,9 +177,9 @@ class VoctowebClient:
             raise VoctowebException("Could not scale outjpg: " + str(e_)) from e_
 
         try:
-            r = ffmpeg(
+            ffmpeg(
                 "-i",
-                self.thumbnail.path,
+                source,
                 "-f",
                 "image2",
                 "-vcodec",
@@ -157,11 +192,9 @@ class VoctowebClient:
             )
         except CalledProcessError as e_:
             raise VoctowebException(
-                "Could not scale outjpg_preview: " + r.decode("utf-8")
+                "Could not scale outjpg_preview: " + str(e_)
             ) from e_
 
-        LOG.info("thumbnails reformatted for voctoweb")
-
     def upload_thumbs(self):
         """
         Upload thumbnails to the voctoweb storage.
@@ -277,6 +310,84 @@ class VoctowebClient:
         """
         LOG.info("uploading " + os.path.join(self.t.publishing_path, local_filename))
 
+        upload_target = self._prepare_upload_target(remote_filename, remote_folder)
+
+        # Upload the file
+        try:
+            self.sftp.put(
+                os.path.join(self.t.publishing_path, local_filename), upload_target
+            )
+        except paramiko.SSHException as e:
+            raise VoctowebException(
+                "Could not upload recording because of SSH problem " + str(e)
+            ) from e
+        except IOError as e:
+            raise VoctowebException(
+                "Could not create file in upload directory " + str(e)
+            ) from e
+
+        LOG.info("uploading " + remote_filename + " done")
+
+    def upload_stream(self, stream, remote_filename, remote_folder, check=None):
+        """
+        Write a stream of unknown length, e.g. the output of ffmpeg, to a file on the voctoweb storage.
+        The data goes to a temporary file first, which replaces the recording only when it is complete.
+        :param stream: file-like object to read from
+        :param remote_filename:
+        :param remote_folder:
+        :param check: called when the stream is exhausted, raises if the
+            stream is incomplete, e.g. FFmpegStream.check
+        :return: number of bytes written
+        """
+        LOG.info("streaming " + remote_filename)
+
+        upload_target = self._prepare_upload_target(
+            remote_filename, remote_folder, replace=False
+        )
+        partial = upload_target + ".part"
+
+        size = 0
+        try:
+            try:
+                with self.sftp.open(partial, "wb") as f:
+                    # don't wait for an acknowledgement of every single write
+                    f.set_pipelined(True)
+                    while True:
+                        chunk = stream.read(STREAM_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        size += len(chunk)
+                    if check is not None:
+                        check()
+                # replaces an existing recording in a single step
+                self.sftp.posix_rename(partial, upload_target)
+            except BaseException:
+                try:
+                    self.sftp.remove(partial)
+                except IOError:
+                    LOG.warning(f"could not remove {partial}")
+                raise
+        except paramiko.SSHException as e:
+            raise VoctowebException(
+                "Could not upload recording because of SSH problem " + str(e)
+            ) from e
+        except IOError as e:
+            raise VoctowebException(
+                "Could not create file in upload directory " + str(e)
+            ) from e
+
+        LOG.info(f"streaming {remote_filename} done, {size} bytes")
+        return size
+
+    def _prepare_upload_target(self, remote_filename, remote_folder, replace=True):
+        """
+        make sure the format folder exists and no file is in the way of the upload
+        :param remote_filename:
+        :param remote_folder:
+        :param replace: remove an existing file of the same name
+        :return: remote path to upload to
+        """
         # Check if ssh connection is open.
         if self.sftp is None:
             self._connect_ssh()
@@ -299,6 +410,8 @@ class VoctowebClient:
                     ) from e
 
         upload_target = os.path.join(format_folder, remote_filename)
+        if not replace:
+            return upload_target
 
         # Check if the file already exists and remove it
         try:
@@ -311,21 +424,7 @@ class VoctowebClient:
             except IOError as e:
                 raise VoctowebException("Could not replace recording " + str(e)) from e
 
-        # Upload the file
-        try:
-            self.sftp.put(
-                os.path.join(self.t.publishing_path, local_filename), upload_target
-            )
-        except paramiko.SSHException as e:
-            raise VoctowebException(
-                "Could not upload recording because of SSH problem " + str(e)
-            ) from e
-        except IOError as e:
-            raise VoctowebException(
-                "Could not create file in upload directory " + str(e)
-            ) from e
-
-        LOG.info("uploading " + remote_filename + " done")
+        return upload_target
 
     def get_event(self):
         """
@@ -336,7 +435,7 @@ class VoctowebClient:
         headers = {"CONTENT-TYPE": "application/json"}
 
         # call voctoweb api
-        r = requests.get(
+        r = self.http.get(
             f"{self.frontend_url}/public/events/{self.t.voctoweb_event_id}",
             headers=headers,
         )
@@ -365,7 +464,7 @@ class VoctowebClient:
         LOG.debug(f"api url: {url} slug: {self.t.slug} payload: {payload}")
 
         # call voctoweb api
-        requests.delete(url, headers=headers, json=payload)
+        self.http.delete(url, headers=headers, json=payload)
 
     def delete_file(self, remote_path):
         """
@@ -391,6 +490,39 @@ class VoctowebClient:
 
         LOG.info("deleting " + remote_path + " done")
 
+    def delete_files(self, remote_paths):
+        """
+        Deletes many files on the server with a single remote command. Falls
+        back to deleting them one by one via SFTP if the host does not allow
+        running commands.
+        :param remote_paths:
+        """
+        if not remote_paths:
+            return
+        LOG.info(f"deleting {len(remote_paths)} files")
+
+        if self.sftp is None:
+            self._open_ssh()
+
+        try:
+            stdin, stdout, stderr = self.ssh.exec_command("xargs -0 rm -f --")
+            stdin.write("\0".join(remote_paths))
+            stdin.channel.shutdown_write()
+            status = stdout.channel.recv_exit_status()
+        except paramiko.SSHException as e:
+            LOG.warning(f"could not run rm on {self.ssh_host}: {e}")
+            status = None
+        if status == 0:
+            LOG.info(f"deleting {len(remote_paths)} files done")
+            return
+        if status is not None:
+            LOG.warning(
+                f"rm on {self.ssh_host} exited {status}: {stderr.read().decode()}"
+            )
+
+        for remote_path in remote_paths:
+            self.delete_file(remote_path)
+
     def create_or_update_event(self):
         """
         Create a new event on the voctoweb API host
@@ -476,12 +608,12 @@ class VoctowebClient:
         # call voctoweb api
         try:
             if self.t.voctoweb_event_id:
-                r = requests.patch(
+                r = self.http.patch(
                     url + "/" + self.t.guid, headers=headers, json=payload
                 )
                 if r.status_code == 422:
                     # event does not exist, create new one
-                    r = requests.post(
+                    r = self.http.post(
                         url,
                         headers=headers,
                         json={
@@ -491,7 +623,7 @@ class VoctowebClient:
                     )
 
             else:
-                r = requests.post(
+                r = self.http.post(
                     url,
                     headers=headers,
                     json={
@@ -502,7 +634,7 @@ class VoctowebClient:
                 LOG.debug("got response with code %d: %r" % (r.status_code, r.text))
                 # event already exists so update metadata
                 if r.status_code == 422:
-                    r = requests.patch(
+                    r = self.http.patch(
                         url + "/" + self.t.guid, headers=headers, json=payload
                     )
 
@@ -521,6 +653,7 @@ class VoctowebClient:
         hq,
         html5,
         single_language=False,
+        file_details=None,
     ):
         """
         create_recording a file on the voctoweb API host
@@ -530,6 +663,8 @@ class VoctowebClient:
         :param language:
         :param hq:
         :param html5:
+        :param single_language:
+        :param file_details: list of size, length, width and height, if there is no local file to examine
         :return:
         """
         LOG.info(("publishing " + filename + " to " + self.api_url))
@@ -552,8 +687,8 @@ class VoctowebClient:
             }
         else:
             # make sure we have the file size and length
-            ret = []
-            if not self._get_file_details(local_filename, ret):
+            ret = file_details or []
+            if not ret and not self._get_file_details(local_filename, ret):
                 raise VoctowebException("could not get file details")
 
             recording = {
@@ -588,9 +723,9 @@ class VoctowebClient:
 
         try:
             if recording_id:
-                r = requests.patch(url, headers=headers, data=json.dumps(payload))
+                r = self.http.patch(url, headers=headers, data=json.dumps(payload))
             else:
-                r = requests.post(url, headers=headers, data=json.dumps(payload))
+                r = self.http.post(url, headers=headers, data=json.dumps(payload))
 
         except requests.exceptions.SSLError as e:
             raise VoctowebException("ssl cert error " + str(e)) from e
@@ -0,0 +1,166 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LOG = logging.getLogger("VoctowebPublic")
+
+DEFAULT_API_URL = "https://api.media.ccc.de/public"
+DEFAULT_JOBS = 8
+TIMEOUT = 30
+
+# mime types of recordings, higher is better
+VIDEO_RANK = {
+    "video/mp4": 3,
+    "video/webm": 2,
+    "video/ogg": 1,
+}
+
+
+def recording_score(recording):
+    """
+    rank a recording by its high quality flag, mime type and resolution,
+    in that order
+    :return: integer, higher is better
+    """
+    score = 0
+    if recording.get("high_quality"):
+        score += 1_000_000
+    score += 100_000 * VIDEO_RANK.get(recording.get("mime_type"), 0)
+    # works till videos are > 5k
+    score += (recording.get("width") or 0) + (recording.get("height") or 0)
+    return score
+
+
+def main_recording(event):
+    """
+    :param event: event details from the public API
+    :return: the video recording of the event with the best quality or None
+    """
+    videos = [
+        r
+        for r in event.get("recordings", [])
+        if (r.get("mime_type") or "").startswith("video")
+    ]
+    return max(videos, key=recording_score, default=None)
+
+
+class VoctowebPublicClient:
+    """
+    read-only client for the public voctoweb API, which needs no API key.
+    Requests for many conferences, events or images run concurrently and
+    share one HTTP session.
+    """
+
+    def __init__(self, api_url=DEFAULT_API_URL, jobs=DEFAULT_JOBS, session=None):
+        """
+        :param api_url: base url of the public API
+        :param jobs: maximum number of concurrent requests
+        :param session: requests.Session, a new one is used by default
+        """
+        self.api_url = api_url.rstrip("/")
+        self.jobs = jobs
+        if session is None:
+            session = requests.Session()
+            # keep a connection for every concurrent request, details of
+            # conferences and of their events are fetched at the same time
+            adapter = HTTPAdapter(pool_maxsize=2 * jobs)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.http = session
+
+    def _get(self, url, params=None):
+        r = self.http.get(url, params=params, timeout=TIMEOUT)
+        r.raise_for_status()
+        return r
+
+    def get_list(self, path, key):
+        """
+        fetch all items of a list, following its pagination. If the first
+        page links to the last one, the other pages are fetched concurrently.
+        :param path: e.g. "conferences"
+        :param key: name of the list in the response
+        :return: list of items
+        """
+        first = self._get(f"{self.api_url}/{path}")
+        items = list(first.json()[key])
+
+        last = first.links.get("last")
+        if last:
+            url = urlparse(last["url"])
+            query = parse_qs(url.query)
+            pages = range(2, int(query.pop("page")[0]) + 1)
+            base = url._replace(query=urlencode(query, doseq=True)).geturl()
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                # map() keeps the order of the pages
+                for page in executor.map(
+                    lambda p: self._get(base, {"page": p}).json()[key], pages
+                ):
+                    items.extend(page)
+            return items
+
+        # no idea how many pages there are, follow them one by one
+        next_page = first.links.get("next")
+        while next_page:
+            r = self._get(next_page["url"])
+            items.extend(r.json()[key])
+            next_page = r.links.get("next")
+        return items
+
+    def fetch(self, items):
+        """
+        fetch the details of many conferences or events concurrently
+        :param items: dicts with an "url" key, as listed by the API
+        :return: generator of (item, details) in the order the responses
+            arrive, details is None if the request failed
+        """
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            futures = {
+                executor.submit(lambda url: self._get(url).json(), item["url"]): item
+                for item in items
+            }
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    details = future.result()
+                except Exception:
+                    LOG.exception(f"could not get {item['url']}")
+                    details = None
+                yield item, details
+        finally:
+            # don't keep on fetching if the caller stopped early
+            executor.shutdown(cancel_futures=True)
+
+    def conferences(self, acronyms=None):
+        """
+        :param acronyms: only these conferences, all if empty
+        :return: generator of (conference, details), see fetch()
+        """
+        conferences = self.get_list("conferences", "conferences")
+        if acronyms:
+            conferences = [c for c in conferences if c["acronym"] in acronyms]
+        LOG.info(f"fetching {len(conferences)} conferences")
+        return self.fetch(conferences)
+
+    def exists(self, urls):
+        """
+        check concurrently which files exist, e.g. on the static host
+        :param urls:
+        :return: dict of url => HTTP status code, None if the request failed
+        """
+
+        def head(url):
+            try:
+                return self.http.head(
+                    url, timeout=TIMEOUT, allow_redirects=True
+                ).status_code
+            except requests.RequestException as e:
+                LOG.warning(f"HEAD {url} failed: {e!r}")
+                return None
+
+        urls = list(urls)
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return dict(zip(urls, executor.map(head, urls)))
@@ -23,6 +23,11 @@ from tools.announcements import EmptyAnnouncementMessage, make_message
 
 LOG = logging.getLogger("Webhook")
 
+# seconds to connect and to wait for the response. Well below the lease of
+# queued webhooks (announcement_queue.LEASE_TIME), another sender would
+# deliver the webhook a second time otherwise.
+TIMEOUT = (10, 60)
+
 """
     Webhook gets POSTed to the specified url, format is JSON:
 
@@ -63,6 +68,9 @@ LOG = logging.getLogger("Webhook")
     }
 
     If "enabled" is false, all other fields are missing.
+
+    Receivers listed in webhook.batch_urls get a JSON array of these objects
+    instead, containing all releases within webhook.batch_window seconds.
 """
 
 
@@ -72,27 +80,13 @@ def send(ticket, config, voctoweb_filename, voctoweb_language, rclone):
     r = None
     result = None
     try:
-        content = _get_json(
+        request = make_request(
             ticket, config, voctoweb_filename, voctoweb_language, rclone
         )
-        LOG.debug(f"{content=}")
-
-        kwargs = {
-            "json": content,
-        }
-
-        if ticket.webhook_user and ticket.webhook_pass:
-            # have username and password, assume basic auth
-            kwargs["auth"] = (ticket.webhook_user, ticket.webhook_pass)
-        elif ticket.webhook_pass:
-            # have only password, assume Authorization header
-            kwargs["headers"] = {
-                "Authorization": ticket.webhook_pass,
-            }
-        r = post(ticket.webhook_url, **kwargs)
+        r = _post(request)
         result = r.status_code
     except RequestException:
-        LOG.exception("could not post to webhook at {ticket.webhook_url}")
+        LOG.exception(f"could not post to webhook at {ticket.webhook_url}")
 
     if r:
         LOG.debug(f"{r.status_code=} {r.text=}")
@@ -100,6 +94,63 @@ def send(ticket, config, voctoweb_filename, voctoweb_language, rclone):
     return result
 
 
+def make_request(ticket, config, voctoweb_filename, voctoweb_language, rclone):
+    """
+    :return: dict with url, json content and credentials of the webhook,
+        can be queued and delivered later using deliver()
+    """
+    content = _get_json(ticket, config, voctoweb_filename, voctoweb_language, rclone)
+    LOG.debug(f"{content=}")
+
+    request = {
+        "url": ticket.webhook_url,
+        "json": content,
+    }
+    if ticket.webhook_user and ticket.webhook_pass:
+        # have username and password, assume basic auth
+        request["auth"] = [ticket.webhook_user, ticket.webhook_pass]
+    elif ticket.webhook_pass:
+        # have only password, assume Authorization header
+        request["headers"] = {
+            "Authorization": ticket.webhook_pass,
+        }
+    return request
+
+
+def deliver(request, config):
+    """
+    post a request created by make_request(). Raises if the receiver
+    does not accept it.
+    """
+    LOG.info(f"post webhook to {request['url']}")
+    r = _post(request)
+    LOG.debug(f"{r.status_code=} {r.text=}")
+    r.raise_for_status()
+    return r.status_code
+
+
+def combine(service, requests):
+    """
+    combine requests to the same url into one request with a list of
+    contents, for receivers which accept batches
+    """
+    return [
+        (
+            range(len(requests)),
+            dict(requests[0], json=[request["json"] for request in requests]),
+        )
+    ]
+
+
+def _post(request):
+    kwargs = {"json": request["json"], "timeout": TIMEOUT}
+    if request.get("auth"):
+        kwargs["auth"] = tuple(request["auth"])
+    if request.get("headers"):
+        kwargs["headers"] = request["headers"]
+    return post(request["url"], **kwargs)
+
+
 def _get_json(ticket, config, voctoweb_filename, language, rclone):
     try:
         message = make_message(ticket, config)
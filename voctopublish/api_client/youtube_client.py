@@ -21,16 +21,100 @@ import logging
 import mimetypes
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from html.parser import HTMLParser
+from subprocess import CalledProcessError
+from threading import BoundedSemaphore, Lock
+from time import time
+from zoneinfo import ZoneInfo
 
 import langcodes
 import requests
 from model.ticket_module import Ticket
-from tools.ffmpeg import ffmpeg
+from tools.ffmpeg import ffmpeg, ffmpeg_stream, stream_format
+from tools.json_store import JsonStore
 from tools.thumbnails import ThumbnailGenerator
 
 LOG = logging.getLogger("YoutubeAPI")
 
+DEFAULT_TOKEN_CACHE = "~/.cache/voctopublish/youtube_tokens.json"
+# refresh access tokens if they expire in less than this many seconds
+TOKEN_REFRESH_MARGIN = 300
+
+DEFAULT_QUOTA_LEDGER = "~/.cache/voctopublish/youtube_quota.json"
+DEFAULT_DAILY_QUOTA = 10000
+# https://developers.google.com/youtube/v3/determine_quota_cost
+QUOTA_COSTS = {
+    "channels.list": 1,
+    "playlistItems.delete": 50,
+    "playlistItems.insert": 50,
+    "playlistItems.list": 1,
+    "thumbnails.set": 50,
+    "videos.insert": 1600,
+    "videos.list": 1,
+    "videos.update": 50,
+}
+
+# channel id -> semaphore limiting concurrent uploads to that channel
+_CHANNEL_SEMAPHORES = {}
+_CHANNEL_SEMAPHORES_LOCK = Lock()
+
+# (playlist id, video id) -> (time fetched, [playlist item ids])
+_PLAYLIST_CACHE = {}
+_PLAYLIST_CACHE_LOCK = Lock()
+# seconds, memberships cached longer than this get fetched again. Other
+# workers or people may change the playlists in the meantime.
+PLAYLIST_CACHE_TTL = 600
+
+
+def _forget_playlist(playlist_id):
+    """
+    drop the memberships of a playlist from the cache, e.g. if changing it
+    failed and we don't know its content anymore
+    """
+    with _PLAYLIST_CACHE_LOCK:
+        for key in [k for k in _PLAYLIST_CACHE if k[0] == playlist_id]:
+            del _PLAYLIST_CACHE[key]
+
+
+def _raise_if_quota_exceeded(r):
+    """
+    raise YouTubeQuotaExceeded if the API rejected a request because the
+    quota of the google project is used up, e.g. by someone else using the
+    same client id, so the ticket gets deferred instead of failed
+    :param r: response of the YouTube API
+    """
+    if r.status_code != 403:
+        return
+    try:
+        errors = r.json()["error"]["errors"]
+    except (ValueError, KeyError, TypeError):
+        return
+    if any(e.get("reason") == "quotaExceeded" for e in errors):
+        raise YouTubeQuotaExceeded(f"YouTube quota exhausted: {r.text}")
+
+
+def quota_day():
+    """
+    :return: day the YouTube quota is counted for, it is reset at midnight
+        pacific time
+    """
+    return datetime.now(ZoneInfo("America/Los_Angeles")).strftime("%Y-%m-%d")
+
+
+def rfc3339(date):
+    """
+    :param date: ISO 8601 date with time zone, like 2023-01-01T23:42:42+0100
+    :return: the date in UTC as RFC 3339, the form youtube returns, or the
+        unchanged string if it can't be parsed
+    """
+    try:
+        parsed = datetime.strptime(re.sub(r"\.\d+", "", date), "%Y-%m-%dT%H:%M:%S%z")
+    except ValueError:
+        return date
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
 
 class YoutubeAPI:
     """
@@ -94,13 +178,47 @@ class YoutubeAPI:
         self.channelId = None
         self.accessToken = None
 
+        # parallel uploads of language tracks share one thumbnail file
+        self._thumbnail_lock = Lock()
+        self._thumbnail_generated = False
+
     def setup(self, token):
         """
-        fetch access token and channel if form youtube
+        fetch access token and channel if form youtube. Both get cached per
+        refresh token, access tokens are refreshed shortly before they expire.
         :param token: youtube token to be used
         """
-        self.accessToken = self.get_fresh_token(token, self.client_id, self.secret)
-        self.channelId = self.get_channel_id(self.accessToken)
+        cache = JsonStore(
+            self.config["youtube"].get("token_cache", DEFAULT_TOKEN_CACHE)
+        )
+        key = JsonStore.key(token)
+        with cache.entries() as entries:
+            entry = dict(entries.get(key, {}))
+
+        # the store stays unlocked during the requests to google, other
+        # threads and the quota ledger must not wait for them
+        fetched = {}
+        if entry.get("expires_at", 0) - TOKEN_REFRESH_MARGIN < time():
+            data = self.fetch_token_data(token, self.client_id, self.secret)
+            fetched["access_token"] = data["access_token"]
+            fetched["expires_at"] = time() + int(data.get("expires_in", 3600))
+        else:
+            LOG.debug("using cached Access-Token")
+        entry.update(fetched)
+
+        if not entry.get("channel_id"):
+            self._use_quota("channels.list")
+            fetched["channel_id"] = self.get_channel_id(entry["access_token"])
+        else:
+            LOG.debug(f"using cached Channel-ID {entry['channel_id']}")
+        entry.update(fetched)
+
+        if fetched:
+            with cache.entries() as entries:
+                entries[key] = {**entries.get(key, {}), **fetched}
+
+        self.accessToken = entry["access_token"]
+        self.channelId = entry["channel_id"]
 
     def publish(self):
         """
@@ -115,60 +233,18 @@ class YoutubeAPI:
         if len(self.t.languages) > 1:
             LOG.debug("Languages: " + str(self.t.languages))
 
-            i = 0
-            for lang in self.t.languages:
-                video_url = self.t._get_str(f"YouTube.Url{i}", optional=True)
-                if video_url and self.t.youtube_update != "force":
-                    LOG.info(
-                        "Video track {} is already on youtube, returning previous URL {}".format(
-                            i, video_url
-                        )
-                    )
-                else:
-                    out_filename = (
-                        self.t.fahrplan_id
-                        + "-"
-                        + self.t.profile_slug
-                        + "-audio"
-                        + str(lang)
-                        + "."
-                        + self.t.profile_extension
-                    )
-                    out_path = os.path.join(self.t.publishing_path, out_filename)
-
-                    LOG.info("remuxing " + self.t.local_filename + " to " + out_path)
-
-                    try:
-                        ffmpeg(
-                            "-i",
-                            os.path.join(self.t.publishing_path, self.t.local_filename),
-                            "-map",
-                            "0:0",
-                            "-map",
-                            "0:a:" + str(lang),
-                            "-c",
-                            "copy",
-                            out_path,
-                        )
-                    except Exception as e_:
-                        raise YouTubeException(
-                            "error remuxing "
-                            + self.t.local_filename
-                            + " to "
-                            + out_path
-                        ) from e_
-
-                    if int(lang) == 0:
-                        lang = None
-                    else:
-                        lang = self.t.languages[lang]
-
-                    video_id = self.upload(out_path, lang)
-                    video_url = "https://www.youtube.com/watch?v=" + video_id
-                    LOG.info("published %s video track to %s" % (lang, video_url))
-
-                self.youtube_urls.append(video_url)
-                i += 1
+            parallel = int(self.config["youtube"].get("parallel_uploads", 1))
+            LOG.debug(f"uploading language tracks with {parallel} parallel uploads")
+
+            # results are collected by index, so the order of self.youtube_urls
+            # always matches the language order, regardless of which upload
+            # finishes first
+            with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+                futures = [
+                    executor.submit(self._publish_language_track, i, lang)
+                    for i, lang in enumerate(self.t.languages)
+                ]
+                self.youtube_urls.extend(f.result() for f in futures)
         else:
             video_id = self.upload(
                 os.path.join(self.t.publishing_path, self.t.local_filename), None
@@ -180,6 +256,102 @@ class YoutubeAPI:
 
         return self.youtube_urls
 
+    def _publish_language_track(self, i, lang):
+        """
+        remux a single audio track out of a multi-language file and upload it
+        :param i: position of the track, used for the YouTube.Url<i> property
+        :param lang: key of the language in self.t.languages
+        :return: youtube url of the track
+        """
+        video_url = self.t._get_str(f"YouTube.Url{i}", optional=True)
+        if video_url and self.t.youtube_update != "force":
+            LOG.info(
+                "Video track {} is already on youtube, returning previous URL {}".format(
+                    i, video_url
+                )
+            )
+            return video_url
+
+        source = os.path.join(self.t.publishing_path, self.t.local_filename)
+        language = None if int(lang) == 0 else self.t.languages[lang]
+
+        if self.config["youtube"].get("streaming_upload", False):
+            # remux into fragmented mp4, which does not need a seekable
+            # output, and pass it to youtube while ffmpeg is still running
+            LOG.info(f"streaming audio track {lang} of {source} to youtube")
+            extension = self.t.profile_extension
+            mimetype = mimetypes.guess_type("video." + extension)[0]
+            with self._channel_semaphore():
+                try:
+                    with ffmpeg_stream(
+                        "-i",
+                        source,
+                        "-map",
+                        "0:0",
+                        "-map",
+                        "0:a:" + str(lang),
+                        "-c",
+                        "copy",
+                        *stream_format(extension),
+                    ) as stream:
+                        video_id = self.upload_stream(
+                            stream,
+                            mimetype or "application/octet-stream",
+                            language,
+                            stream.check,
+                        )
+                except CalledProcessError as e_:
+                    raise YouTubeException("error remuxing " + source) from e_
+        else:
+            out_filename = (
+                self.t.fahrplan_id
+                + "-"
+                + self.t.profile_slug
+                + "-audio"
+                + str(lang)
+                + "."
+                + self.t.profile_extension
+            )
+            out_path = os.path.join(self.t.publishing_path, out_filename)
+
+            LOG.info("remuxing " + self.t.local_filename + " to " + out_path)
+
+            try:
+                ffmpeg(
+                    "-i",
+                    source,
+                    "-map",
+                    "0:0",
+                    "-map",
+                    "0:a:" + str(lang),
+                    "-c",
+                    "copy",
+                    out_path,
+                )
+            except Exception as e_:
+                raise YouTubeException(
+                    "error remuxing " + self.t.local_filename + " to " + out_path
+                ) from e_
+
+            with self._channel_semaphore():
+                video_id = self.upload(out_path, language)
+
+        video_url = "https://www.youtube.com/watch?v=" + video_id
+        LOG.info("published %s video track to %s" % (language, video_url))
+        return video_url
+
+    def _channel_semaphore(self):
+        """
+        get the semaphore limiting concurrent uploads to the channel we are
+        publishing to. Semaphores are shared between all YoutubeAPI instances
+        of this process to stay inside YouTube's rate limits.
+        """
+        limit = int(self.config["youtube"].get("max_uploads_per_channel", 2))
+        with _CHANNEL_SEMAPHORES_LOCK:
+            if self.channelId not in _CHANNEL_SEMAPHORES:
+                _CHANNEL_SEMAPHORES[self.channelId] = BoundedSemaphore(max(limit, 1))
+            return _CHANNEL_SEMAPHORES[self.channelId]
+
     def upload(self, file, lang):
         """
         Call the youtube API and push the file to youtube
@@ -187,10 +359,228 @@ class YoutubeAPI:
         :param lang: language of the file
         :return:
         """
-        # todo split up event creation and upload
         # todo change function name
         # todo add the license properly
 
+        metadata = self._build_metadata(lang)
+
+        (mimetype, encoding) = mimetypes.guess_type(file)
+        size = os.stat(file).st_size
+
+        LOG.debug(
+            "guessed mime type for file %s as %s and its size as %u bytes"
+            % (file, mimetype, size)
+        )
+
+        location = self._create_upload_session(metadata, mimetype, size)
+
+        with open(file, "rb") as fp:
+            upload = requests.put(
+                location,
+                headers={
+                    "Authorization": "Bearer " + self.accessToken,
+                    "Content-Type": mimetype,
+                },
+                data=fp,
+            )
+
+            _raise_if_quota_exceeded(upload)
+            if 200 != upload.status_code and 201 != upload.status_code:
+                raise YouTubeException(
+                    "uploading video failed with error-code %u: %s"
+                    % (upload.status_code, upload.text)
+                )
+
+        return self._finish_upload(upload.json())
+
+    def upload_stream(self, stream, mimetype, lang, check=None):
+        """
+        Create a video on youtube and upload its content from a stream of
+        unknown length, using chunks of the resumable upload protocol.
+        https://developers.google.com/youtube/v3/guides/using_resumable_upload_protocol
+        :param stream: file-like object to read the video from
+        :param mimetype: mime type of the video
+        :param lang: language of the video
+        :param check: called when the stream is exhausted, before the video
+            gets finalized. Raises if the stream is incomplete, the upload is
+            cancelled then, e.g. FFmpegStream.check
+        :return: video id
+        """
+        metadata = self._build_metadata(lang)
+        location = self._create_upload_session(metadata, mimetype)
+
+        try:
+            video = self._upload_chunks(location, stream, mimetype, check)
+        except BaseException:
+            self._cancel_upload(location)
+            raise
+        return self._finish_upload(video)
+
+    def _upload_chunks(self, location, stream, mimetype, check):
+        """
+        :return: video resource returned by the last chunk
+        """
+        # chunks must be a multiple of 256 KiB, except for the last one
+        chunk_size = int(self.config["youtube"].get("stream_chunk_size", 32)) << 20
+
+        offset = 0
+        buffer = b""
+        eof = False
+        while True:
+            # read ahead, so we know whether the next chunk is the last one
+            while not eof and len(buffer) <= chunk_size:
+                data = stream.read(chunk_size)
+                if not data:
+                    eof = True
+                buffer += data
+
+            if eof:
+                if not buffer and not offset:
+                    raise YouTubeException("no data to upload, stream was empty")
+                # sending the total size finalizes the video, make sure the
+                # stream is complete before
+                if check is not None:
+                    check()
+                chunk = buffer
+                total = str(offset + len(buffer))
+            else:
+                chunk = buffer[:chunk_size]
+                total = "*"
+            end = offset + len(chunk) - 1
+
+            LOG.debug(f"uploading bytes {offset}-{end}/{total}")
+            r = requests.put(
+                location,
+                headers={
+                    "Authorization": "Bearer " + self.accessToken,
+                    "Content-Length": str(len(chunk)),
+                    "Content-Range": f"bytes {offset}-{end}/{total}",
+                    "Content-Type": mimetype,
+                },
+                data=chunk,
+            )
+
+            if r.status_code in (200, 201):
+                return r.json()
+            _raise_if_quota_exceeded(r)
+            if r.status_code != 308:
+                raise YouTubeException(
+                    "uploading video failed with error-code %u: %s"
+                    % (r.status_code, r.text)
+                )
+
+            # youtube tells us how much it has received, everything after
+            # that has to be sent again
+            received = 0
+            if "range" in r.headers:
+                received = int(r.headers["range"].rsplit("-", 1)[1]) + 1
+            if received < offset:
+                raise YouTubeException(
+                    f"youtube lost already uploaded data, has {received} of {offset} bytes"
+                )
+            buffer = buffer[received - offset :]
+            offset = received
+
+            if eof and not buffer:
+                raise YouTubeException(
+                    "youtube did not finish the upload after receiving all data"
+                )
+
+    def _cancel_upload(self, location):
+        """
+        discard an unfinished upload, so no partial video remains
+        """
+        try:
+            r = requests.delete(
+                location,
+                headers={"Authorization": "Bearer " + self.accessToken},
+                timeout=30,
+            )
+            LOG.info(f"cancelled upload, youtube answered {r.status_code}")
+        except Exception:
+            LOG.exception("could not cancel upload")
+
+    def _create_upload_session(self, metadata, mimetype, size=None):
+        """
+        create the video on youtube and start a resumable upload session
+        :param metadata: video resource
+        :param mimetype: mime type of the video
+        :param size: size of the video in bytes, if known
+        :return: url to upload the video content to
+        """
+        metadata_json = json.dumps(metadata)
+        LOG.debug(f"{metadata_json=}")
+        self._use_quota("videos.insert")
+        # https://developers.google.com/youtube/v3/docs/videos#resource
+        r = requests.post(
+            "https://www.googleapis.com/upload/youtube/v3/videos",
+            params={
+                "uploadType": "resumable",
+                "part": "snippet,status,recordingDetails",
+            },
+            headers={
+                "Authorization": "Bearer " + self.accessToken,
+                "Content-Type": "application/json; charset=UTF-8",
+                "X-Upload-Content-Type": mimetype,
+                **({"X-Upload-Content-Length": str(size)} if size else {}),
+            },
+            data=metadata_json,
+        )
+        LOG.info(
+            f"Request to create youtube video yielded status code {r.status_code}: {r.text}"
+        )
+        LOG.debug(f"{r.headers=}")
+
+        _raise_if_quota_exceeded(r)
+        if 200 != r.status_code:
+            error_from_youtube = r.json().get("error", {}).get("message", None)
+            exception_message = []
+
+            if error_from_youtube:
+                exception_message.append(error_from_youtube)
+            else:
+                exception_message.append(
+                    f"Video creation failed with http status code {r.status_code}"
+                )
+            exception_message.append(r.text)
+            exception_message.append(json.dumps(metadata, indent=2))
+
+            raise YouTubeException("\n\n".join(exception_message))
+
+        if "location" not in r.headers:
+            raise YouTubeException(
+                "Video creation did not return a location-header to upload to:\n%s"
+                % (r.headers,)
+            )
+
+        LOG.info(
+            "successfully created video and received upload-url from %s"
+            % (r.headers["server"] if "server" in r.headers else "-")
+        )
+        LOG.debug("uploading video-data to %s" % r.headers["location"])
+        return r.headers["location"]
+
+    def _finish_upload(self, video):
+        """
+        post-processing after the video content was uploaded
+        :param video: video resource returned by the upload
+        :return: video id
+        """
+        if self.t.youtube_update_thumbnail:
+            self.generate_and_upload_thumbnail(video["id"])
+
+        youtube_url = "https://www.youtube.com/watch?v=" + video["id"]
+        LOG.info("successfully uploaded video as %s", youtube_url)
+
+        return video["id"]
+
+    def _build_metadata(self, lang=None):
+        """
+        Build the video resource for a video
+        https://developers.google.com/youtube/v3/docs/videos#resource
+        :param lang: language of the video
+        :return: dict with snippet, status and recordingDetails parts
+        """
         title = self._build_title(lang)
         if self.t.subtitle:
             subtitle = self.t.subtitle
@@ -271,7 +661,7 @@ class YoutubeAPI:
                 "selfDeclaredMadeForKids": False,
             },
             "recordingDetails": {
-                "recordingDate": self.t.date,
+                "recordingDate": rfc3339(self.t.date),
             },
         }
 
@@ -288,114 +678,53 @@ class YoutubeAPI:
         if self.t.youtube_category:
             metadata["snippet"]["categoryId"] = int(self.t.youtube_category)
 
-        (mimetype, encoding) = mimetypes.guess_type(file)
-        size = os.stat(file).st_size
-
-        LOG.debug(
-            "guessed mime type for file %s as %s and its size as %u bytes"
-            % (file, mimetype, size)
-        )
-
-        metadata_json = json.dumps(metadata)
-        LOG.debug(f"{metadata_json=}")
-        # https://developers.google.com/youtube/v3/docs/videos#resource
-        r = requests.post(
-            "https://www.googleapis.com/upload/youtube/v3/videos",
-            params={
-                "uploadType": "resumable",
-                "part": "snippet,status,recordingDetails",
-            },
-            headers={
-                "Authorization": "Bearer " + self.accessToken,
-                "Content-Type": "application/json; charset=UTF-8",
-                "X-Upload-Content-Type": mimetype,
-                "X-Upload-Content-Length": str(size),
-            },
-            data=metadata_json,
-        )
-        LOG.info(
-            f"Request to create youtube video yielded status code {r.status_code}: {r.text}"
-        )
-        LOG.debug(f"{r.headers=}")
-
-        if 200 != r.status_code:
-            error_from_youtube = r.json().get("error", {}).get("message", None)
-            exception_message = []
-
-            if error_from_youtube:
-                exception_message.append(error_from_youtube)
-            else:
-                exception_message.append(
-                    f"Video creation failed with http status code {r.status_code}"
-                )
-            exception_message.append(r.text)
-            exception_message.append(json.dumps(metadata, indent=2))
-
-            raise YouTubeException("\n\n".join(exception_message))
-
-        if "location" not in r.headers:
-            raise YouTubeException(
-                "Video creation did not return a location-header to upload to:\n%s"
-                % (r.headers,)
-            )
-
-        LOG.info(
-            "successfully created video and received upload-url from %s"
-            % (r.headers["server"] if "server" in r.headers else "-")
-        )
-        LOG.debug("uploading video-data to %s" % r.headers["location"])
-
-        with open(file, "rb") as fp:
-            upload = requests.put(
-                r.headers["location"],
-                headers={
-                    "Authorization": "Bearer " + self.accessToken,
-                    "Content-Type": mimetype,
-                },
-                data=fp,
-            )
-
-            if 200 != upload.status_code and 201 != upload.status_code:
-                raise YouTubeException(
-                    "uploading video failed with error-code %u: %s"
-                    % (r.status_code, r.text)
-                )
-
-        video = upload.json()
-
-        if self.t.youtube_update_thumbnail:
-            self.generate_and_upload_thumbnail(video["id"])
-
-        youtube_url = "https://www.youtube.com/watch?v=" + video["id"]
-        LOG.info("successfully uploaded video as %s", youtube_url)
-
-        return video["id"]
+        return metadata
 
     def generate_and_upload_thumbnail(self, video_id):
-        outjpg = os.path.join(
-            self.t.publishing_path, self.t.fahrplan_id + "_youtube.jpg"
-        )
+        self.generate_thumbnail()
+        self.upload_thumbnail(video_id)
 
-        try:
-            ffmpeg(
-                "-i",
-                self.thumbnail.path,
-                "-f",
-                "image2",
-                "-vcodec",
-                "mjpeg",
-                "-pix_fmt",
-                "yuv420p",
-                "-q:v",
-                "0",
-                "-y",
-                outjpg,
-            )
-            LOG.info("thumbnails reformatted for youtube")
-        except Exception as e_:
-            raise YouTubeException("Could not scale thumbnail") from e_
+    @property
+    def thumbnail_path(self):
+        """
+        path of the thumbnail scaled for youtube
+        """
+        return os.path.join(self.t.publishing_path, self.t.fahrplan_id + "_youtube.jpg")
 
-        YoutubeAPI.update_thumbnail(self.accessToken, video_id, outjpg)
+    def generate_thumbnail(self):
+        """
+        scale the thumbnail for youtube, only once for all language tracks
+        """
+        outjpg = self.thumbnail_path
+
+        with self._thumbnail_lock:
+            if not self._thumbnail_generated:
+                try:
+                    ffmpeg(
+                        "-i",
+                        self.thumbnail.path,
+                        "-f",
+                        "image2",
+                        "-vcodec",
+                        "mjpeg",
+                        "-pix_fmt",
+                        "yuv420p",
+                        "-q:v",
+                        "0",
+                        "-y",
+                        outjpg,
+                    )
+                    LOG.info("thumbnails reformatted for youtube")
+                except Exception as e_:
+                    raise YouTubeException("Could not scale thumbnail") from e_
+                self._thumbnail_generated = True
+
+    def upload_thumbnail(self, video_id):
+        """
+        set the thumbnail created by generate_thumbnail() for a video
+        """
+        self._use_quota("thumbnails.set")
+        YoutubeAPI.update_thumbnail(self.accessToken, video_id, self.thumbnail_path)
 
     def _build_title(self, lang=None):
         """
@@ -518,6 +847,118 @@ class YoutubeAPI:
 
         return tags
 
+    def estimate_quota(self):
+        """
+        estimate the quota units publishing this ticket will use
+        :return: number of quota units
+        """
+        if len(self.t.languages) > 1:
+            videos = 0
+            for i in range(len(self.t.languages)):
+                if self.t.youtube_update == "force" or not self.t._get_str(
+                    f"YouTube.Url{i}", optional=True
+                ):
+                    videos += 1
+        else:
+            videos = 1
+
+        # membership of the video gets checked before adding it to a playlist
+        per_video = QUOTA_COSTS["videos.insert"] + (
+            QUOTA_COSTS["playlistItems.list"] + QUOTA_COSTS["playlistItems.insert"]
+        ) * len(self.t.youtube_playlists)
+        if self.t.youtube_update_thumbnail:
+            per_video += QUOTA_COSTS["thumbnails.set"]
+
+        return videos * per_video
+
+    def remaining_quota(self):
+        """
+        :return: quota units left today for the google project of our client
+            id, not counting units reserved by tickets being published
+        """
+        with self._quota_ledger().entries() as entries:
+            entry = self._quota_entry(entries)
+        return self._daily_quota() - entry["used"] - sum(entry["reserved"].values())
+
+    def check_quota(self):
+        """
+        reserve the quota needed to publish this ticket, so other workers
+        using the same client id can't spend it in the meantime. Raise
+        YouTubeQuotaExceeded if it is not available, so we can defer the
+        ticket before doing any work. Call release_quota() when done.
+        """
+        needed = self.estimate_quota()
+        key = self._reservation_key()
+        with self._quota_ledger().entries() as entries:
+            entry = self._quota_entry(entries)
+            # a retry of this ticket replaces its own reservation
+            others = {k: v for k, v in entry["reserved"].items() if k != key}
+            remaining = self._daily_quota() - entry["used"] - sum(others.values())
+            LOG.info(f"publishing needs {needed} quota units, {remaining} remaining")
+            if needed > remaining:
+                raise YouTubeQuotaExceeded(
+                    f"YouTube quota exhausted, need {needed} units but only "
+                    f"{remaining} are left for {quota_day()} (resets at "
+                    "midnight pacific time)"
+                )
+            entry["reserved"] = dict(others, **{key: needed})
+            entries[JsonStore.key(self.client_id)] = entry
+
+    def release_quota(self):
+        """
+        give back what is left of the quota reserved by check_quota()
+        """
+        key = self._reservation_key()
+        with self._quota_ledger().entries() as entries:
+            entry = self._quota_entry(entries)
+            unused = entry["reserved"].pop(key, 0)
+            entries[JsonStore.key(self.client_id)] = entry
+        if unused:
+            LOG.debug(f"released {unused} unused quota units")
+
+    def _use_quota(self, operation):
+        """
+        add the cost of an API call to the persistent quota ledger. It is
+        taken from the reservation of this ticket first.
+        :param operation: key of QUOTA_COSTS
+        """
+        units = QUOTA_COSTS[operation]
+        key = self._reservation_key()
+        with self._quota_ledger().entries() as entries:
+            entry = self._quota_entry(entries)
+            entry["used"] += units
+            if key in entry["reserved"]:
+                entry["reserved"][key] = max(0, entry["reserved"][key] - units)
+            entries[JsonStore.key(self.client_id)] = entry
+        LOG.debug(f"{operation} used {units} quota units, {entry['used']} used today")
+
+    def _quota_entry(self, entries):
+        """
+        :param entries: entries of the quota ledger
+        :return: today's ledger entry of our client id
+        """
+        entry = entries.get(JsonStore.key(self.client_id), {})
+        if entry.get("day") != quota_day():
+            # reservations of tickets that never released them expire, too
+            return {"day": quota_day(), "used": 0, "reserved": {}}
+        return {
+            "day": entry["day"],
+            "used": entry.get("used", 0),
+            "reserved": dict(entry.get("reserved", {})),
+        }
+
+    def _reservation_key(self):
+        # reservations are shared by all YoutubeAPI instances of a ticket
+        return str(self.t.id) if self.t else ""
+
+    def _daily_quota(self):
+        return int(self.config["youtube"].get("daily_quota", DEFAULT_DAILY_QUOTA))
+
+    def _quota_ledger(self):
+        return JsonStore(
+            self.config["youtube"].get("quota_ledger", DEFAULT_QUOTA_LEDGER)
+        )
+
     def depublish(self):
         """
         depublish videos on youtube
@@ -554,13 +995,120 @@ class YoutubeAPI:
                 LOG.error(f"debublishing of {video_url} failed with {e}")
         return depublished_urls, props
 
+    def sync_metadata(self):
+        """
+        update title, description, tags etc. of already published videos
+        without uploading them again. Only parts which differ from the live
+        video get sent to youtube.
+        :return: list of youtube urls which got updated
+        """
+        LOG.info(
+            "syncing metadata of Ticket %s (%s) to youtube"
+            % (self.t.fahrplan_id, self.t.title)
+        )
+
+        if len(self.t.languages) > 1:
+            tracks = []
+            for i, lang in enumerate(self.t.languages):
+                tracks.append(
+                    (
+                        self.t._get_str(f"YouTube.Url{i}", optional=True),
+                        None if int(lang) == 0 else self.t.languages[lang],
+                    )
+                )
+        else:
+            tracks = [(self.t._get_str("YouTube.Url0", optional=True), None)]
+
+        updated_urls = []
+        for video_url, lang in tracks:
+            if not video_url:
+                continue
+            video_id = video_url.split("=", 2)[1]
+            if self._sync_video_metadata(video_id, lang):
+                updated_urls.append(video_url)
+        return updated_urls
+
+    def _sync_video_metadata(self, video_id, lang):
+        """
+        compare the metadata we would upload with the live video and
+        update the parts which differ in a single call
+        :param video_id:
+        :param lang: language of the video
+        :return: True if the video was updated
+        """
+        live = self.get_video(video_id)
+        wanted = self._build_metadata(lang)
+
+        # the channel of a video can't be changed
+        del wanted["snippet"]["channelId"]
+        if "categoryId" in wanted["snippet"]:
+            # youtube returns the category as string
+            wanted["snippet"]["categoryId"] = str(wanted["snippet"]["categoryId"])
+        live_privacy = live["status"].get("privacyStatus")
+        if "publishAt" in wanted["status"] and live_privacy != "private":
+            # the video has been published as scheduled, keep it that way
+            # instead of making it private again and rescheduling it
+            del wanted["status"]["publishAt"]
+            wanted["status"]["privacyStatus"] = live_privacy
+        if "recordingDate" in live.get("recordingDetails", {}):
+            live["recordingDetails"]["recordingDate"] = rfc3339(
+                live["recordingDetails"]["recordingDate"]
+            )
+
+        update = {"id": video_id}
+        for part, values in wanted.items():
+            changed = {
+                k: v for k, v in values.items() if live.get(part, {}).get(k) != v
+            }
+            if changed:
+                LOG.debug(f"{video_id} {part} differs in {sorted(changed)}")
+                # youtube replaces the whole part, so we need to send all of it
+                update[part] = values
+
+        if len(update) == 1:
+            LOG.info(f"metadata of {video_id} is up to date")
+            return False
+
+        self.update_metadata(update)
+        LOG.info(f"updated {', '.join(sorted(update.keys() - {'id'}))} of {video_id}")
+        return True
+
+    def get_video(self, video_id: str):
+        """
+        documentation: https://developers.google.com/youtube/v3/docs/videos/list
+        :param video_id:
+        :return: video resource
+        """
+        self._use_quota("videos.list")
+        r = requests.get(
+            "https://www.googleapis.com/youtube/v3/videos",
+            params={
+                "part": "snippet,status,recordingDetails",
+                "id": video_id,
+            },
+            headers={
+                "Authorization": "Bearer " + self.accessToken,
+            },
+        )
+
+        _raise_if_quota_exceeded(r)
+        if 200 != r.status_code:
+            raise YouTubeException(
+                "fetching video %s failed with error-code %u\n\n%s"
+                % (video_id, r.status_code, r.text)
+            )
+
+        items = r.json().get("items", [])
+        if not items:
+            raise YouTubeException(f"video {video_id} does not exist on youtube")
+        return items[0]
+
     def update_metadata(self, metadata):
         # https://developers.google.com/youtube/v3/docs/videos#resource
+        self._use_quota("videos.update")
         r = requests.put(
             "https://youtube.googleapis.com/youtube/v3/videos",
-            params={
-                "part": "status"  # TODO extract keys from ','.join(metadata.keys())
-            },
+            params={"part": ",".join(k for k in metadata.keys() if k != "id")},
             headers={
                 "Authorization": "Bearer " + self.accessToken,
                 "Content-Type": "application/json; charset=UTF-8",
@@ -568,6 +1116,7 @@ class YoutubeAPI:
             data=json.dumps(metadata),
         )
 
+        _raise_if_quota_exceeded(r)
         if 200 != r.status_code:
             LOG.debug(metadata)
             error_from_youtube = r.json().get("error", {}).get("message", None)
@@ -586,8 +1135,19 @@ class YoutubeAPI:
         return r
 
     def add_to_playlists(self, video_id: str, playlist_ids):
+        """
+        add a video to all playlists it is not already part of
+        :param video_id:
+        :param playlist_ids:
+        """
+        self._run_concurrently(
+            self._playlist_items, [(p, video_id) for p in playlist_ids]
+        )
+        missing = [p for p in playlist_ids if not self._playlist_items(p, video_id)]
         for p in playlist_ids:
-            YoutubeAPI.add_to_playlist(self, video_id, p)
+            if p not in missing:
+                LOG.info(f"video {video_id} is already in playlist {p}")
+        self._run_concurrently(self.add_to_playlist, [(video_id, p) for p in missing])
 
     def add_to_playlist(self, video_id: str, playlist_id: str):
         """
@@ -595,88 +1155,160 @@ class YoutubeAPI:
         :param video_id:
         :param playlist_id:
         """
-        r = requests.post(
-            "https://www.googleapis.com/youtube/v3/playlistItems",
-            params={"part": "snippet"},
-            headers={
-                "Authorization": "Bearer " + self.accessToken,
-                "Content-Type": "application/json; charset=UTF-8",
-            },
-            data=json.dumps(
-                {
-                    "snippet": {
-                        "playlistId": playlist_id,  # required
-                        "resourceId": {
-                            "kind": "youtube#video",
-                            "videoId": video_id,
-                        },  # required
-                    },
-                }
-            ),
-        )
-
-        if 200 != r.status_code:
-            raise YouTubeException(
-                "Adding video to playlist failed with error-code %u\n\n%s"
-                % (r.status_code, r.text)
+        self._use_quota("playlistItems.insert")
+        try:
+            r = requests.post(
+                "https://www.googleapis.com/youtube/v3/playlistItems",
+                params={"part": "snippet"},
+                headers={
+                    "Authorization": "Bearer " + self.accessToken,
+                    "Content-Type": "application/json; charset=UTF-8",
+                },
+                data=json.dumps(
+                    {
+                        "snippet": {
+                            "playlistId": playlist_id,  # required
+                            "resourceId": {
+                                "kind": "youtube#video",
+                                "videoId": video_id,
+                            },  # required
+                        },
+                    }
+                ),
             )
 
+            _raise_if_quota_exceeded(r)
+            if 200 != r.status_code:
+                raise YouTubeException(
+                    "Adding video to playlist failed with error-code %u\n\n%s"
+                    % (r.status_code, r.text)
+                )
+        except Exception:
+            # the video may have been added anyway
+            _forget_playlist(playlist_id)
+            raise
+
+        with _PLAYLIST_CACHE_LOCK:
+            if (playlist_id, video_id) in _PLAYLIST_CACHE:
+                _PLAYLIST_CACHE[playlist_id, video_id][1].append(r.json()["id"])
+
         LOG.info("video added to playlist: " + playlist_id)
 
     def remove_from_playlists(self, video_id: str, ids):
         """
+        remove a video from all of the given playlists it is part of
+        :param video_id:
+        :param ids: list of playlist ids
+        """
+        self._run_concurrently(self._playlist_items, [(p, video_id) for p in ids])
+        items = []
+        for playlist_id in ids:
+            for item_id in self._playlist_items(playlist_id, video_id):
+                items.append((playlist_id, item_id))
+        self._run_concurrently(self.remove_playlist_item, items)
+
+    def remove_playlist_item(self, playlist_id: str, item_id: str):
+        """
+        documentation: https://developers.google.com/youtube/v3/docs/playlistItems/delete
+        :param playlist_id: playlist the item belongs to
+        :param item_id:
+        """
+        self._use_quota("playlistItems.delete")
+        try:
+            r = requests.delete(
+                "https://www.googleapis.com/youtube/v3/playlistItems",
+                params={"id": item_id},
+                headers={
+                    "Authorization": "Bearer " + self.accessToken,
+                },
+            )
+
+            _raise_if_quota_exceeded(r)
+            if 204 != r.status_code:
+                raise YouTubeException(
+                    "Removing video from playlist failed with error-code %u\n\n%s"
+                    % (r.status_code, r.text)
+                )
+        except Exception:
+            # the item may have been removed anyway
+            _forget_playlist(playlist_id)
+            raise
+
+        with _PLAYLIST_CACHE_LOCK:
+            for key, (_, items) in _PLAYLIST_CACHE.items():
+                if key[0] == playlist_id and item_id in items:
+                    items.remove(item_id)
+
+        LOG.info("video removed from playlist " + playlist_id)
+
+    def _playlist_items(self, playlist_id: str, video_id: str):
+        """
+        get the items of a video in a playlist, usually none or one. Only
+        the items of this video get listed, not the whole playlist. The
+        result is cached for PLAYLIST_CACHE_TTL seconds and kept up to date
+        by add_to_playlist() and remove_playlist_item().
         documentation: https://developers.google.com/youtube/v3/docs/playlistItems/list
+        :param playlist_id:
         :param video_id:
-        :param ids: list or string of playlist ids
+        :return: list of playlist item ids
         """
-        r = requests.get(
-            "https://www.googleapis.com/youtube/v3/playlistItems",
-            params={
+        with _PLAYLIST_CACHE_LOCK:
+            fetched, items = _PLAYLIST_CACHE.get((playlist_id, video_id), (0, None))
+            if time() - fetched < PLAYLIST_CACHE_TTL:
+                return items
+
+        items = []
+        page_token = None
+        while True:
+            params = {
                 "part": "id",
-                "id": ",".join(ids),
+                "playlistId": playlist_id,
                 "videoId": video_id,
-            },
-            headers={
-                "Authorization": "Bearer " + self.accessToken,
-                "Content-Type": "application/json; charset=UTF-8",
-            },
-        )
-
-        if 200 != r.status_code:
-            raise YouTubeException(
-                "Could not lookup playlist item ids, failed with error-code %u\n\n%s"
-                % (r.status_code, r.text)
+                "maxResults": 50,
+            }
+            if page_token:
+                params["pageToken"] = page_token
+            self._use_quota("playlistItems.list")
+            r = requests.get(
+                "https://www.googleapis.com/youtube/v3/playlistItems",
+                params=params,
+                headers={
+                    "Authorization": "Bearer " + self.accessToken,
+                },
             )
 
-        for item in r.json()["items"]:
-            self.remove_playlist_item(item["id"])
+            _raise_if_quota_exceeded(r)
+            if 200 != r.status_code:
+                raise YouTubeException(
+                    "Could not list playlist items of %s, failed with error-code %u\n\n%s"
+                    % (playlist_id, r.status_code, r.text)
+                )
 
-    def remove_playlist_item(self, item_id: str):
-        """
-        documentation: https://developers.google.com/youtube/v3/docs/playlistItems/delete
-        :param item_id:
-        """
-        r = requests.delete(
-            "https://www.googleapis.com/youtube/v3/playlistItems",
-            params={"part": "id"},
-            headers={
-                "Authorization": "Bearer " + self.accessToken,
-                "Content-Type": "application/json; charset=UTF-8",
-            },
-            data=json.dumps(
-                {
-                    "id": item_id,
-                }
-            ),
-        )
+            data = r.json()
+            items.extend(item["id"] for item in data.get("items", []))
 
-        if 204 != r.status_code:
-            raise YouTubeException(
-                "Removing video from playlist failed with error-code %u\n\n%s"
-                % (r.status_code, r.text)
-            )
+            page_token = data.get("nextPageToken")
+            if not page_token:
+                break
 
-        LOG.info("video removed from playlist ")
+        LOG.debug(f"video {video_id} is in playlist {playlist_id} {len(items)} times")
+        with _PLAYLIST_CACHE_LOCK:
+            _PLAYLIST_CACHE[playlist_id, video_id] = (time(), items)
+        return items
+
+    def _run_concurrently(self, function, calls):
+        """
+        run function for each tuple of arguments in calls, using
+        youtube.parallel_requests threads
+        """
+        if not calls:
+            return
+        parallel = int(self.config["youtube"].get("parallel_requests", 4))
+        with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+            futures = [executor.submit(function, *args) for args in calls]
+            for f in futures:
+                # re-raise the first exception of any call
+                f.result()
 
     @staticmethod
     def update_thumbnail(access_token: str, video_id: str, thumbnail: str):
@@ -698,6 +1330,7 @@ class YoutubeAPI:
             data=fp.read(),
         )
 
+        _raise_if_quota_exceeded(r)
         if 200 != r.status_code:
             raise YouTubeException(
                 "Video update failed with error-code %u\n\n%s" % (r.status_code, r.text)
@@ -722,6 +1355,7 @@ class YoutubeAPI:
             },
         )
 
+        _raise_if_quota_exceeded(r)
         if 200 != r.status_code:
             raise YouTubeException(
                 "Video add to playlist failed with error-code %u\n\n%s"
@@ -739,6 +1373,19 @@ class YoutubeAPI:
         :param client_secret:
         :return: YouTube access token
         """
+        return YoutubeAPI.fetch_token_data(refresh_token, client_id, client_secret)[
+            "access_token"
+        ]
+
+    @staticmethod
+    def fetch_token_data(refresh_token: str, client_id: str, client_secret: str):
+        """
+        request a 'fresh' youtube token
+        :param refresh_token:
+        :param client_id:
+        :param client_secret:
+        :return: token response of google, containing access_token and expires_in
+        """
         LOG.debug(
             "fetching fresh Access-Token on behalf of the refreshToken %s"
             % refresh_token
@@ -767,7 +1414,7 @@ class YoutubeAPI:
             )
 
         LOG.info("successfully fetched Access-Token %s" % data["access_token"])
-        return data["access_token"]
+        return data
 
     @staticmethod
     def get_channel_id(access_token: str):
@@ -790,6 +1437,7 @@ class YoutubeAPI:
             },
         )
 
+        _raise_if_quota_exceeded(r)
         if 200 != r.status_code:
             raise YouTubeException(
                 "fetching channelID failed with error-code %u\n\n%s"
@@ -833,3 +1481,7 @@ class MLStripper(HTMLParser):
 
 class YouTubeException(Exception):
     pass
+
+
+class YouTubeQuotaExceeded(YouTubeException):
+    pass
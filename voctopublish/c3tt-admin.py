@@ -1,9 +1,39 @@
 import argparse
-import configparser
+import logging
 import os
 import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import itemgetter
 
-from api_client.c3tt_rpc_client import C3TTClient
+try:
+    # python 3.11
+    from tomllib import loads as toml_load
+except ImportError:
+    from rtoml import load as toml_load
+
+from c3tt_rpc_client import C3TTClient
+from tools import bulk_operations
+
+# concurrent requests to the tracker in bulk mode
+DEFAULT_JOBS = 8
+
+USAGE = """
+    bulk: run the operations listed in --file, which is either a CSV file
+    with a header row or a file with one JSON object per line. Every
+    operation has a task and the arguments of the task, e.g.
+
+        task,ticket,prop:Publishing.Voctoweb.EnablePublishing
+        set-properties,1234,no
+        set-done,1235,
+
+        {"task": "set-properties", "ticket": 1234, "prop": {"Foo": "bar"}}
+        {"task": "add-ticket", "project": 42, "title": "Talk", "fahrplan_id": 7}
+
+    get-properties, set-properties and set-done are retried if they fail
+    because of network or server errors. add-profile and add-ticket are
+    not, they may have created a ticket anyway. A report of all operations
+    is printed at the end."""
 
 
 class C3TTAdmin:
@@ -16,17 +46,22 @@ class C3TTAdmin:
         if not os.path.exists("../client.conf"):
             raise IOError("Error: config file not found")
 
-        self.config = configparser.ConfigParser()
-        self.config.read("../client.conf")
+        with open("../client.conf") as f:
+            self.config = toml_load(f.read())
 
-        if self.config["C3Tracker"]["host"] == "None":
+        self.host = self.config["C3Tracker"].get("host", "").strip()
+        if not self.host or self.host == "None":
             self.host = socket.getfqdn()
-        else:
-            self.host = self.config["C3Tracker"]["host"]
 
+        # every thread running operations gets a client of its own, which
+        # is reused for all of its operations
+        self._local = threading.local()
         print("creating C3TTClient")
+        self._local.c3tt = self._connect()
+
+    def _connect(self):
         try:
-            self.c3tt = C3TTClient(
+            return C3TTClient(
                 self.config["C3Tracker"]["url"],
                 self.config["C3Tracker"]["group"],
                 self.host,
@@ -37,37 +72,117 @@ class C3TTAdmin:
                 "Config parameter missing or empty, please check config"
             ) from e_
 
+    @property
+    def c3tt(self):
+        if not hasattr(self._local, "c3tt"):
+            self._local.c3tt = self._connect()
+        return self._local.c3tt
+
     def add_encoding_profile(self, ticket, profile, properties=None):
-        print("adding profile " + str(profile) + " to ticket " + str(ticket))
-        ret = self.c3tt.create_encoding_ticket(ticket, profile)
-        print(ret)
+        return self.c3tt.create_encoding_ticket(ticket, profile)
 
     def get_version(self):
-        ret = self.c3tt.get_version()
-        print(ret)
+        return self.c3tt.get_version()
 
     def set_ticket_properties(self, ticket, properties):
-        print(properties)
-        ret = self.c3tt.set_ticket_properties(ticket, properties)
-        print(ret)
+        return self.c3tt.set_ticket_properties(ticket, properties)
 
     def get_ticket_properties(self, ticket):
-        ret = self.c3tt.get_ticket_properties(ticket)
-        print(ret)
+        return self.c3tt.get_ticket_properties(ticket)
 
     def set_ticket_done(self, ticket):
-        ret = self.c3tt.set_ticket_done(ticket)
-        print(ret)
+        return self.c3tt.set_ticket_done(ticket)
 
     def add_meta_ticket(self, project, title, fahrplan_id, properties=None):
-        ret = self.c3tt.create_meta_ticket(project, title, fahrplan_id, properties)
-        print(ret)
-
-
-parser = argparse.ArgumentParser(description="Modify tickets in the ticket tracker")
+        return self.c3tt.create_meta_ticket(project, title, fahrplan_id, properties)
+
+    def run(
+        self,
+        task,
+        ticket=None,
+        profile=None,
+        title=None,
+        fahrplan_id=None,
+        project=None,
+        prop=None,
+    ):
+        """
+        perform a task, see the help of the command line
+        :return: the response of the tracker
+        """
+        task = task.removeprefix("task=")
+        if task == "add-profile":
+            return self.add_encoding_profile(ticket, profile)
+        if task == "get-properties":
+            return self.get_ticket_properties(ticket)
+        if task == "set-properties":
+            return self.set_ticket_properties(ticket, prop or {})
+        if task == "set-done":
+            return self.set_ticket_done(ticket)
+        if task == "add-ticket":
+            return self.add_meta_ticket(project, title, fahrplan_id, prop or None)
+        raise ValueError(f"unknown task {task!r}")
+
+    def bulk(
+        self, operations, jobs=DEFAULT_JOBS, retries=bulk_operations.DEFAULT_RETRIES
+    ):
+        """
+        run many operations concurrently
+        :param operations: list of (line number, operation), see
+            read_operations()
+        :param jobs: number of concurrent requests to the tracker
+        :param retries: how often operations failing because of network
+            or server errors are retried, see retries_for()
+        :return: list of (line number, operation, result, error), ordered
+            by line number
+        """
+        results = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    bulk_operations.with_retries,
+                    lambda op=op: self.run(**op),
+                    bulk_operations.retries_for(op, retries),
+                ): (line, op)
+                for line, op in operations
+            }
+            for future in as_completed(futures):
+                line, op = futures[future]
+                try:
+                    results.append((line, op, future.result(), None))
+                except Exception as e:
+                    results.append((line, op, None, e))
+        return sorted(results, key=itemgetter(0))
+
+
+def print_report(results):
+    """
+    :return: number of failed operations
+    """
+    failed = 0
+    for line, op, result, error in results:
+        if error is None:
+            status, detail = "ok", result
+        else:
+            status, detail = "FAILED", repr(error)
+            failed += 1
+        ticket = op.get("ticket") or ""
+        print(f"{line:>6}  {status:<6}  {op['task']:<14}  {ticket!s:<8}  {detail}")
+    print(
+        f"{len(results) - failed} of {len(results)} operations succeeded, {failed} failed"
+    )
+    return failed
+
+
+parser = argparse.ArgumentParser(
+    description="Modify tickets in the ticket tracker",
+    epilog=USAGE,
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+)
 
 parser.add_argument(
-    "task", help="task to perform: add-profile, get-properties, set-done"
+    "task",
+    help="task to perform: add-profile, get-properties, set-properties, set-done, add-ticket, bulk",
 )
 parser.add_argument("--ticket", type=int)
 parser.add_argument("--profile", type=int)
@@ -89,21 +204,42 @@ parser.add_argument(
     ),
     default={},
 )  # anonymously subclassing argparse.Action
+parser.add_argument("--file", help="CSV or JSON lines file with operations for bulk")
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=DEFAULT_JOBS,
+    help="number of concurrent requests to the tracker in bulk mode",
+)
+parser.add_argument(
+    "--retries",
+    type=int,
+    default=bulk_operations.DEFAULT_RETRIES,
+    help="how often get-properties, set-properties and set-done are retried "
+    "after network errors",
+)
 args = parser.parse_args()
 
-admin = C3TTAdmin()
+logging.basicConfig(level=logging.WARNING)
 
 print("Selected task: " + args.task)
-if args.task == "task=add-profile":
-    admin.add_encoding_profile(args.ticket, args.profile)
-elif args.task == "task=get-properties":
-    admin.get_ticket_properties(args.ticket)
-elif args.task == "task=set-properties":
-    admin.set_ticket_properties(args.ticket, args.prop)
-elif args.task == "task=set-done":
-    admin.set_ticket_done(args.ticket)
-elif args.task == "task=add-ticket":
-    if args.prop:
-        admin.add_meta_ticket(args.project, args.title, args.fahrplan_id, args.prop)
-    else:
-        admin.add_meta_ticket(args.project, args.title, args.fahrplan_id)
+if args.task.removeprefix("task=") == "bulk":
+    if not args.file:
+        parser.error("bulk needs --file")
+    operations = bulk_operations.read_operations(args.file)
+    admin = C3TTAdmin()
+    if print_report(admin.bulk(operations, args.jobs, args.retries)):
+        exit(1)
+else:
+    admin = C3TTAdmin()
+    print(
+        admin.run(
+            args.task,
+            args.ticket,
+            args.profile,
+            args.title,
+            args.fahrplan_id,
+            args.project,
+            args.prop,
+        )
+    )
@@ -20,6 +20,7 @@ import logging
 import os
 import socket
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 
@@ -32,6 +33,12 @@ except ImportError:
 from api_client.voctoweb_client import VoctowebClient
 from c3tt_rpc_client import C3TTClient
 from model.ticket_module import Ticket
+from tools.property_buffer import PropertyBuffer
+
+# concurrent requests to voctoweb in bulk mode
+DEFAULT_JOBS = 8
+# event ids get written to the tracker after this many events
+DEFAULT_BATCH_SIZE = 50
 
 
 class RelivePublisher:
@@ -126,10 +133,14 @@ class RelivePublisher:
         """
         ticket = self._get_ticket_by_id(ticket_id)
 
-        if not ticket:
-            return
+        if ticket and self._prepare_ticket(ticket):
+            self._publish_event_to_voctoweb(ticket)
 
-        # voctoweb
+    def _prepare_ticket(self, ticket):
+        """
+        read the properties voctoweb needs from the ticket
+        :return: True if the ticket should be published to voctoweb
+        """
         if ticket._get_bool("Publishing.Voctoweb.EnableProfile"):
             ticket.voctoweb_event_id = ticket._get_str(
                 "Voctoweb.EventId", optional=True
@@ -175,11 +186,153 @@ class RelivePublisher:
                 ticket.voctoweb_tags.append(f"Day {ticket.day}")
             ticket.voctoweb_filename_base = None
 
-            print("==========")
-            print(ticket.languages)
-            print("==========")
+            logging.debug(f"languages of {ticket.id}: {ticket.languages}")
+            return True
+        return False
+
+    def create_events(
+        self,
+        ticket_ids=(),
+        project=None,
+        jobs=DEFAULT_JOBS,
+        batch_size=DEFAULT_BATCH_SIZE,
+    ):
+        """
+        create or update the voctoweb events of many tickets concurrently.
+        Events are identified by their GUID, so running this again only
+        updates them, and tickets sharing a GUID get one event.
+        :param ticket_ids: tracker ids of the tickets
+        :param project: also assign all relive tickets of this project which
+            wait for releasing, they get marked as done once their event exists
+        :param jobs: number of concurrent requests to voctoweb
+        :param batch_size: number of events after which their ids get written
+            to the tracker
+        :return: number of tickets which failed
+        """
+        tickets = []
+        assigned = set()
+        failed = 0
+        for ticket_id in ticket_ids:
+            try:
+                tickets.append(self._get_ticket_by_id(ticket_id))
+            except Exception:
+                # we didn't assign it, so it isn't ours to mark as failed
+                logging.exception(f"could not get ticket {ticket_id}")
+                failed += 1
+        while project:
+            ticket_meta = self.c3tt.assign_next_unassigned_for_state(
+                self.ticket_type,
+                self.to_state,
+                {"EncodingProfile.Slug": "relive", "Project.Slug": project},
+            )
+            if not ticket_meta:
+                break
+            assigned.add(ticket_meta["id"])
+            try:
+                tickets.append(self._get_ticket_by_id(ticket_meta["id"]))
+            except Exception as e_:
+                logging.exception(f"could not get ticket {ticket_meta['id']}")
+                if not self.notfail:
+                    self.c3tt.set_ticket_failed(
+                        ticket_meta["id"], f"{type(e_).__name__}: {e_}"
+                    )
+                failed += 1
+
+        by_guid = {}
+        for ticket in tickets:
+            try:
+                if self._prepare_ticket(ticket):
+                    by_guid.setdefault(ticket.guid, []).append(ticket)
+                elif ticket.id in assigned:
+                    self.c3tt.set_ticket_done(ticket.id)
+            except Exception as e_:
+                logging.exception(f"could not read ticket {ticket.id}")
+                failed += self._fail(ticket, e_, assigned)
+        logging.info(f"creating {len(by_guid)} events for {len(tickets)} tickets")
+
+        session = requests.Session()
+        session.mount(
+            self.config["voctoweb"]["api_url"],
+            requests.adapters.HTTPAdapter(pool_maxsize=jobs),
+        )
+        done = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(self._create_event, group[0], session): group
+                for group in by_guid.values()
+            }
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    event_id = future.result()
+                except Exception as e_:
+                    logging.exception(f"could not create event {group[0].guid}")
+                    for ticket in group:
+                        failed += self._fail(ticket, e_, assigned)
+                    continue
+                done += [(ticket, event_id) for ticket in group]
+                if len(done) >= batch_size:
+                    failed += self._write_event_ids(done, assigned)
+                    done = []
+        failed += self._write_event_ids(done, assigned)
+
+        total = len(ticket_ids) + len(assigned)
+        logging.info(f"{total - failed} of {total} tickets done, {failed} failed")
+        return failed
+
+    def _create_event(self, ticket, session):
+        """
+        :return: id of the created or updated event
+        """
+        vw = VoctowebClient(
+            ticket,
+            None,
+            self.config["voctoweb"]["api_key"],
+            self.config["voctoweb"]["api_url"],
+            self.config["voctoweb"]["ssh_host"],
+            self.config["voctoweb"]["ssh_port"],
+            self.config["voctoweb"]["ssh_user"],
+            self.config["voctoweb"]["frontend_url"],
+            session=session,
+        )
+        r = vw.create_or_update_event()
+        if r.status_code not in [200, 201]:
+            raise PublisherException(
+                f"Voctoweb returned an error while creating an event: "
+                f"{r.status_code} - {r.content}"
+            )
+        return r.json()["id"]
+
+    def _write_event_ids(self, results, assigned):
+        """
+        write the event ids of finished events to the tracker. Tickets which
+        already have the right id are not written again.
+        :param results: list of (ticket, event id) tuples
+        :return: number of tickets which failed
+        """
+        failed = 0
+        for ticket, event_id in results:
+            properties = PropertyBuffer(
+                self.c3tt, ticket.id, {"Voctoweb.EventId": ticket.voctoweb_event_id}
+            )
+            properties.set({"Voctoweb.EventId": event_id})
+            try:
+                properties.flush()
+                if ticket.id in assigned:
+                    self.c3tt.set_ticket_done(ticket.id)
+            except Exception as e_:
+                logging.exception(f"could not write event id to ticket {ticket.id}")
+                failed += self._fail(ticket, e_, assigned)
+        return failed
 
-            self._publish_event_to_voctoweb(ticket)
+    def _fail(self, ticket, error, assigned):
+        """
+        mark a ticket we assigned ourselves as failed
+        :return: 1, to count the failure
+        """
+        if ticket.id in assigned and not self.notfail:
+            self.c3tt.set_ticket_failed(ticket.id, f"{type(error).__name__}: {error}")
+        return 1
 
     def _get_ticket_by_id(self, ticket_id):
         """
@@ -315,7 +468,27 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="generate events on voctoweb for relive "
     )
-    parser.add_argument("ticket", action="store", help="CRS ID of a tracker ticket")
+    parser.add_argument(
+        "ticket",
+        nargs="*",
+        help="CRS ID of a tracker ticket, multiple IDs create the events concurrently",
+    )
+    parser.add_argument(
+        "--project",
+        help="create events for all relive tickets of this project slug which wait for releasing",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="number of concurrent requests to voctoweb",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="write event ids to the tracker after this many events",
+    )
     parser.add_argument("--verbose", "-v", action="store_true", default=False)
     parser.add_argument(
         "--notfail",
@@ -325,6 +498,8 @@ if __name__ == "__main__":
     )
 
     args = parser.parse_args()
+    if not args.ticket and not args.project:
+        parser.error("either ticket IDs or --project are required")
 
     try:
         publisher = RelivePublisher(args)
@@ -334,7 +509,12 @@ if __name__ == "__main__":
         sys.exit(-1)
 
     try:
-        publisher.create_event(args.ticket)
+        if len(args.ticket) == 1 and not args.project:
+            publisher.create_event(args.ticket[0])
+        elif publisher.create_events(
+            args.ticket, args.project, args.jobs, args.batch_size
+        ):
+            sys.exit(1)
     except Exception as e:
         exc_type, exc_obj, exc_tb = sys.exc_info()
         logging.exception(e)
@@ -15,11 +15,14 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import argparse
 import logging
 import os
 import socket
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 from api_client.voctoweb_client import VoctowebClient
 from api_client.youtube_client import YoutubeAPI
 from c3tt_rpc_client import C3TTClient
@@ -39,6 +42,11 @@ POSSIBLE_CONFIG_PATHS = [
     os.path.join(MY_PATH, "client.conf"),
 ]
 
+# tickets which get assigned and depublished together in batch mode
+DEFAULT_BATCH_SIZE = 20
+# tickets which get depublished at the same time in batch mode
+DEFAULT_JOBS = 4
+
 
 class Depublisher:
     """
@@ -138,49 +146,170 @@ class Depublisher:
 
         errors = set()
         # voctoweb
-        if self.ticket.voctoweb_enable and self.ticket.voctoweb_event_id:
+        if self._on_voctoweb(self.ticket):
             logging.info(
                 f"removing {self.ticket_id} from voctoweb, event id {self.ticket.voctoweb_event_id}"
             )
             try:
-                self._depublish_from_voctoweb()
+                self._depublish_from_voctoweb(self.ticket)
             except Exception as e:
                 logging.exception("failed to remove video from voctoweb")
                 errors.add(f"Removal from voctoweb failed: {e!r}")
-        elif self.ticket.voctoweb_event_id:
-            logging.warning(
-                f"ticket has voctoweb_event_id={self.ticket.voctoweb_event_id} set, but voctoweb is disabled. NOT removing!"
-            )
-        else:
-            logging.info("ticket not on voctoweb")
 
-        if self.ticket.youtube_enable and self.ticket.has_youtube_url:
+        if self._on_youtube(self.ticket):
             try:
-                self._depublish_from_youtube()
+                self.c3tt.set_ticket_properties(
+                    self.ticket_id, self._depublish_from_youtube(self.ticket)
+                )
             except Exception as e:
                 logging.exception("failed to remove video from youtube")
                 errors.add(f"Removal from youtube failed: {e!r}")
-        elif self.ticket.has_youtube_url:
-            logging.warning(
-                "ticket has youtube urls set, but youtube is disabled. NOT removing!"
-            )
-        else:
-            logging.info("ticket not on youtube")
 
         # TODO rclone
         # TODO webhook
 
+        self._finish(self.ticket_id, errors)
+
+    def depublish_batch(self, batch_size=DEFAULT_BATCH_SIZE, jobs=DEFAULT_JOBS):
+        """
+        Assign up to batch_size tickets and depublish them concurrently. The
+        recording files of all tickets get deleted with one remote command,
+        and all tickets share one SSH connection and HTTP session.
+        :return: number of assigned tickets, 0 if there are none left
+        """
+        tickets = {}
+        assigned = 0
+        while assigned < batch_size:
+            try:
+                ticket_id, ticket = self._get_ticket_from_tracker()
+            except Exception:
+                # the ticket has been marked as failed already
+                logging.exception("could not get ticket")
+                assigned += 1
+                continue
+            if not ticket:
+                break
+            assigned += 1
+            tickets[ticket_id] = ticket
+        if not tickets:
+            return assigned
+        logging.info(f"depublishing {len(tickets)} tickets")
+
+        errors = {ticket_id: set() for ticket_id in tickets}
+        session = requests.Session()
+        session.mount(
+            self.config["voctoweb"]["api_url"],
+            requests.adapters.HTTPAdapter(pool_maxsize=jobs),
+        )
+
+        def lookup(ticket_id):
+            """
+            :return: tuple of the voctoweb client and the files of the event
+            """
+            try:
+                vw = self._voctoweb_client(tickets[ticket_id], session)
+                return vw, self._recording_paths(vw)
+            except Exception as e:
+                logging.exception(f"failed to look up voctoweb event of {ticket_id}")
+                errors[ticket_id].add(f"Removal from voctoweb failed: {e!r}")
+                return None, []
+
+        def depublish_youtube(ticket_id):
+            try:
+                return self._depublish_from_youtube(tickets[ticket_id])
+            except Exception as e:
+                logging.exception(f"failed to remove {ticket_id} from youtube")
+                errors[ticket_id].add(f"Removal from youtube failed: {e!r}")
+                return None
+
+        def delete_event(ticket_id, vw):
+            try:
+                vw.delete_event()
+            except Exception as e:
+                logging.exception(f"failed to remove {ticket_id} from voctoweb")
+                errors[ticket_id].add(f"Removal from voctoweb failed: {e!r}")
+
+        on_voctoweb = [i for i, t in tickets.items() if self._on_voctoweb(t)]
+        on_youtube = [i for i, t in tickets.items() if self._on_youtube(t)]
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            youtube = executor.map(depublish_youtube, on_youtube)
+            # map() yields one result per ticket, in the order of the tickets
+            events = dict(zip(on_voctoweb, executor.map(lookup, on_voctoweb)))
+
+            # events which could not be found have probably been deleted already
+            events = {i: e for i, e in events.items() if e[0] and e[1] is not None}
+            if events:
+                try:
+                    self._voctoweb_client(None, session).delete_files(
+                        [path for _, paths in events.values() for path in paths]
+                    )
+                except Exception as e:
+                    logging.exception("failed to delete recordings from voctoweb")
+                    for ticket_id in events:
+                        errors[ticket_id].add(f"Removal from voctoweb failed: {e!r}")
+                    events = {}
+            for ticket_id, (vw, _) in events.items():
+                executor.submit(delete_event, ticket_id, vw)
+
+            youtube = dict(zip(on_youtube, youtube))
+
+        # the tracker client is not shared between threads
+        for ticket_id, props in youtube.items():
+            if props is None:
+                continue
+            try:
+                self.c3tt.set_ticket_properties(ticket_id, props)
+            except Exception as e:
+                logging.exception(f"failed to write youtube properties of {ticket_id}")
+                errors[ticket_id].add(f"Removal from youtube failed: {e!r}")
+        for ticket_id in tickets:
+            self._finish(ticket_id, errors[ticket_id])
+        return assigned
+
+    def _finish(self, ticket_id, errors):
         if errors:
-            self.c3tt.set_ticket_failed(self.ticket_id, "\n".join(sorted(errors)))
+            self.c3tt.set_ticket_failed(ticket_id, "\n".join(sorted(errors)))
         else:
             self.c3tt.set_ticket_done(
-                self.ticket_id,
+                ticket_id,
                 "Video depublished. YouTube videos have been set to private.",
             )
 
-    def _depublish_from_voctoweb(self):
-        vw = VoctowebClient(
-            self.ticket,
+    @staticmethod
+    def _on_voctoweb(ticket):
+        """
+        :return: True if the ticket has an event on voctoweb which should be removed
+        """
+        # the voctoweb properties of the ticket can't be used if voctoweb is disabled
+        event_id = ticket._get_str("Voctoweb.EventId", optional=True)
+        if ticket.voctoweb_enable and event_id:
+            return True
+        if event_id:
+            logging.warning(
+                f"ticket {ticket.id} has voctoweb_event_id={event_id} set, but voctoweb is disabled. NOT removing!"
+            )
+        else:
+            logging.info(f"ticket {ticket.id} not on voctoweb")
+        return False
+
+    @staticmethod
+    def _on_youtube(ticket):
+        """
+        :return: True if the ticket has videos on youtube which should be set to private
+        """
+        if ticket.youtube_enable and ticket.has_youtube_url:
+            return True
+        if ticket.has_youtube_url:
+            logging.warning(
+                f"ticket {ticket.id} has youtube urls set, but youtube is disabled. NOT removing!"
+            )
+        else:
+            logging.info(f"ticket {ticket.id} not on youtube")
+        return False
+
+    def _voctoweb_client(self, ticket, session=None):
+        return VoctowebClient(
+            ticket,
             None,
             self.config["voctoweb"]["api_key"],
             self.config["voctoweb"]["api_url"],
@@ -188,17 +317,34 @@ class Depublisher:
             self.config["voctoweb"]["ssh_port"],
             self.config["voctoweb"]["ssh_user"],
             self.config["voctoweb"]["frontend_url"],
+            session=session,
         )
 
+    @staticmethod
+    def _recording_paths(vw):
+        """
+        :return: paths of the recording files of the event on the storage
+            host, None if the event does not exist anymore
+        """
         event = vw.get_event()
         if "recordings" not in event:
             logging.info(
                 "Can't find recordings for event. Event has probably been already deleted."
             )
+            return None
+
+        return [
+            recording["recording_url"].replace("https:/", "")
+            for recording in event["recordings"]
+        ]
+
+    def _depublish_from_voctoweb(self, ticket):
+        vw = self._voctoweb_client(ticket)
+        paths = self._recording_paths(vw)
+        if paths is None:
             return
 
-        for recording in event["recordings"]:
-            path = recording["recording_url"].replace("https:/", "")
+        for path in paths:
             vw.delete_file(path)
 
         vw.delete_event()
@@ -220,10 +366,10 @@ class Depublisher:
             try:
                 tracker_ticket = self.c3tt.get_ticket_properties(ticket_id)
                 logging.debug("Ticket Properties: " + str(tracker_ticket))
+                t = PublishingTicket(tracker_ticket, ticket_id, self.config)
             except Exception as e_:
                 self.c3tt.set_ticket_failed(ticket_id, e_)
                 raise e_
-            t = PublishingTicket(tracker_ticket, ticket_id, self.config)
         else:
             logging.info(
                 "No ticket of type " + self.ticket_type + " for state " + self.to_state
@@ -231,33 +377,33 @@ class Depublisher:
 
         return ticket_id, t
 
-    def _depublish_from_youtube(self):
+    def _depublish_from_youtube(self, ticket):
         """
         Depublish all videos from YouTube which belong to this ticket.
+        Access tokens are cached, so tickets of the same channel share them.
+        :return: properties to write to the ticket
         """
         logging.debug("depublishing to youtube")
 
         yt = YoutubeAPI(
-            self.ticket,
+            ticket,
             None,
             self.config,
             self.config["youtube"]["client_id"],
             self.config["youtube"]["secret"],
         )
-        yt.setup(self.ticket.youtube_token)
+        yt.setup(ticket.youtube_token)
 
         youtube_urls, props = yt.depublish()
         props["Publishing.YouTube.UrlHistory"] = " ".join(
             [
-                *self.ticket._get_list(
+                *ticket._get_list(
                     "Publishing.YouTube.UrlHistory", optional=True, split_by=" "
                 ),
                 *youtube_urls,
             ]
         )
-
-        self.c3tt.set_ticket_properties(self.ticket_id, props)
-        return youtube_urls
+        return props
 
 
 class DepublisherException(Exception):
@@ -265,6 +411,25 @@ class DepublisherException(Exception):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="depublish removed tickets")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="assign this many tickets at once and depublish them concurrently",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="number of tickets depublished at the same time in batch mode",
+    )
+    parser.add_argument(
+        "--loop",
+        action="store_true",
+        help="keep depublishing batches until no ticket is left",
+    )
+    args = parser.parse_args()
+
     try:
         worker = Depublisher()
     except Exception as e:
@@ -272,6 +437,19 @@ if __name__ == "__main__":
         logging.exception(e)
         sys.exit(-1)
 
+    if args.batch_size or args.loop:
+        # failures are reported per ticket, a broken batch is not retried
+        try:
+            while (
+                worker.depublish_batch(args.batch_size or DEFAULT_BATCH_SIZE, args.jobs)
+                and args.loop
+            ):
+                pass
+        except Exception as e:
+            logging.exception(e)
+            sys.exit(-1)
+        sys.exit(0)
+
     try:
         worker.depublish()
     except Exception as e:
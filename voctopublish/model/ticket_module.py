@@ -17,12 +17,42 @@
 import logging
 import re
 import unicodedata
+from collections.abc import Mapping
 from datetime import datetime, timedelta, timezone
+from functools import cached_property
 from os.path import join
 
 LOG = logging.getLogger("Ticket")
 
 
+class PropertyIndex(Mapping):
+    """
+    read-only mapping of ticket properties with case-insensitive keys.
+    The keys are normalized once when the index is built, so lookups don't
+    have to scan all properties. If keys only differ in case, the first one wins.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, properties, convert=None):
+        data = {}
+        for k, v in properties.items():
+            data.setdefault(k.casefold(), convert(v) if convert else v)
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key.casefold()]
+
+    def __contains__(self, key):
+        return isinstance(key, str) and key.casefold() in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
 class Ticket:
     """
     This class is inspired by the c3tt ticket system. It handles all information we got from the tracker
@@ -35,6 +65,11 @@ class Ticket:
         self._tracker_ticket = ticket
         self.id = ticket_id
         self.config = config
+        self._properties = PropertyIndex(ticket, lambda v: str(v).strip())
+        self._defaults = PropertyIndex(
+            config.get("defaults", {}),
+            lambda v: v if isinstance(v, bool) else str(v).strip(),
+        )
 
         # project properties
         self.acronym = self._get_str("Meta.Acronym", True) or self._get_str(
@@ -42,20 +77,10 @@ class Ticket:
         )
 
     def __get_default(self, key):
-        key = key.lower()
-        for k, v in self.config.get("defaults", {}).items():
-            if k.lower() == key:
-                if isinstance(v, bool):
-                    return v
-                return str(v).strip()
-        return None
+        return self._defaults.get(key)
 
     def __get_property(self, key):
-        key = key.lower()
-        for k, v in self._tracker_ticket.items():
-            if k.lower() == key:
-                return str(v).strip()
-        return None
+        return self._properties.get(key)
 
     def _get_str(self, key, optional=False, try_default=False):
         value = self.__get_property(key)
@@ -298,7 +323,9 @@ class PublishingTicket(Ticket):
         ]
         self.license = self._get_str("Meta.License", optional=True, try_default=True)
 
-        # youtube properties
+        # the following enable flags are cheap to parse. The properties of the
+        # targets themselves are parsed by the sections below when they are
+        # used for the first time.
         if self._get_bool(
             "Publishing.YouTube.Enable", try_default=True
         ) and self._get_bool("Publishing.YouTube.EnableProfile", optional=True):
@@ -306,86 +333,6 @@ class PublishingTicket(Ticket):
         else:
             self.youtube_enable = False
 
-        # we will fill the following variables only if youtube is enabled
-        if self.youtube_enable:
-            self.youtube_update = self._get_str(
-                "Publishing.YouTube.Update", optional=True, try_default=True
-            )
-            self.youtube_token = self._get_str("Publishing.YouTube.Token")
-            self.youtube_category = self._get_str(
-                "Publishing.YouTube.Category", try_default=True
-            )
-            self.youtube_privacy = self._get_str(
-                "Publishing.YouTube.Privacy", try_default=True
-            )
-            self.youtube_title_prefix = self._get_str(
-                "Publishing.YouTube.TitlePrefix", optional=True
-            )
-            self.youtube_translation_title_prefix = self._get_str(
-                "Publishing.YouTube.TranslationTitlePrefix", optional=True
-            )
-            self.youtube_title_prefix_speakers = self._get_bool(
-                "Publishing.YouTube.TitlePrefixSpeakers", optional=True
-            )
-            self.youtube_title_append_speakers = self._get_bool(
-                "Publishing.YouTube.TitleAppendSpeakers", optional=True
-            )
-            self.youtube_title_suffix = self._get_str(
-                "Publishing.YouTube.TitleSuffix", optional=True
-            )
-            self.youtube_translation_title_suffix = self._get_str(
-                "Publishing.YouTube.TranslationTitleSuffix", optional=True
-            )
-            self.youtube_update_thumbnail = self._get_bool(
-                "Publishing.YouTube.UpdateThumbnail", optional=True, try_default=True
-            )
-            if self.youtube_update_thumbnail is None:
-                self.youtube_update_thumbnail = True
-
-            self.youtube_playlists = self._get_list(
-                "Publishing.YouTube.Playlists", optional=True
-            )
-
-            self.youtube_tags = [
-                *self.publishing_tags,
-                self.date.split("-")[0],
-                *self._get_list("Publishing.YouTube.Tags", optional=True),
-            ]
-            if self.day:
-                self.youtube_tags.append(f"{self.acronym} Day {self.day}")
-
-            youtube_publish_at = self._get_str(
-                "Publishing.YouTube.PublishAt", optional=True, try_default=True
-            )
-            self.youtube_publish_at = None
-            if youtube_publish_at:
-                if self.youtube_privacy != "private":
-                    raise TicketException(
-                        "Cannot use Publishing.YouTube.PublishAt when privacy is not 'private'!"
-                    )
-                try:
-                    self.youtube_publish_at = datetime.strptime(
-                        youtube_publish_at, "%Y-%m-%d %H:%M"
-                    )
-                except ValueError:
-                    result = re.findall(r"(\d+[wdh])", youtube_publish_at)
-                    if not result:
-                        raise TicketException(
-                            "Invalid value for Publishing.YouTube.PublishAt, either use 'YYYY-MM-DD HH:MM' or relative values like '7d 2h' (*w*eeks, *d*ays and *h*ours supported)"
-                        )
-                    else:
-                        kwargs = {}
-                        for k, keyword in {
-                            "w": "weeks",
-                            "d": "days",
-                            "h": "hours",
-                        }:
-                            for v in result:
-                                if v.endswith(k):
-                                    kwargs[keyword] = int(v[:-1])
-                        self.youtube_publish_at = datetime.now(
-                            timezone.utc
-                        ) + timedelta(**kwargs)
         self.youtube_urls = {}
         self.has_youtube_url = False
         # check if this event has already been published to youtube
@@ -393,8 +340,12 @@ class PublishingTicket(Ticket):
             if key.lower().startswith("youtube."):
                 self.has_youtube_url = True
                 self.youtube_urls[key] = self._get_str(key)
+        # set if publishing to YouTube has been deferred because of its
+        # quota, the other targets have been published already
+        self.youtube_deferred = self._get_str(
+            "Voctopublish.YouTubeDeferred", optional=True
+        )
 
-        # voctoweb properties
         if self._get_bool(
             "Publishing.Voctoweb.Enable", try_default=True
         ) and self._get_bool("Publishing.Voctoweb.EnableProfile", optional=True):
@@ -405,62 +356,14 @@ class PublishingTicket(Ticket):
         # guid is only required if voctoweb is enabled.
         self.guid = self._get_str("Fahrplan.GUID", optional=not self.voctoweb_enable)
 
-        # we will fill the following variables only if voctoweb is enabled
-        if self.voctoweb_enable:
-            self.voctoweb_filename_base = self.fahrplan_id + "-" + self.guid
-
-            self.mime_type = self._get_str("Publishing.Voctoweb.MimeType")
-            self.voctoweb_thumb_path = self._get_str("Publishing.Voctoweb.Thumbpath")
-            self.voctoweb_path = self._get_str("Publishing.Voctoweb.Path")
-            self.voctoweb_slug = self._get_str("Publishing.Voctoweb.Slug")
-            self.recording_id = self._get_str(
-                "Voctoweb.RecordingId.Master", optional=True
-            )
-            self.voctoweb_event_id = self._get_str("Voctoweb.EventId", optional=True)
-            self.voctoweb_source_file_hash = self._get_str(
-                "Publishing.Voctoweb.SourceFileHash", optional=True
-            )
-
-            # CAUTION: Order is important. See note for Publishing.Tags
-            # <https://github.com/voc/voctoweb/blob/main/app/views/frontend/events/show.html.haml#L85-L86>
-            self.voctoweb_tags = [
-                self.fahrplan_code or self.fahrplan_id,
-                self.date.split("-")[0],
-                *self.publishing_tags,
-                *self._get_list("Publishing.Voctoweb.Tags", optional=True),
-            ]
-            if self.day:
-                self.voctoweb_tags.append(f"Day {self.day}")
-
-        # rclone properties
         self.rclone_enable = self._get_bool(
             "Publishing.Rclone.Enable", try_default=True
         )
-        if self.rclone_enable:
-            self.rclone_destination = self._get_str(
-                "Publishing.Rclone.Destination", try_default=True
-            )
-            self.rclone_only_master = self._get_bool(
-                "Publishing.Rclone.OnlyMaster", optional=True, try_default=True
-            )
 
         # generic webhook that gets called on release
         self.webhook_url = self._get_str(
             "Publishing.Webhook.Url", optional=True, try_default=True
         )
-        if self.webhook_url:
-            self.webhook_user = self._get_str(
-                "Publishing.Webhook.User", optional=True, try_default=True
-            )
-            self.webhook_pass = self._get_str(
-                "Publishing.Webhook.Password", optional=True, try_default=True
-            )
-            self.webhook_only_master = self._get_bool(
-                "Publishing.Webhook.OnlyMaster", optional=True, try_default=True
-            )
-            self.webhook_fail_on_error = self._get_bool(
-                "Publishing.Webhook.FailOnError", optional=True, try_default=True
-            )
 
         # various announcement bots
         self.mastodon_enable = self._get_bool(
@@ -476,6 +379,224 @@ class PublishingTicket(Ticket):
             "Publishing.Googlechat.ExtraLink", optional=True, try_default=True
         )
 
+    @cached_property
+    def youtube(self):
+        if not self.youtube_enable:
+            raise TicketException("YouTube is not enabled for this ticket")
+        return YoutubeSection(self)
+
+    @cached_property
+    def voctoweb(self):
+        if not self.voctoweb_enable:
+            raise TicketException("Voctoweb is not enabled for this ticket")
+        return VoctowebSection(self)
+
+    @cached_property
+    def rclone(self):
+        if not self.rclone_enable:
+            raise TicketException("Rclone is not enabled for this ticket")
+        return RcloneSection(self)
+
+    @cached_property
+    def webhook(self):
+        if not self.webhook_url:
+            raise TicketException("no webhook configured for this ticket")
+        return WebhookSection(self)
+
+    def validate(self):
+        """
+        parse all sections of enabled targets, so missing or invalid
+        properties are reported before anything gets published
+        """
+        for section, enabled in (
+            ("youtube", self.youtube_enable),
+            ("voctoweb", self.voctoweb_enable),
+            ("rclone", self.rclone_enable),
+            ("webhook", self.webhook_url),
+        ):
+            if enabled:
+                getattr(self, section)
+
+    def __getattr__(self, name):
+        # only called if name is not a regular attribute. Keeps the flat
+        # attribute names (ticket.youtube_token etc.) working.
+        if name in SECTION_ATTRIBUTES:
+            section, attribute = SECTION_ATTRIBUTES[name]
+            return getattr(getattr(self, section), attribute)
+        raise AttributeError(
+            f"{type(self).__name__!r} object has no attribute {name!r}"
+        )
+
+
+class YoutubeSection:
+    """
+    youtube properties of a PublishingTicket
+    """
+
+    def __init__(self, t):
+        self.update = t._get_str(
+            "Publishing.YouTube.Update", optional=True, try_default=True
+        )
+        self.token = t._get_str("Publishing.YouTube.Token")
+        self.category = t._get_str("Publishing.YouTube.Category", try_default=True)
+        self.privacy = t._get_str("Publishing.YouTube.Privacy", try_default=True)
+        self.title_prefix = t._get_str("Publishing.YouTube.TitlePrefix", optional=True)
+        self.translation_title_prefix = t._get_str(
+            "Publishing.YouTube.TranslationTitlePrefix", optional=True
+        )
+        self.title_prefix_speakers = t._get_bool(
+            "Publishing.YouTube.TitlePrefixSpeakers", optional=True
+        )
+        self.title_append_speakers = t._get_bool(
+            "Publishing.YouTube.TitleAppendSpeakers", optional=True
+        )
+        self.title_suffix = t._get_str("Publishing.YouTube.TitleSuffix", optional=True)
+        self.translation_title_suffix = t._get_str(
+            "Publishing.YouTube.TranslationTitleSuffix", optional=True
+        )
+        self.update_thumbnail = t._get_bool(
+            "Publishing.YouTube.UpdateThumbnail", optional=True, try_default=True
+        )
+        if self.update_thumbnail is None:
+            self.update_thumbnail = True
+
+        self.playlists = t._get_list("Publishing.YouTube.Playlists", optional=True)
+
+        self.tags = [
+            *t.publishing_tags,
+            t.date.split("-")[0],
+            *t._get_list("Publishing.YouTube.Tags", optional=True),
+        ]
+        if t.day:
+            self.tags.append(f"{t.acronym} Day {t.day}")
+
+        youtube_publish_at = t._get_str(
+            "Publishing.YouTube.PublishAt", optional=True, try_default=True
+        )
+        self.publish_at = None
+        if youtube_publish_at:
+            if self.privacy != "private":
+                raise TicketException(
+                    "Cannot use Publishing.YouTube.PublishAt when privacy is not 'private'!"
+                )
+            try:
+                self.publish_at = datetime.strptime(
+                    youtube_publish_at, "%Y-%m-%d %H:%M"
+                )
+            except ValueError:
+                result = re.findall(r"(\d+[wdh])", youtube_publish_at)
+                if not result:
+                    raise TicketException(
+                        "Invalid value for Publishing.YouTube.PublishAt, either use 'YYYY-MM-DD HH:MM' or relative values like '7d 2h' (*w*eeks, *d*ays and *h*ours supported)"
+                    )
+                else:
+                    kwargs = {}
+                    for k, keyword in {
+                        "w": "weeks",
+                        "d": "days",
+                        "h": "hours",
+                    }:
+                        for v in result:
+                            if v.endswith(k):
+                                kwargs[keyword] = int(v[:-1])
+                    self.publish_at = datetime.now(timezone.utc) + timedelta(**kwargs)
+
+
+class VoctowebSection:
+    """
+    voctoweb properties of a PublishingTicket
+    """
+
+    def __init__(self, t):
+        self.filename_base = t.fahrplan_id + "-" + t.guid
+
+        self.mime_type = t._get_str("Publishing.Voctoweb.MimeType")
+        self.thumb_path = t._get_str("Publishing.Voctoweb.Thumbpath")
+        self.path = t._get_str("Publishing.Voctoweb.Path")
+        self.slug = t._get_str("Publishing.Voctoweb.Slug")
+        self.recording_id = t._get_str("Voctoweb.RecordingId.Master", optional=True)
+        self.event_id = t._get_str("Voctoweb.EventId", optional=True)
+        self.source_file_hash = t._get_str(
+            "Publishing.Voctoweb.SourceFileHash", optional=True
+        )
+
+        # CAUTION: Order is important. See note for Publishing.Tags
+        # <https://github.com/voc/voctoweb/blob/main/app/views/frontend/events/show.html.haml#L85-L86>
+        self.tags = [
+            t.fahrplan_code or t.fahrplan_id,
+            t.date.split("-")[0],
+            *t.publishing_tags,
+            *t._get_list("Publishing.Voctoweb.Tags", optional=True),
+        ]
+        if t.day:
+            self.tags.append(f"Day {t.day}")
+
+
+class RcloneSection:
+    """
+    rclone properties of a PublishingTicket
+    """
+
+    def __init__(self, t):
+        self.destination = t._get_str("Publishing.Rclone.Destination", try_default=True)
+        self.only_master = t._get_bool(
+            "Publishing.Rclone.OnlyMaster", optional=True, try_default=True
+        )
+
+
+class WebhookSection:
+    """
+    properties of the generic webhook of a PublishingTicket
+    """
+
+    def __init__(self, t):
+        self.user = t._get_str(
+            "Publishing.Webhook.User", optional=True, try_default=True
+        )
+        self.password = t._get_str(
+            "Publishing.Webhook.Password", optional=True, try_default=True
+        )
+        self.only_master = t._get_bool(
+            "Publishing.Webhook.OnlyMaster", optional=True, try_default=True
+        )
+        self.fail_on_error = t._get_bool(
+            "Publishing.Webhook.FailOnError", optional=True, try_default=True
+        )
+
+
+# flat attribute name of PublishingTicket => (section, attribute)
+SECTION_ATTRIBUTES = {
+    "youtube_update": ("youtube", "update"),
+    "youtube_token": ("youtube", "token"),
+    "youtube_category": ("youtube", "category"),
+    "youtube_privacy": ("youtube", "privacy"),
+    "youtube_title_prefix": ("youtube", "title_prefix"),
+    "youtube_translation_title_prefix": ("youtube", "translation_title_prefix"),
+    "youtube_title_prefix_speakers": ("youtube", "title_prefix_speakers"),
+    "youtube_title_append_speakers": ("youtube", "title_append_speakers"),
+    "youtube_title_suffix": ("youtube", "title_suffix"),
+    "youtube_translation_title_suffix": ("youtube", "translation_title_suffix"),
+    "youtube_update_thumbnail": ("youtube", "update_thumbnail"),
+    "youtube_playlists": ("youtube", "playlists"),
+    "youtube_tags": ("youtube", "tags"),
+    "youtube_publish_at": ("youtube", "publish_at"),
+    "voctoweb_filename_base": ("voctoweb", "filename_base"),
+    "mime_type": ("voctoweb", "mime_type"),
+    "voctoweb_thumb_path": ("voctoweb", "thumb_path"),
+    "voctoweb_path": ("voctoweb", "path"),
+    "voctoweb_slug": ("voctoweb", "slug"),
+    "recording_id": ("voctoweb", "recording_id"),
+    "voctoweb_event_id": ("voctoweb", "event_id"),
+    "voctoweb_source_file_hash": ("voctoweb", "source_file_hash"),
+    "voctoweb_tags": ("voctoweb", "tags"),
+    "rclone_destination": ("rclone", "destination"),
+    "rclone_only_master": ("rclone", "only_master"),
+    "webhook_user": ("webhook", "user"),
+    "webhook_pass": ("webhook", "password"),
+    "webhook_only_master": ("webhook", "only_master"),
+    "webhook_fail_on_error": ("webhook", "fail_on_error"),
+}
+
 
 class TicketException(Exception):
     pass
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
+import argparse
 import logging
 import os
 import re
 import socket
-from sys import argv
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 try:
     # python 3.11
@@ -16,6 +17,7 @@ from api_client.voctoweb_client import VoctowebClient
 from api_client.youtube_client import YoutubeAPI
 from c3tt_rpc_client import C3TTClient
 from model.ticket_module import PublishingTicket
+from tools.json_store import JsonStore
 from tools.thumbnails import ThumbnailGenerator
 
 logging.basicConfig(
@@ -25,31 +27,35 @@ logging.basicConfig(
 
 LOG = logging.getLogger("ThumbnailPatcher")
 
-try:
-    TRACKER_ID = argv[1]
-except IndexError:
-    print(
-        f"""Usage: {argv[0]} <tracker id>
+MY_PATH = os.path.abspath(os.path.dirname(__file__))
+POSSIBLE_CONFIG_PATHS = [
+    os.getenv("VOCTOPUBLISH_CONFIG", ""),
+    os.path.expanduser("~/voctopublish.conf"),
+    os.path.join(MY_PATH, "voctopublish.conf"),
+    os.path.join(MY_PATH, "client.conf"),
+]
+
+# remembers which thumbnails have been replaced already, so an interrupted
+# batch continues where it stopped
+DEFAULT_JOURNAL = "~/.cache/voctopublish/patch_thumbnail.json"
 
+USAGE = """
     Please make sure you use the tracker id (in the url), not the
     fahrplan id.
 
     This script will upload the pre-existing thumbnails for the named
-    ticket to voctoweb and/or youtube, whichever is enabled via tracker
+    tickets to voctoweb and/or youtube, whichever is enabled via tracker
     properties. You will have to make sure the thumbnail is placed
-    correctly in the file system."""
-    )
-    exit(1)
+    correctly in the file system.
+
+    With multiple tickets, the images for voctoweb and youtube get
+    generated in parallel and all uploads share one SSH connection.
+    Replaced thumbnails are recorded in a journal, so running the same
+    command again after a crash only does what is left, unless the
+    thumbnail file has changed in between."""
 
-try:
-    MY_PATH = os.path.abspath(os.path.dirname(__file__))
-    POSSIBLE_CONFIG_PATHS = [
-        os.getenv("VOCTOPUBLISH_CONFIG", ""),
-        os.path.expanduser("~/voctopublish.conf"),
-        os.path.join(MY_PATH, "voctopublish.conf"),
-        os.path.join(MY_PATH, "client.conf"),
-    ]
 
+def load_config():
     for path in POSSIBLE_CONFIG_PATHS:
         if path:
             if os.path.isfile(path):
@@ -61,92 +67,253 @@ try:
         )
 
     with open(my_config_path) as f:
-        config = toml_load(f.read())
-except Exception:
-    LOG.exception("Could not load config")
-    exit(1)
+        return toml_load(f.read())
 
-try:
-    HOST = config["C3Tracker"].get("host", "").strip()
-    if not HOST:
-        HOST = socket.getfqdn()
-
-    c3tt = C3TTClient(
-        config["C3Tracker"]["url"],
-        config["C3Tracker"]["group"],
-        HOST,
-        config["C3Tracker"]["secret"],
-    )
 
-    properties = c3tt.get_ticket_properties(TRACKER_ID)
-    ticket = PublishingTicket(properties, TRACKER_ID, config)
-except Exception:
-    LOG.exception(
-        "could not get ticket from tracker, are you sure you're using the *tracker id* of the master encoding?"
+def voctoweb_client(ticket, thumbs, config):
+    return VoctowebClient(
+        ticket,
+        thumbs,
+        config["voctoweb"]["api_key"],
+        config["voctoweb"]["api_url"],
+        config["voctoweb"]["ssh_host"],
+        config["voctoweb"]["ssh_port"],
+        config["voctoweb"]["ssh_user"],
     )
-    exit(1)
 
-if not ticket.master:
-    LOG.error("this ticket is not a master ticket, aborting!")
-    exit(1)
 
-thumbs = ThumbnailGenerator(ticket, config)
-if not thumbs.exists:
-    LOG.error(
-        f"thumbnail file {thumbs.path} does not exist, please ensure file is located correctly"
+def youtube_client(ticket, thumbs, config):
+    return YoutubeAPI(
+        ticket,
+        thumbs,
+        config,
+        config["youtube"]["client_id"],
+        config["youtube"]["secret"],
     )
-    exit(1)
 
-had_error = False
-if ticket.voctoweb_enable:
-    try:
-        LOG.info("updating thumbnail on voctoweb")
-        vw = VoctowebClient(
-            ticket,
-            thumbs,
-            config["voctoweb"]["api_key"],
-            config["voctoweb"]["api_url"],
-            config["voctoweb"]["ssh_host"],
-            config["voctoweb"]["ssh_port"],
-            config["voctoweb"]["ssh_user"],
-        )
-        LOG.info("generating voctoweb compatible thumbnails")
-        vw.generate_thumbs()
-        LOG.info("uploading thumbnails to voctoweb")
-        vw.upload_thumbs()
-        LOG.info("replaced thumbnails on voctoweb")
-    except Exception:
-        LOG.exception("could not replace thumbnail on voctoweb")
-        had_error = True
 
-if ticket.youtube_enable:
-    try:
-        LOG.info("updating thumbnail on youtube")
-        yt = YoutubeAPI(
-            ticket,
-            thumbs,
-            config,
-            config["youtube"]["client_id"],
-            config["youtube"]["secret"],
+def generate_images(ticket, config, targets):
+    """
+    scale the thumbnail of a ticket for voctoweb and youtube, runs in a
+    worker process
+    :param targets: set of "voctoweb" and "youtube"
+    """
+    thumbs = ThumbnailGenerator(ticket, config)
+    if "voctoweb" in targets:
+        LOG.info(f"generating voctoweb compatible thumbnails for {ticket.id}")
+        voctoweb_client(ticket, thumbs, config).generate_thumbs()
+    if "youtube" in targets:
+        LOG.info(f"generating youtube thumbnail for {ticket.id}")
+        youtube_client(ticket, thumbs, config).generate_thumbnail()
+
+
+class ThumbnailPatcher:
+    def __init__(self, config, journal=DEFAULT_JOURNAL):
+        self.config = config
+        self.journal = JsonStore(journal)
+
+        host = config["C3Tracker"].get("host", "").strip()
+        if not host:
+            host = socket.getfqdn()
+
+        self.c3tt = C3TTClient(
+            config["C3Tracker"]["url"],
+            config["C3Tracker"]["group"],
+            host,
+            config["C3Tracker"]["secret"],
         )
-        yt.setup(ticket.youtube_token)
+        # shares its SSH connection with the clients of all tickets
+        self.voctoweb = None
 
-        for url in ticket.youtube_urls.values():
-            try:
-                LOG.info(f"replacing thumbnail for youtube url {url}")
-                m = re.search(r"watch\?v=(.+)$", url)
-                if not m:
-                    LOG.error(f"{url} is not a youtube url")
+    def get_ticket(self, tracker_id):
+        """
+        :return: the ticket or None if its thumbnail can not be patched
+        """
+        try:
+            properties = self.c3tt.get_ticket_properties(tracker_id)
+            ticket = PublishingTicket(properties, tracker_id, self.config)
+        except Exception:
+            LOG.exception(
+                f"could not get ticket {tracker_id} from tracker, are you sure you're using the *tracker id* of the master encoding?"
+            )
+            return None
+
+        if not ticket.master:
+            LOG.error(f"ticket {tracker_id} is not a master ticket, skipping!")
+            return None
+
+        thumbs = ThumbnailGenerator(ticket, self.config)
+        if not thumbs.exists:
+            LOG.error(
+                f"thumbnail file {thumbs.path} does not exist, please ensure file is located correctly"
+            )
+            return None
+        return ticket
+
+    def _journal_key(self, ticket):
+        # a new thumbnail has to be uploaded again
+        path = ThumbnailGenerator(ticket, self.config).path
+        return f"{ticket.id}:{os.stat(path).st_mtime_ns}"
+
+    def _todo(self, ticket, force=False):
+        """
+        :return: set of targets of the ticket which still need the new thumbnail
+        """
+        targets = set()
+        if ticket.voctoweb_enable:
+            targets.add("voctoweb")
+        if ticket.youtube_enable:
+            targets |= {f"youtube:{url}" for url in ticket.youtube_urls.values()}
+        if not force:
+            with self.journal.entries() as entries:
+                targets -= set(entries.get(self._journal_key(ticket), []))
+        return targets
+
+    def _record(self, ticket, target):
+        with self.journal.entries() as entries:
+            entries.setdefault(self._journal_key(ticket), []).append(target)
+
+    def patch(self, tracker_ids, processes=None, force=False):
+        """
+        replace the thumbnails of all tickets
+        :param tracker_ids:
+        :param processes: number of processes generating images
+        :param force: ignore the journal
+        :return: True if there were no errors
+        """
+        had_error = False
+        tickets = []
+        for tracker_id in tracker_ids:
+            ticket = self.get_ticket(tracker_id)
+            if ticket is None:
+                had_error = True
+                continue
+            todo = self._todo(ticket, force)
+            if not todo:
+                LOG.info(f"thumbnails of {tracker_id} have been replaced already")
+                continue
+            tickets.append((ticket, todo))
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {
+                executor.submit(
+                    generate_images,
+                    ticket,
+                    self.config,
+                    {target.split(":", 1)[0] for target in todo},
+                ): (ticket, todo)
+                for ticket, todo in tickets
+            }
+            # upload in the order the images get ready
+            for future in as_completed(futures):
+                ticket, todo = futures[future]
+                try:
+                    future.result()
+                except Exception:
+                    LOG.exception(f"could not generate images for {ticket.id}")
+                    had_error = True
                     continue
-                yt.generate_and_upload_thumbnail(m.groups()[0])
-                LOG.info(f"replaced thumbnail for youtube url {url}")
+                if not self._upload(ticket, todo):
+                    had_error = True
+        return not had_error
+
+    def _upload(self, ticket, todo):
+        """
+        :return: True if there were no errors
+        """
+        had_error = False
+        thumbs = ThumbnailGenerator(ticket, self.config)
+        if "voctoweb" in todo:
+            try:
+                LOG.info(f"uploading thumbnails of {ticket.id} to voctoweb")
+                vw = voctoweb_client(ticket, thumbs, self.config)
+                if self.voctoweb is None:
+                    self.voctoweb = vw
+                vw.use_connection(self.voctoweb)
+                vw.upload_thumbs()
+                self._record(ticket, "voctoweb")
+                LOG.info("replaced thumbnails on voctoweb")
             except Exception:
-                LOG.exception(f"could not replace thumbnail on youtube for {url}")
+                LOG.exception("could not replace thumbnail on voctoweb")
                 had_error = True
+
+        urls = [t.split(":", 1)[1] for t in todo if t.startswith("youtube:")]
+        if urls:
+            try:
+                LOG.info(f"updating thumbnail of {ticket.id} on youtube")
+                # access tokens are cached, so this doesn't refresh them for every ticket
+                yt = youtube_client(ticket, thumbs, self.config)
+                yt.setup(ticket.youtube_token)
+
+                for url in urls:
+                    try:
+                        LOG.info(f"replacing thumbnail for youtube url {url}")
+                        m = re.search(r"watch\?v=(.+)$", url)
+                        if not m:
+                            LOG.error(f"{url} is not a youtube url")
+                            continue
+                        yt.upload_thumbnail(m.groups()[0])
+                        self._record(ticket, f"youtube:{url}")
+                        LOG.info(f"replaced thumbnail for youtube url {url}")
+                    except Exception:
+                        LOG.exception(
+                            f"could not replace thumbnail on youtube for {url}"
+                        )
+                        had_error = True
+            except Exception:
+                LOG.exception("could not replace thumbnail on youtube")
+                had_error = True
+        return not had_error
+
+
+def read_ids(path):
+    """
+    :return: tracker ids from a file with one id per line
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="replace the thumbnails of published tickets",
+        epilog=USAGE,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("tracker_id", nargs="*", help="tracker ids of the tickets")
+    parser.add_argument("--file", help="read tracker ids from a file, one per line")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="number of processes generating images, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--journal",
+        default=DEFAULT_JOURNAL,
+        help="file recording the replaced thumbnails",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="replace thumbnails even if the journal says they are up to date",
+    )
+    args = parser.parse_args()
+
+    tracker_ids = list(args.tracker_id)
+    if args.file:
+        tracker_ids += read_ids(args.file)
+    if not tracker_ids:
+        parser.print_help()
+        exit(1)
+
+    try:
+        config = load_config()
     except Exception:
-        LOG.exception("could not replace thumbnail on youtube")
-        had_error = True
+        LOG.exception("Could not load config")
+        exit(1)
 
-if had_error:
-    LOG.error("had errors, check above")
-    exit(1)
+    if not ThumbnailPatcher(config, args.journal).patch(
+        tracker_ids, args.processes, args.force
+    ):
+        LOG.error("had errors, check above")
+        exit(1)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from tempfile import TemporaryDirectory
+
+from api_client import voctoweb_public_client
+from api_client.voctoweb_client import VoctowebClient
+from tools.thumbnails import extract_thumbnail
+
+LOG = logging.getLogger("RebuildImages")
+
+# where the images of voctoweb are published
+DEFAULT_STATIC_URL = "https://static.media.ccc.de/media/"
+# recordings are published here, replaced by --local-mirror
+DEFAULT_CDN_URL = "http://cdn.media.ccc.de"
+# remembers the events whose images have been rebuilt already, so an
+# interrupted run continues where it stopped
+DEFAULT_CHECKPOINT = "~/.cache/voctopublish/rebuild_images.txt"
+
+USAGE = """
+    rebuild: regenerate the thumbnail and poster images of all events on
+    voctoweb from their main recording, which is the video with the best
+    quality. The images are written to the output directory with the same
+    layout as on the static host, e.g. OUTPUT/froscon/2014/1372.jpg.
+    Conferences and events are fetched concurrently, the images get
+    generated by multiple processes.
+
+    audit: check with HEAD requests that the thumbnail and poster images
+    of all events exist on the static host. Use --check-url to look for
+    them somewhere else, e.g. rebuilt images which have not been moved to
+    their final place yet."""
+
+
+class Checkpoint:
+    """
+    append-only list of finished events, one url per line. If path is
+    empty, nothing gets remembered.
+    """
+
+    def __init__(self, path):
+        self.done = set()
+        self.file = None
+        if not path:
+            return
+
+        path = os.path.expanduser(path)
+        try:
+            with open(path) as f:
+                self.done = {line.strip() for line in f if line.strip()}
+            LOG.info(f"{len(self.done)} events have been done already")
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a")
+
+    def __contains__(self, url):
+        return url in self.done
+
+    def add(self, url):
+        self.done.add(url)
+        if self.file:
+            self.file.write(url + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def rebuild_event(source, thumb_path, poster_path):
+    """
+    generate the images of an event, runs in a worker process
+    :param source: path or url of the main recording
+    """
+    with TemporaryDirectory() as tmpdir:
+        image = os.path.join(tmpdir, "thumbnail.png")
+        extract_thumbnail(source, image)
+        for path in (thumb_path, poster_path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        VoctowebClient.scale_thumbs(image, thumb_path, poster_path)
+
+
+class ImageRebuilder:
+    def __init__(
+        self,
+        client,
+        output,
+        static_url=DEFAULT_STATIC_URL,
+        local_mirror=None,
+        cdn_url=DEFAULT_CDN_URL,
+        checkpoint=DEFAULT_CHECKPOINT,
+        noop=False,
+    ):
+        """
+        :param client: VoctowebPublicClient
+        :param output: directory the images get written to
+        :param static_url: where the images of voctoweb are published
+        :param local_mirror: directory which contains the recordings
+            published below cdn_url, they get fetched via HTTP otherwise
+        :param checkpoint: file which remembers the finished events
+        :param noop: only log what would be done
+        """
+        self.client = client
+        self.output = output
+        self.static_url = static_url
+        self.local_mirror = local_mirror
+        self.cdn_url = cdn_url
+        self.noop = noop
+        self.checkpoint = Checkpoint(None if noop else checkpoint)
+
+    def _output_path(self, url):
+        if not url or not url.startswith(self.static_url):
+            raise ValueError(f"image url {url!r} is not below {self.static_url}")
+        return os.path.join(self.output, url[len(self.static_url) :].lstrip("/"))
+
+    def _source(self, recording):
+        url = recording["recording_url"]
+        if not self.local_mirror:
+            return url
+        if not url.startswith(self.cdn_url):
+            raise ValueError(f"recording {url} is not below {self.cdn_url}")
+        path = self.local_mirror + url[len(self.cdn_url) :]
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"recording {path} not found locally")
+        return path
+
+    def job(self, event):
+        """
+        :param event: event details from the public API
+        :return: arguments for rebuild_event() or None if the event has
+            no video
+        """
+        recording = voctoweb_public_client.main_recording(event)
+        if recording is None:
+            return None
+        return (
+            self._source(recording),
+            self._output_path(event["thumb_url"]),
+            self._output_path(event["poster_url"]),
+        )
+
+    def rebuild(self, acronyms=None, processes=None):
+        """
+        :param acronyms: only rebuild the images of these conferences
+        :param processes: number of processes generating images, defaults
+            to the number of CPUs
+        :return: True if there were no errors
+        """
+        had_error = False
+        processes = processes or os.cpu_count()
+        pending = {}
+
+        def collect(block):
+            nonlocal had_error
+            done, _ = wait(
+                pending, timeout=None if block else 0, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                event = pending.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    LOG.exception(f"could not rebuild images of {event['url']}")
+                    had_error = True
+                    continue
+                self.checkpoint.add(event["url"])
+                LOG.info(f"rebuilt images of {event['title']} ({event['url']})")
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for conference, details in self.client.conferences(acronyms):
+                if details is None:
+                    had_error = True
+                    continue
+                events = [
+                    e for e in details["events"] if e["url"] not in self.checkpoint
+                ]
+                LOG.info(
+                    f"{conference['acronym']}: rebuilding images of {len(events)} "
+                    f"of {len(details['events'])} events"
+                )
+                for event, event_details in self.client.fetch(events):
+                    if event_details is None:
+                        had_error = True
+                        continue
+                    try:
+                        job = self.job(event_details)
+                    except Exception:
+                        LOG.exception(f"could not rebuild images of {event['url']}")
+                        had_error = True
+                        continue
+                    if job is None:
+                        LOG.warning(f"{event['url']} has no video recording")
+                        continue
+                    if self.noop:
+                        LOG.info(f"would rebuild {job[1]} and {job[2]} from {job[0]}")
+                        continue
+
+                    # don't queue more events than can be handled soon, so
+                    # the checkpoint stays close to what has been done
+                    while len(pending) >= 2 * processes:
+                        collect(block=True)
+                    pending[executor.submit(rebuild_event, *job)] = event_details
+                    collect(block=False)
+
+            while pending:
+                collect(block=True)
+
+        self.checkpoint.close()
+        return not had_error
+
+
+def audit(client, acronyms=None, static_url=DEFAULT_STATIC_URL, check_url=None):
+    """
+    check that the images of all events exist
+    :param check_url: look for the images here instead of static_url
+    :return: list of missing image urls
+    """
+    missing = []
+    for conference, details in client.conferences(acronyms):
+        if details is None:
+            # its images can't be checked
+            missing.append(conference["url"])
+            continue
+
+        urls = {}
+        for event in details["events"]:
+            for url in (event.get("thumb_url"), event.get("poster_url")):
+                if not url:
+                    LOG.warning(f"{event['url']} has no image url")
+                    continue
+                if check_url and url.startswith(static_url):
+                    url = check_url + url[len(static_url) :]
+                urls[url] = event
+
+        for url, status in client.exists(urls).items():
+            LOG.debug(f"HEAD {url} => {status}")
+            if status != 200:
+                event = urls[url]
+                LOG.warning(
+                    f"image {url} not found for {event['title']} ({event['url']})"
+                )
+                missing.append(url)
+        LOG.info(f"{conference['acronym']}: checked {len(urls)} images")
+    return missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="rebuild and check the images of all events on voctoweb",
+        epilog=USAGE,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--api-url",
+        default=voctoweb_public_client.DEFAULT_API_URL,
+        help="url of the public voctoweb API",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=voctoweb_public_client.DEFAULT_JOBS,
+        help="number of concurrent requests to voctoweb and the static host",
+    )
+    parser.add_argument(
+        "--conference",
+        action="append",
+        help="acronym of a conference, may be given multiple times, defaults to all",
+    )
+    parser.add_argument(
+        "--static-url",
+        default=DEFAULT_STATIC_URL,
+        help="where the images of voctoweb are published",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild", help="regenerate the images")
+    rebuild.add_argument("--output", required=True, help="directory for the images")
+    rebuild.add_argument(
+        "--local-mirror", help="directory which contains the files of --cdn-url"
+    )
+    rebuild.add_argument(
+        "--cdn-url",
+        default=DEFAULT_CDN_URL,
+        help="url of the recordings, replaced by --local-mirror",
+    )
+    rebuild.add_argument(
+        "--processes",
+        type=int,
+        help="number of processes generating images, defaults to the number of CPUs",
+    )
+    rebuild.add_argument(
+        "--checkpoint",
+        default=DEFAULT_CHECKPOINT,
+        help="file recording the events which are done",
+    )
+    rebuild.add_argument("--noop", action="store_true", help="do not create any files")
+
+    check = subparsers.add_parser("audit", help="check that all images exist")
+    check.add_argument(
+        "--check-url",
+        help="replaces --static-url in the image urls, e.g. "
+        "https://static.media.ccc.de/media/_new/",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    client = voctoweb_public_client.VoctowebPublicClient(args.api_url, args.jobs)
+    if args.command == "rebuild":
+        rebuilder = ImageRebuilder(
+            client,
+            args.output,
+            args.static_url,
+            args.local_mirror,
+            args.cdn_url,
+            args.checkpoint,
+            args.noop,
+        )
+        if not rebuilder.rebuild(args.conference, args.processes):
+            LOG.error("had errors, check above")
+            exit(1)
+    else:
+        missing = audit(client, args.conference, args.static_url, args.check_url)
+        if missing:
+            LOG.error(f"{len(missing)} images are missing")
+            exit(1)
+        LOG.info("all images exist")
@@ -0,0 +1,118 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from api_client import rclone_client
+from api_client.rclone_client import COPIED, FAILED, UNCHANGED, RCloneClient
+
+
+class TestRCloneArtifacts(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        for name in ("42_voctoweb.jpg", "42_voctoweb_preview.jpg", "other.jpg"):
+            open(os.path.join(self.tmpdir.name, name), "w").close()
+        self.ticket = mock.Mock(
+            id=1,
+            date="2023-01-01T23:42:42+0100",
+            acronym="jev22",
+            day="1",
+            filename="jev22-42-eng-test_hd.mp4",
+            local_filename="42-hd.mp4",
+            folder="h264-hd",
+            fahrplan_id="42",
+            slug="jev22-42-test",
+            publishing_path=self.tmpdir.name,
+            rclone_destination="remote:{event}/{format}/{filename_full}",
+        )
+        self.config = {
+            "rclone": {
+                "exe_path": "rclone",
+                "config_path": "rclone.conf",
+                "artifacts": [
+                    {
+                        "name": "thumbs",
+                        "source": "{fahrplan_id}_voctoweb*.jpg",
+                        "destination": "remote:{event}/thumbs/{name}",
+                    },
+                    {
+                        "source": "{fahrplan_id}_voctoweb.jpg",
+                        "destination": "remote:{event}/{slug}.jpg",
+                    },
+                ],
+            }
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_manifest(self):
+        client = RCloneClient(self.ticket, self.config)
+        self.assertEqual(
+            client.artifacts,
+            [
+                (
+                    "thumbs",
+                    os.path.join(self.tmpdir.name, "42_voctoweb.jpg"),
+                    "remote:jev22/thumbs/42_voctoweb.jpg",
+                ),
+                (
+                    "thumbs",
+                    os.path.join(self.tmpdir.name, "42_voctoweb_preview.jpg"),
+                    "remote:jev22/thumbs/42_voctoweb_preview.jpg",
+                ),
+                (
+                    "2",
+                    os.path.join(self.tmpdir.name, "42_voctoweb.jpg"),
+                    "remote:jev22/jev22-42-test.jpg",
+                ),
+            ],
+        )
+
+    @mock.patch("api_client.rclone_client.run")
+    def test_one_run_per_directory(self, run):
+        run.side_effect = [
+            mock.Mock(
+                returncode=0,
+                stderr='{"level":"info","msg":"Copied (new)","object":"42_voctoweb.jpg"}\n',
+            ),
+            mock.Mock(returncode=3, stderr=""),
+        ]
+        client = RCloneClient(self.ticket, self.config)
+
+        results = client.upload_artifacts()
+        self.assertEqual(
+            results,
+            {
+                "remote:jev22/thumbs/42_voctoweb.jpg": COPIED,
+                "remote:jev22/thumbs/42_voctoweb_preview.jpg": UNCHANGED,
+                "remote:jev22/jev22-42-test.jpg": FAILED,
+            },
+        )
+        # remote paths are no part of the property names
+        self.assertEqual(
+            client.artifact_properties(results),
+            {
+                "Rclone.Artifact.thumbs": "copied remote:jev22/thumbs/42_voctoweb.jpg, "
+                "unchanged remote:jev22/thumbs/42_voctoweb_preview.jpg",
+                "Rclone.Artifact.2": "failed remote:jev22/jev22-42-test.jpg",
+            },
+        )
+        args = run.call_args_list[0]
+        self.assertIn("copy", args[0][0])
+        self.assertIn("--checksum", args[0][0])
+        self.assertEqual(args[1]["input"], "42_voctoweb.jpg\n42_voctoweb_preview.jpg\n")
+
+
+class TestRCloneDaemon(unittest.TestCase):
+    @mock.patch("atexit.register")
+    @mock.patch.object(rclone_client.RCloneDaemon, "call")
+    @mock.patch("api_client.rclone_client.Popen")
+    def test_password_not_on_command_line(self, mock_popen, mock_call, _):
+        daemon = rclone_client.RCloneDaemon(
+            {"exe_path": "rclone", "config_path": "rclone.conf"}
+        )
+
+        args, kwargs = mock_popen.call_args
+        self.assertNotIn(daemon.auth[1], args[0])
+        self.assertEqual(kwargs["env"]["RCLONE_RC_PASS"], daemon.auth[1])
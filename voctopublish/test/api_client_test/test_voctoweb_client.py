@@ -0,0 +1,40 @@
+import io
+import unittest
+from subprocess import CalledProcessError
+from unittest import mock
+
+from api_client.voctoweb_client import VoctowebClient
+
+
+class TestVoctowebUploadStream(unittest.TestCase):
+    def setUp(self):
+        ticket = mock.Mock(voctoweb_path="/media/jev22")
+        self.client = VoctowebClient(ticket, None, "key", "url", "host", 22, "user")
+        self.client.sftp = mock.MagicMock()
+
+    def test_renames_complete_stream(self):
+        size = self.client.upload_stream(
+            io.BytesIO(b"video"), "talk.mp4", "h264-hd", mock.Mock()
+        )
+
+        self.assertEqual(size, 5)
+        self.client.sftp.open.assert_called_once_with(
+            "/media/jev22/h264-hd/talk.mp4.part", "wb"
+        )
+        self.client.sftp.posix_rename.assert_called_once_with(
+            "/media/jev22/h264-hd/talk.mp4.part", "/media/jev22/h264-hd/talk.mp4"
+        )
+        # an existing recording stays until the new one is complete
+        self.client.sftp.remove.assert_not_called()
+
+    def test_keeps_recording_if_stream_fails(self):
+        check = mock.Mock(side_effect=CalledProcessError(1, "ffmpeg"))
+        with self.assertRaises(CalledProcessError):
+            self.client.upload_stream(
+                io.BytesIO(b"video"), "talk.mp4", "h264-hd", check
+            )
+
+        self.client.sftp.posix_rename.assert_not_called()
+        self.client.sftp.remove.assert_called_once_with(
+            "/media/jev22/h264-hd/talk.mp4.part"
+        )
@@ -0,0 +1,95 @@
+import unittest
+from unittest import mock
+
+from api_client import voctoweb_public_client
+from api_client.voctoweb_public_client import VoctowebPublicClient
+
+
+def _response(data, links=None):
+    return mock.Mock(json=mock.Mock(return_value=data), links=links or {})
+
+
+class TestVoctowebPublicClient(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.Mock()
+        self.client = VoctowebPublicClient(
+            "https://api.example.com/public/", 4, self.session
+        )
+
+    def test_fetches_pages_concurrently(self):
+        pages = {
+            None: _response(
+                {"events": [1]},
+                {"last": {"url": "https://api.example.com/public/events?page=3&x=1"}},
+            ),
+            2: _response({"events": [2]}),
+            3: _response({"events": [3]}),
+        }
+        self.session.get.side_effect = lambda url, params, timeout: pages[
+            params and params["page"]
+        ]
+
+        self.assertEqual(self.client.get_list("events", "events"), [1, 2, 3])
+        self.session.get.assert_any_call(
+            "https://api.example.com/public/events?x=1", params={"page": 3}, timeout=30
+        )
+
+    def test_follows_next_links(self):
+        self.session.get.side_effect = [
+            _response({"events": [1]}, {"next": {"url": "https://a/2"}}),
+            _response({"events": [2]}),
+        ]
+        self.assertEqual(self.client.get_list("events", "events"), [1, 2])
+
+    def test_fetch_reports_failures(self):
+        def get(url, params, timeout):
+            if url.endswith("broken"):
+                raise ConnectionError()
+            return _response({"url": url})
+
+        self.session.get.side_effect = get
+        results = dict(
+            (item["url"], details)
+            for item, details in self.client.fetch(
+                [{"url": "https://a/ok"}, {"url": "https://a/broken"}]
+            )
+        )
+        self.assertEqual(
+            results, {"https://a/ok": {"url": "https://a/ok"}, "https://a/broken": None}
+        )
+
+
+class TestMainRecording(unittest.TestCase):
+    def test_prefers_high_quality_mp4(self):
+        recordings = [
+            {
+                "mime_type": "video/webm",
+                "high_quality": True,
+                "width": 1920,
+                "height": 1080,
+            },
+            {
+                "mime_type": "video/mp4",
+                "high_quality": False,
+                "width": 3840,
+                "height": 2160,
+            },
+            {
+                "mime_type": "video/mp4",
+                "high_quality": True,
+                "width": 1920,
+                "height": 1080,
+            },
+            {"mime_type": "audio/mpeg", "high_quality": True},
+        ]
+        self.assertIs(
+            voctoweb_public_client.main_recording({"recordings": recordings}),
+            recordings[2],
+        )
+
+    def test_no_video(self):
+        self.assertIsNone(
+            voctoweb_public_client.main_recording(
+                {"recordings": [{"mime_type": "audio/opus"}]}
+            )
+        )
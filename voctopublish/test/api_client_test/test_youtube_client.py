@@ -1,8 +1,14 @@
+import io
 import json
+import os
 import unittest
+from subprocess import CalledProcessError
+from tempfile import TemporaryDirectory
+from time import time
 from unittest import mock
 
-from api_client.youtube_client import YoutubeAPI
+from api_client import youtube_client
+from api_client.youtube_client import YoutubeAPI, YouTubeException, rfc3339
 from model.ticket_module import Ticket
 
 
@@ -230,5 +236,199 @@ class TestYouTubeClient(unittest.TestCase):
         return client
 
 
+class TestYouTubeSetup(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.config = {
+            "youtube": {
+                "token_cache": os.path.join(self.tmpdir.name, "tokens.json"),
+                "quota_ledger": os.path.join(self.tmpdir.name, "quota.json"),
+            }
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @mock.patch.object(YoutubeAPI, "get_channel_id", return_value="my-channel")
+    @mock.patch.object(
+        YoutubeAPI,
+        "fetch_token_data",
+        return_value={"access_token": "my-access-token", "expires_in": 3600},
+    )
+    def test_caches_token_and_channel(self, fetch_token_data, get_channel_id):
+        client = YoutubeAPI(None, None, self.config, "my-client", "my-secret")
+        client.setup("TheToken")
+        client.setup("TheToken")
+
+        self.assertEqual(client.accessToken, "my-access-token")
+        self.assertEqual(client.channelId, "my-channel")
+        fetch_token_data.assert_called_once()
+        get_channel_id.assert_called_once()
+        self.assertEqual(client.remaining_quota(), 9999)
+
+    @mock.patch.object(YoutubeAPI, "estimate_quota", return_value=6000)
+    def test_reserves_quota(self, estimate_quota):
+        first = YoutubeAPI(mock.Mock(id=1), None, self.config, "my-client", "s")
+        second = YoutubeAPI(mock.Mock(id=2), None, self.config, "my-client", "s")
+
+        first.check_quota()
+        # checking again replaces the reservation of the same ticket
+        first.check_quota()
+        with self.assertRaises(youtube_client.YouTubeQuotaExceeded):
+            second.check_quota()
+
+        first._use_quota("videos.insert")
+        self.assertEqual(first.remaining_quota(), 4000)
+        first.release_quota()
+        self.assertEqual(first.remaining_quota(), 8400)
+        second.check_quota()
+
+    @mock.patch("requests.get")
+    def test_quota_exceeded_by_others(self, mock_get):
+        mock_get.return_value = mock.Mock(
+            status_code=403,
+            text="quota exceeded",
+            json=mock.Mock(
+                return_value={"error": {"errors": [{"reason": "quotaExceeded"}]}}
+            ),
+        )
+        client = YoutubeAPI(mock.Mock(), None, self.config, "my-client", "s")
+        client.accessToken = "my-access-token"
+
+        with self.assertRaises(youtube_client.YouTubeQuotaExceeded):
+            client.get_video("abc")
+
+
+class TestYouTubeStreamUpload(unittest.TestCase):
+    def setUp(self):
+        self.client = YoutubeAPI(
+            mock.Mock(), None, {"youtube": {}}, "my-client", "my-secret"
+        )
+        self.client.accessToken = "my-access-token"
+        self.client._build_metadata = mock.Mock(return_value={})
+        self.client._create_upload_session = mock.Mock(
+            return_value="https://upload.example.com/session"
+        )
+
+    @mock.patch("requests.delete")
+    @mock.patch("requests.put")
+    def test_cancels_incomplete_stream(self, mock_put, mock_delete):
+        check = mock.Mock(side_effect=CalledProcessError(1, "ffmpeg"))
+        with self.assertRaises(CalledProcessError):
+            self.client.upload_stream(io.BytesIO(b"video"), "video/mp4", None, check)
+
+        # the final chunk would have published the truncated video
+        mock_put.assert_not_called()
+        mock_delete.assert_called_once()
+        self.assertEqual(
+            mock_delete.call_args[0][0], "https://upload.example.com/session"
+        )
+
+
+class TestYouTubeSyncMetadata(unittest.TestCase):
+    def setUp(self):
+        self.client = YoutubeAPI(
+            mock.Mock(), None, {"youtube": {}}, "my-client", "my-secret"
+        )
+        self.client._build_metadata = mock.Mock(
+            return_value={
+                "snippet": {"channelId": "my-channel", "title": "Test Event"},
+                "status": {
+                    "privacyStatus": "private",
+                    "publishAt": "2023-01-02T12:00:00",
+                },
+                "recordingDetails": {
+                    "recordingDate": rfc3339("2023-01-01T23:42:42+0100")
+                },
+            }
+        )
+        self.client.update_metadata = mock.Mock()
+
+    def test_keeps_scheduled_video_public(self):
+        self.client.get_video = mock.Mock(
+            return_value={
+                "snippet": {"title": "Old Title"},
+                "status": {"privacyStatus": "public"},
+                "recordingDetails": {"recordingDate": "2023-01-01T22:42:42Z"},
+            }
+        )
+
+        self.assertTrue(self.client._sync_video_metadata("abc", None))
+        self.client.update_metadata.assert_called_once_with(
+            {"id": "abc", "snippet": {"title": "Test Event"}}
+        )
+
+    def test_up_to_date(self):
+        self.client.get_video = mock.Mock(
+            return_value={
+                "snippet": {"title": "Test Event"},
+                "status": {"privacyStatus": "public"},
+                "recordingDetails": {"recordingDate": "2023-01-01T22:42:42.000Z"},
+            }
+        )
+
+        self.assertFalse(self.client._sync_video_metadata("abc", None))
+        self.client.update_metadata.assert_not_called()
+
+
+class TestYouTubePlaylists(unittest.TestCase):
+    def setUp(self):
+        self.client = YoutubeAPI(
+            mock.Mock(), None, {"youtube": {}}, "my-client", "my-secret"
+        )
+        self.client.accessToken = "my-access-token"
+        self.client._use_quota = mock.Mock()
+        youtube_client._PLAYLIST_CACHE.clear()
+
+    def tearDown(self):
+        youtube_client._PLAYLIST_CACHE.clear()
+
+    def _items(self, *item_ids):
+        return mock.Mock(
+            status_code=200,
+            json=mock.Mock(return_value={"items": [{"id": i} for i in item_ids]}),
+        )
+
+    @mock.patch("requests.post")
+    @mock.patch("requests.get")
+    def test_checks_membership_of_the_video(self, mock_get, mock_post):
+        mock_get.return_value = self._items()
+        mock_post.return_value = mock.Mock(
+            status_code=200, json=mock.Mock(return_value={"id": "item-1"})
+        )
+
+        self.client.add_to_playlists("abc", ["pl"])
+        # the membership is cached, a retry adds nothing
+        self.client.add_to_playlists("abc", ["pl"])
+
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args.kwargs["params"]["videoId"], "abc")
+        mock_post.assert_called_once()
+
+    @mock.patch("requests.post")
+    @mock.patch("requests.get")
+    def test_cache_expires(self, mock_get, mock_post):
+        youtube_client._PLAYLIST_CACHE["pl", "abc"] = (
+            time() - youtube_client.PLAYLIST_CACHE_TTL,
+            [],
+        )
+        mock_get.return_value = self._items("item-1")
+
+        self.client.add_to_playlists("abc", ["pl"])
+
+        mock_get.assert_called_once()
+        mock_post.assert_not_called()
+
+    @mock.patch("requests.post")
+    @mock.patch("requests.get")
+    def test_forgets_playlist_if_adding_fails(self, mock_get, mock_post):
+        mock_get.return_value = self._items()
+        mock_post.return_value = mock.Mock(status_code=500, text="error")
+
+        with self.assertRaises(YouTubeException):
+            self.client.add_to_playlists("abc", ["pl"])
+        self.assertNotIn(("pl", "abc"), youtube_client._PLAYLIST_CACHE)
+
+
 if __name__ == "__main__":
     unittest.main()
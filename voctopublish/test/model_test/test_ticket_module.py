@@ -6,6 +6,7 @@ Created on Dec 11, 2016
 
 import unittest
 
+from model import ticket_module
 from model.ticket_module import Ticket, TicketException
 
 
@@ -81,6 +82,91 @@ class TestTicket(unittest.TestCase):
             Ticket(None, 1)
 
 
+class TestPropertyIndex(unittest.TestCase):
+    def test_case_insensitive(self):
+        index = ticket_module.PropertyIndex({"Fahrplan.Room": "HS1"})
+        self.assertEqual(index["fahrplan.room"], "HS1")
+        self.assertEqual(index.get("FAHRPLAN.ROOM"), "HS1")
+        self.assertIn("Fahrplan.room", index)
+        self.assertIsNone(index.get("Fahrplan.Title"))
+
+    def test_first_key_wins(self):
+        index = ticket_module.PropertyIndex({"Meta.Year": "2016", "meta.year": "2017"})
+        self.assertEqual(index["Meta.Year"], "2016")
+        self.assertEqual(len(index), 1)
+
+    def test_convert(self):
+        index = ticket_module.PropertyIndex(
+            {"Fahrplan.ID": 2342, "Fahrplan.Title": " x "}, str
+        )
+        self.assertEqual(index["fahrplan.id"], "2342")
+        self.assertEqual(index["fahrplan.title"], " x ")
+
+    def test_ticket_lookup(self):
+        t = Ticket({"Project.Slug": " rel-test ", "Fahrplan.ID": 2342}, 1, {})
+        self.assertEqual(t.acronym, "rel-test")
+        self.assertEqual(t._get_int("fahrplan.id"), 2342)
+
+    def test_ticket_default(self):
+        t = Ticket(
+            {"Project.Slug": "rel-test"},
+            1,
+            {"defaults": {"Publishing.YouTube.Enable": True}},
+        )
+        self.assertTrue(
+            t._get_bool("publishing.youtube.enable", optional=True, try_default=True)
+        )
+
+
+class TestPublishingTicketSections(unittest.TestCase):
+    def setUp(self):
+        self.properties = {
+            "Project.Slug": "rel-test",
+            "Fahrplan.ID": "2342",
+            "Fahrplan.GUID": "123456",
+            "Fahrplan.Title": "testi mc testface",
+            "Fahrplan.DateTime": "2023-01-01T23:42:42+0100",
+            "Fahrplan.Room": "HS1",
+            "Fahrplan.Slug": "supercon2023",
+            "Record.Language": "deu",
+            "Encoding.LanguageTemplate": "rel-test-2342-%s-testi_mc_testface",
+            "EncodingProfile.IsMaster": "yes",
+            "EncodingProfile.Extension": "mp4",
+            "EncodingProfile.Slug": "hd",
+            "EncodingProfile.Basename": "rel-test-2342-deu-testi_mc_testface_hd",
+            "EncodingProfile.MirrorFolder": "h264-hd",
+            "Publishing.Path": "/video/encoded/rel-test/",
+            "Publishing.YouTube.Enable": "yes",
+            "Publishing.YouTube.EnableProfile": "yes",
+            "Publishing.Voctoweb.Enable": "no",
+            "Publishing.Rclone.Enable": "no",
+        }
+
+    def test_sections_are_lazy(self):
+        # the YouTube token is missing, but nothing needs it yet
+        t = ticket_module.PublishingTicket(self.properties, 1, {})
+        self.assertTrue(t.youtube_enable)
+        self.assertRaises(TicketException, getattr, t, "youtube_token")
+        with self.assertRaises(TicketException):
+            t.validate()
+
+    def test_sections_are_cached(self):
+        self.properties["Publishing.YouTube.Token"] = "token"
+        self.properties["Publishing.YouTube.Category"] = "27"
+        self.properties["Publishing.YouTube.Privacy"] = "public"
+        t = ticket_module.PublishingTicket(self.properties, 1, {})
+        t.validate()
+        self.assertIs(t.youtube, t.youtube)
+        self.assertEqual(t.youtube_token, "token")
+        self.assertEqual(t.youtube.token, "token")
+        self.assertIn("2023", t.youtube_tags)
+
+    def test_disabled_section(self):
+        t = ticket_module.PublishingTicket(self.properties, 1, {})
+        self.assertRaises(TicketException, getattr, t, "voctoweb")
+        self.assertRaises(AttributeError, getattr, t, "does_not_exist")
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
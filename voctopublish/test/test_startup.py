@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import unittest
+from importlib.util import find_spec
+
+VOCTOPUBLISH_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(os.path.dirname(VOCTOPUBLISH_PATH), "config.example.toml")
+
+# modules only some tickets need, importing voctopublish.py must not load
+# them. Publishing targets get imported when a ticket uses them.
+LAZY_MODULES = (
+    "requests",
+    "paramiko",
+    "mastodon",
+    "PIL",
+    "langcodes",
+    "api_client.youtube_client",
+    "api_client.voctoweb_client",
+    "api_client.rclone_client",
+    "api_client.webhook_client",
+    "tools.thumbnails",
+)
+
+
+@unittest.skipUnless(find_spec("c3tt_rpc_client"), "c3tt_rpc_client not installed")
+class TestStartup(unittest.TestCase):
+    def _imported_modules(self):
+        """
+        import voctopublish in a fresh interpreter
+        :return: names of all modules loaded afterwards
+        """
+        proc = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, voctopublish; print(' '.join(sys.modules))",
+            ],
+            cwd=VOCTOPUBLISH_PATH,
+            env=dict(os.environ, VOCTOPUBLISH_CONFIG=CONFIG_PATH),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return proc.stdout.split()
+
+    def test_lazy_modules(self):
+        modules = self._imported_modules()
+        self.assertIn("voctopublish", modules)
+        self.assertEqual([m for m in LAZY_MODULES if m in modules], [])
@@ -0,0 +1,179 @@
+import os
+import stat
+import unittest
+from tempfile import TemporaryDirectory
+from time import sleep
+from unittest.mock import MagicMock
+
+from tools.announcement_queue import AnnouncementQueue, AnnouncementSender
+from tools.announcements import make_digest
+
+
+class TestAnnouncementQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.queue = AnnouncementQueue(os.path.join(self.tmpdir.name, "queue.sqlite"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_not_readable_for_others(self):
+        self.queue.put("webhook", {"auth": ["user", "secret"]})
+        # the -wal and -shm files only exist while the queue is open
+        with self.queue._connect() as db:
+            db.execute("SELECT COUNT(*) FROM announcements").fetchone()
+            for suffix in ("", "-wal", "-shm"):
+                mode = os.stat(self.queue.path + suffix).st_mode
+                self.assertEqual(stat.S_IMODE(mode), 0o600)
+
+    def test_delivers_and_removes(self):
+        post = MagicMock()
+        self.queue.put("mastodon", {"message": "hello"})
+        sender = AnnouncementSender(self.queue, {}, {"mastodon": post})
+
+        self.assertEqual(sender.deliver_due(), 1)
+        post.assert_called_once_with({"message": "hello"}, {})
+        self.assertEqual(self.queue.pending(), 0)
+
+    def test_retries_later(self):
+        post = MagicMock(side_effect=ConnectionError())
+        self.queue.put("bluesky", {"message": "hello"})
+        sender = AnnouncementSender(self.queue, {}, {"bluesky": post})
+
+        self.assertEqual(sender.deliver_due(), 0)
+        # not due again before the backoff delay
+        self.assertEqual(sender.deliver_due(), 0)
+        post.assert_called_once()
+        self.assertEqual(self.queue.pending(), 1)
+
+    def test_gives_up(self):
+        post = MagicMock(side_effect=ConnectionError())
+        self.queue.put("bluesky", {"message": "hello"})
+        sender = AnnouncementSender(
+            self.queue, {"announcements": {"max_attempts": 1}}, {"bluesky": post}
+        )
+
+        sender.deliver_due()
+        self.assertEqual(self.queue.pending(), 0)
+
+    def test_rate_limit(self):
+        post = MagicMock()
+        self.queue.put("mastodon", {"message": "one"})
+        self.queue.put("mastodon", {"message": "two"})
+        sender = AnnouncementSender(
+            self.queue,
+            {"announcements": {"rate_limit": {"mastodon": 60}}},
+            {"mastodon": post},
+        )
+
+        self.assertEqual(sender.deliver_due(), 1)
+        post.assert_called_once_with({"message": "one"}, sender.config)
+        self.assertEqual(self.queue.pending(), 1)
+
+    def test_coalesces_bursts(self):
+        post = MagicMock()
+        sender = AnnouncementSender(self.queue, {}, {"mastodon": post})
+        for i in range(3):
+            self.queue.put("mastodon", _item(i), "jev22", 0.2)
+
+        # the first release gets announced right away, the others are collected
+        self.assertEqual(sender.deliver_due(), 1)
+        post.assert_called_once()
+        self.assertEqual(post.call_args[0][0]["message"], "talk 0 released")
+
+        sleep(0.3)
+        self.assertEqual(sender.deliver_due(), 2)
+        self.assertEqual(post.call_count, 2)
+        digest = post.call_args[0][0]["message"]
+        self.assertIn("talk 1 https://example.com/v/1", digest)
+        self.assertIn("talk 2 https://example.com/v/2", digest)
+
+    def test_retries_only_unsent_digest_messages(self):
+        post = MagicMock(side_effect=[None, ConnectionError(), None])
+        sender = AnnouncementSender(self.queue, {}, {"mastodon": post})
+        for i in range(1, 7):
+            self.queue.put("mastodon", _item(i, max_length=100), "jev22", 0.2, True)
+        sleep(0.3)
+
+        # the 6 releases need 3 digest messages, the second one fails
+        self.assertEqual(sender.deliver_due(), 2)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(self.queue.pending(), 4)
+
+    def test_groups_are_separate(self):
+        post = MagicMock()
+        sender = AnnouncementSender(self.queue, {}, {"mastodon": post})
+        self.queue.put("mastodon", _item(1), "jev22", 60)
+        self.queue.put("mastodon", _item(2), "38c3", 60)
+
+        self.assertEqual(sender.deliver_due(), 2)
+
+    def test_concurrency_per_target(self):
+        for url in (
+            "https://a.example.com",
+            "https://a.example.com",
+            "https://b.example.com",
+        ):
+            self.queue.put("webhook", {"url": url}, target=url)
+
+        first = self.queue.claim(concurrency={"webhook": 1})
+        second = self.queue.claim(concurrency={"webhook": 1})
+        self.assertEqual(first[2], [{"url": "https://a.example.com"}])
+        self.assertEqual(second[2], [{"url": "https://b.example.com"}])
+        # the second request to a.example.com waits for the first one
+        self.assertIsNone(self.queue.claim(concurrency={"webhook": 1}))
+
+        self.queue.done(first[0][0])
+        self.assertIsNotNone(self.queue.claim(concurrency={"webhook": 1}))
+
+    def test_collect_batch(self):
+        post = MagicMock()
+        sender = AnnouncementSender(
+            self.queue,
+            {},
+            {"webhook": post},
+            settings={},
+            combine=lambda service, payloads: [
+                (range(len(payloads)), {"json": [p["json"] for p in payloads]})
+            ],
+        )
+        for i in range(2):
+            self.queue.put("webhook", {"json": i}, "https://a.example.com", 0.2, True)
+
+        # batches are collected even if there was no release before
+        self.assertEqual(sender.deliver_due(), 0)
+        sleep(0.3)
+        self.assertEqual(sender.deliver_due(), 2)
+        post.assert_called_once_with({"json": [0, 1]}, {})
+
+
+class TestMakeDigest(unittest.TestCase):
+    def test_fits_max_length(self):
+        items = [_item(i, max_length=100) for i in range(10)]
+        messages = make_digest(items)
+
+        self.assertGreater(len(messages), 1)
+        for message in messages:
+            self.assertLessEqual(len(message), 100)
+            self.assertTrue(message.startswith("New releases of #jev22:"))
+        for i in range(10):
+            self.assertEqual(
+                sum(f"https://example.com/v/{i}" in m for m in messages), 1
+            )
+
+    def test_shortens_long_titles(self):
+        item = _item(1, max_length=80)
+        item["title"] = "x" * 200
+        (message,) = make_digest([item])
+        self.assertLessEqual(len(message), 80)
+        self.assertTrue(message.endswith("... https://example.com/v/1"))
+
+
+def _item(i, max_length=500):
+    return {
+        "message": f"talk {i} released",
+        "title": f"talk {i}",
+        "url": f"https://example.com/v/{i}",
+        "acronym": "jev22",
+        "max_length": max_length,
+    }
@@ -0,0 +1,85 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock
+from xmlrpc.client import Fault
+
+from tools.bulk_operations import read_operations, retries_for, with_retries
+
+
+class TestReadOperations(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_csv(self):
+        path = self._write(
+            "ops.csv",
+            "task,ticket,prop:Record.Room\nset-properties,12,hs1\ntask=set-done,13,\n",
+        )
+        self.assertEqual(
+            read_operations(path),
+            [
+                (
+                    2,
+                    {
+                        "task": "set-properties",
+                        "ticket": 12,
+                        "prop": {"Record.Room": "hs1"},
+                    },
+                ),
+                (3, {"task": "set-done", "ticket": 13, "prop": {}}),
+            ],
+        )
+
+    def test_jsonl(self):
+        path = self._write(
+            "ops.jsonl",
+            '{"task": "add-profile", "ticket": "12", "profile": 3}\n'
+            "\n"
+            '{"task": "get-properties", "ticket": 13}\n',
+        )
+        self.assertEqual(
+            read_operations(path),
+            [
+                (1, {"task": "add-profile", "ticket": 12, "profile": 3}),
+                (3, {"task": "get-properties", "ticket": 13}),
+            ],
+        )
+
+    def test_missing_task(self):
+        path = self._write("ops.jsonl", '{"ticket": 12}\n')
+        with self.assertRaisesRegex(ValueError, "ops.jsonl:1"):
+            read_operations(path)
+
+
+class TestWithRetries(unittest.TestCase):
+    def test_retries_transient_errors(self):
+        fn = MagicMock(side_effect=[ConnectionError(), "ok"])
+        self.assertEqual(with_retries(fn, retries=1, delay=0), "ok")
+        self.assertEqual(fn.call_count, 2)
+
+    def test_gives_up(self):
+        fn = MagicMock(side_effect=TimeoutError())
+        with self.assertRaises(TimeoutError):
+            with_retries(fn, retries=2, delay=0)
+        self.assertEqual(fn.call_count, 3)
+
+    def test_no_retry_for_creating_tickets(self):
+        self.assertEqual(retries_for({"task": "set-properties"}, 3), 3)
+        self.assertEqual(retries_for({"task": "add-profile"}, 3), 0)
+        self.assertEqual(retries_for({"task": "add-ticket"}, 3), 0)
+
+    def test_no_retry_for_tracker_faults(self):
+        fn = MagicMock(side_effect=Fault(1, "ticket not found"))
+        with self.assertRaises(Fault):
+            with_retries(fn, retries=2, delay=0)
+        fn.assert_called_once()
@@ -0,0 +1,94 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from tools import download
+
+
+class TestProbe(unittest.TestCase):
+    @mock.patch("requests.head")
+    def test_has_timeout(self, mock_head):
+        mock_head.return_value = mock.Mock(
+            headers={"content-length": "42", "accept-ranges": "bytes"}
+        )
+
+        self.assertEqual(download.probe("https://example.com/a.ts")["size"], 42)
+        self.assertEqual(mock_head.call_args.kwargs["timeout"], download.TIMEOUT)
+
+
+class _Server:
+    """
+    serves content over mocked requests, range requests starting at or after
+    fail_from fail like a dropped connection
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.fail_from = None
+        self.ranges = []
+
+    def head(self, url, **kwargs):
+        return mock.Mock(
+            headers={
+                "content-length": str(len(self.content)),
+                "accept-ranges": "bytes",
+                "etag": '"v1"',
+            }
+        )
+
+    def get(self, url, headers=None, **kwargs):
+        first, last = map(int, headers["Range"][len("bytes=") :].split("-"))
+        self.ranges.append(first)
+        if self.fail_from is not None and first >= self.fail_from:
+            raise ConnectionError("connection dropped")
+        body = self.content[first : last + 1]
+        r = mock.MagicMock(status_code=206, content=body)
+        r.__enter__.return_value = r
+        r.iter_content.return_value = [body]
+        return r
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.target = os.path.join(self.tmpdir.name, "uncut.ts")
+        self.server = _Server(os.urandom(9 << 19))  # 4.5 MiB
+        patches = [
+            mock.patch("requests.head", self.server.head),
+            mock.patch("requests.get", self.server.get),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _resume(self):
+        status, offset = download.check_existing("https://a/b.ts", self.target)
+        self.assertEqual((status, offset), (download.RESUME, 3 << 19))
+        download.download(
+            "https://a/b.ts", self.target, 1, segment_size=1, offset=offset
+        )
+
+    def test_interrupted_twice(self):
+        # e.g. downloaded by an external tool, which stopped after 1.5 MiB
+        with open(self.target, "wb") as f:
+            f.write(self.server.content[: 3 << 19])
+
+        # the segments start at 1.5, 2.5 and 3.5 MiB
+        self.server.fail_from = 5 << 19
+        with self.assertRaises(ConnectionError):
+            self._resume()
+        self.server.fail_from = 7 << 19
+        with self.assertRaises(ConnectionError):
+            self._resume()
+        self.server.fail_from = None
+        self.server.ranges = []
+        self._resume()
+
+        # neither the prefix nor the finished segments are fetched again
+        self.assertEqual(self.server.ranges, [7 << 19])
+        with open(self.target, "rb") as f:
+            self.assertEqual(f.read(), self.server.content)
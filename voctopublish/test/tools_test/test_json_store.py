@@ -0,0 +1,50 @@
+import os
+import stat
+import unittest
+from tempfile import TemporaryDirectory
+
+from tools.json_store import JsonStore
+
+
+class TestJsonStore(unittest.TestCase):
+    def test_persists_entries(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tokens.json")
+            with JsonStore(path).entries() as entries:
+                entries["foo"] = {"access_token": "bar"}
+
+            with JsonStore(path).entries() as entries:
+                self.assertEqual(entries, {"foo": {"access_token": "bar"}})
+
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+    def test_discards_changes_on_error(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tokens.json")
+            with self.assertRaises(RuntimeError):
+                with JsonStore(path).entries() as entries:
+                    entries["foo"] = {}
+                    raise RuntimeError()
+
+            with JsonStore(path).entries() as entries:
+                self.assertEqual(entries, {})
+
+    def test_stores_are_locked_separately(self):
+        with TemporaryDirectory() as tmpdir:
+            tokens = JsonStore(os.path.join(tmpdir, "tokens.json"))
+            ledger = JsonStore(os.path.join(tmpdir, "quota.json"))
+            with tokens.entries() as entries:
+                # would block forever if both shared a lock
+                with ledger.entries() as used:
+                    used["foo"] = 1
+                entries["foo"] = {}
+
+            with ledger.entries() as used:
+                self.assertEqual(used, {"foo": 1})
+
+    def test_key_does_not_contain_secret(self):
+        self.assertNotIn("secret", JsonStore.key("secret"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tools.property_buffer import PropertyBuffer
+
+
+class TestPropertyBuffer(unittest.TestCase):
+    def setUp(self):
+        self.c3tt = MagicMock()
+        self.buffer = PropertyBuffer(
+            self.c3tt, 42, {"Voctoweb.EventId": "23", "Record.Room": "hs1"}
+        )
+
+    def test_single_call(self):
+        self.buffer.set({"Voctoweb.RecordingId.Master": "1"})
+        self.buffer.set({"Webhook.StatusCode": 200})
+        self.c3tt.set_ticket_properties.assert_not_called()
+
+        self.buffer.flush()
+        self.c3tt.set_ticket_properties.assert_called_once_with(
+            42, {"Voctoweb.RecordingId.Master": "1", "Webhook.StatusCode": 200}
+        )
+
+    def test_drops_known_values(self):
+        self.buffer.set({"voctoweb.eventid": 23, "Record.Room": "hs2"})
+        self.assertEqual(self.buffer.pending, {"Record.Room": "hs2"})
+
+        self.buffer.flush()
+        self.buffer.set({"Record.Room": "hs2"})
+        self.buffer.flush()
+        self.c3tt.set_ticket_properties.assert_called_once_with(
+            42, {"Record.Room": "hs2"}
+        )
+
+    def test_empty_flush(self):
+        self.buffer.flush()
+        self.c3tt.set_ticket_properties.assert_not_called()
@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from threading import Event, Thread
+from time import time
+
+from tools.announcements import split_digest
+
+LOG = logging.getLogger("AnnouncementQueue")
+
+DEFAULT_QUEUE = "~/.cache/voctopublish/announcements.sqlite"
+DEFAULT_MAX_ATTEMPTS = 10
+# seconds, doubled after every failed attempt
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 3600
+# seconds an announcement stays claimed by one sender
+LEASE_TIME = 300
+POLL_INTERVAL = 5
+
+
+class AnnouncementQueue:
+    """
+    durable queue of rendered announcements, stored in a SQLite database.
+    Multiple workers on the same machine can share one queue. Also used as
+    outbox for webhooks.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or DEFAULT_QUEUE)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # payloads may contain webhook credentials, don't make them readable
+        # for others. SQLite creates the -wal and -shm files with the
+        # permissions of the database, files of older versions get fixed.
+        os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.chmod(self.path + suffix, 0o600)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS announcements (
+                    id INTEGER PRIMARY KEY,
+                    service TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    next_attempt REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    last_error TEXT,
+                    coalesce_group TEXT,
+                    target TEXT
+                )"""
+            )
+            # add columns missing in queues created by older versions
+            columns = [row[1] for row in db.execute("PRAGMA table_info(announcements)")]
+            for column in ("coalesce_group", "target"):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE announcements ADD COLUMN {column} TEXT")
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS coalesce_groups (
+                    coalesce_group TEXT PRIMARY KEY,
+                    last_created REAL NOT NULL
+                )"""
+            )
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS services (
+                    service TEXT PRIMARY KEY,
+                    last_sent REAL NOT NULL
+                )"""
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def put(self, service, payload, group=None, window=0, collect=False, target=None):
+        """
+        add an announcement to the queue
+        :param service: name of the service which should deliver it
+        :param payload: json serializable data the service needs to deliver it
+        :param group: announcements of the same group which get queued within
+            window seconds of each other are delivered together as a digest
+        :param window: seconds, 0 disables coalescing
+        :param collect: always wait window seconds for more announcements of
+            the group, instead of delivering the first one right away
+        :param target: concurrent deliveries to the same target can be
+            limited, see claim()
+        """
+        now = time()
+        next_attempt = now
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if group and window:
+                    group = f"{service}:{group}"
+                    (collecting,) = db.execute(
+                        "SELECT MAX(next_attempt) FROM announcements "
+                        "WHERE coalesce_group = ? AND state = 'pending' AND attempts = 0",
+                        (group,),
+                    ).fetchone()
+                    last = db.execute(
+                        "SELECT last_created FROM coalesce_groups WHERE coalesce_group = ?",
+                        (group,),
+                    ).fetchone()
+                    if collecting and collecting > now:
+                        # join the digest which is currently being collected
+                        next_attempt = collecting
+                    elif collect or (last and last[0] + window > now):
+                        # second release within the window: start collecting a digest
+                        next_attempt = now + window
+                    db.execute(
+                        "INSERT OR REPLACE INTO coalesce_groups (coalesce_group, last_created) "
+                        "VALUES (?, ?)",
+                        (group, now),
+                    )
+                else:
+                    group = None
+                db.execute(
+                    "INSERT INTO announcements "
+                    "(service, payload, created, next_attempt, coalesce_group, target) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (service, json.dumps(payload), now, next_attempt, group, target),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        LOG.info(f"queued announcement for {service}, due in {next_attempt - now:.0f}s")
+
+    def claim(self, rate_limits=None, concurrency=None):
+        """
+        claim the oldest due announcement of a service which is not rate
+        limited, together with all other due announcements of its group
+        :param rate_limits: dict of service => minimum seconds between two announcements
+        :param concurrency: dict of service => maximum number of announcements
+            which get delivered to the same target at the same time
+        :return: tuple of ids, service, payloads and attempts or None
+        """
+        rate_limits = rate_limits or {}
+        concurrency = concurrency or {}
+        now = time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                sending = dict(
+                    db.execute(
+                        "SELECT target, COUNT(*) FROM announcements "
+                        "WHERE state = 'sending' AND next_attempt > ? AND target IS NOT NULL "
+                        "GROUP BY target",
+                        (now,),
+                    ).fetchall()
+                )
+                rows = db.execute(
+                    "SELECT a.id, a.service, a.payload, a.attempts, a.coalesce_group, a.target, s.last_sent "
+                    "FROM announcements a LEFT JOIN services s USING (service) "
+                    # announcements stay in state 'sending' if a sender died
+                    # while delivering them, retry those after the lease expired
+                    "WHERE a.state IN ('pending', 'sending') AND a.next_attempt <= ? "
+                    "ORDER BY a.next_attempt",
+                    (now,),
+                ).fetchall()
+                for id_, service, payload, attempts, group, target, last_sent in rows:
+                    if last_sent and last_sent + rate_limits.get(service, 0) > now:
+                        continue
+                    if (
+                        target
+                        and service in concurrency
+                        and sending.get(target, 0) >= concurrency[service]
+                    ):
+                        continue
+                    claimed = [(id_, payload)]
+                    if group:
+                        claimed += [
+                            (i, p)
+                            for i, _, p, _, g, _, _ in rows
+                            if g == group and i != id_
+                        ]
+                    db.executemany(
+                        "UPDATE announcements SET next_attempt = ?, state = 'sending' "
+                        "WHERE id = ?",
+                        [(now + LEASE_TIME, i) for i, _ in claimed],
+                    )
+                    db.execute(
+                        "INSERT OR REPLACE INTO services (service, last_sent) VALUES (?, ?)",
+                        (service, now),
+                    )
+                    db.execute("COMMIT")
+                    return (
+                        [i for i, _ in claimed],
+                        service,
+                        [json.loads(p) for _, p in claimed],
+                        attempts,
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return None
+
+    def done(self, id_):
+        with self._connect() as db:
+            db.execute("DELETE FROM announcements WHERE id = ?", (id_,))
+
+    def retry(self, id_, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        schedule another attempt with exponential backoff, or give up after
+        max_attempts. Failed announcements are kept in the database.
+        """
+        with self._connect() as db:
+            (attempts,) = db.execute(
+                "SELECT attempts + 1 FROM announcements WHERE id = ?", (id_,)
+            ).fetchone()
+            delay = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+            state = "failed" if attempts >= max_attempts else "pending"
+            db.execute(
+                "UPDATE announcements SET attempts = ?, next_attempt = ?, state = ?, "
+                "last_error = ? WHERE id = ?",
+                (attempts, time() + delay, state, str(error), id_),
+            )
+        return state
+
+    def pending(self):
+        """
+        :return: number of announcements which still have to be delivered
+        """
+        with self._connect() as db:
+            return db.execute(
+                "SELECT COUNT(*) FROM announcements WHERE state != 'failed'"
+            ).fetchone()[0]
+
+
+def combine_digest(service, payloads):
+    """
+    default for AnnouncementSender.combine, turns multiple announcements
+    into digest messages
+    """
+    return [(indexes, {"message": m}) for indexes, m in split_digest(payloads)]
+
+
+class AnnouncementSender(Thread):
+    """
+    delivers queued announcements in the background
+    """
+
+    def __init__(
+        self,
+        queue,
+        config,
+        services,
+        settings=None,
+        combine=combine_digest,
+        name="AnnouncementSender",
+    ):
+        """
+        :param queue: AnnouncementQueue
+        :param config: full voctopublish config
+        :param services: dict of service name => function(payload, config)
+            which delivers an announcement and raises if that fails
+        :param settings: dict with rate_limit, concurrency and max_attempts,
+            defaults to the [announcements] table of the config
+        :param combine: function(service, payloads) which combines the
+            payloads of a coalesced group into the payloads to deliver. It
+            returns a list of tuples of the indexes of the payloads which
+            got combined and the payload to deliver instead of them.
+        """
+        super().__init__(name=name, daemon=True)
+        self.queue = queue
+        self.config = config
+        self.services = services
+        self.combine = combine
+        if settings is None:
+            settings = config.get("announcements", {})
+        self.rate_limits = settings.get("rate_limit", {})
+        self.concurrency = settings.get("concurrency", {})
+        self.max_attempts = settings.get("max_attempts", DEFAULT_MAX_ATTEMPTS)
+        self._stop_event = Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.deliver_due()
+            except Exception:
+                LOG.exception("delivering announcements failed")
+            self._stop_event.wait(POLL_INTERVAL)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def deliver_due(self):
+        """
+        deliver all announcements which are due and not rate limited
+        :return: number of delivered announcements
+        """
+        delivered = 0
+        while True:
+            claimed = self.queue.claim(self.rate_limits, self.concurrency)
+            if claimed is None:
+                break
+            ids, service, payloads, attempts = claimed
+            if service not in self.services:
+                for id_ in ids:
+                    self.queue.retry(id_, f"unknown service {service}", 0)
+                continue
+            if len(payloads) > 1:
+                LOG.info(f"coalescing {len(payloads)} {service} announcements")
+                combined = self.combine(service, payloads)
+            else:
+                combined = [([0], payloads[0])]
+            sent = []
+            try:
+                for indexes, payload in combined:
+                    self.services[service](payload, self.config)
+                    # a retry must not deliver this message again
+                    for i in indexes:
+                        self.queue.done(ids[i])
+                        sent.append(ids[i])
+            except Exception as e:
+                unsent = [id_ for id_ in ids if id_ not in sent]
+                for id_ in unsent:
+                    state = self.queue.retry(id_, repr(e), self.max_attempts)
+                LOG.exception(
+                    f"{service} announcement {unsent} failed (attempt {attempts + 1}), {state}"
+                )
+            else:
+                LOG.info(f"delivered {service} announcement {ids}")
+            delivered += len(sent)
+        return delivered
@@ -29,14 +29,11 @@ def _replace_special_chars(maybe_string):
     return sub(r"[^A-Za-z0-9]+", "", string)
 
 
-def make_message(ticket, config, max_length=None):
-    if max_length is None:
-        # if max_length is not set, set it to something very big here.
-        # saves us a bunch of isinstance() calls below
-        max_length = 1_000_000
-
-    LOG.info(f"generating announcement message with max length of {max_length} chars")
-
+def release_urls(ticket, config):
+    """
+    :return: tuple of the names of the platforms the ticket got released on
+        and the urls of the release there
+    """
     targets = []
     urls = []
     if ticket.voctoweb_enable:
@@ -51,6 +48,18 @@ def make_message(ticket, config, max_length=None):
 
     if not targets:
         raise EmptyAnnouncementMessage()
+    return targets, urls
+
+
+def make_message(ticket, config, max_length=None):
+    if max_length is None:
+        # if max_length is not set, set it to something very big here.
+        # saves us a bunch of isinstance() calls below
+        max_length = 1_000_000
+
+    LOG.info(f"generating announcement message with max length of {max_length} chars")
+
+    targets, urls = release_urls(ticket, config)
 
     if ticket.url:
         urls.append(ticket.url)
@@ -80,3 +89,71 @@ def make_message(ticket, config, max_length=None):
 
     LOG.info(f"{len(message)} chars: {message}")
     return message
+
+
+def make_digest_item(ticket, config, message, max_length):
+    """
+    :return: payload for the announcement queue, containing the message for
+        a single release and everything make_digest() needs
+    """
+    _, urls = release_urls(ticket, config)
+    return {
+        "message": message,
+        "title": ticket.title,
+        "url": urls[0],
+        "acronym": ticket.acronym,
+        "max_length": max_length,
+    }
+
+
+def make_digest(items):
+    """
+    combine the announcements of multiple releases into as few messages as
+    possible, each of them fitting into max_length
+    :param items: list of dicts created by make_digest_item()
+    :return: list of messages
+    """
+    return [message for _, message in split_digest(items)]
+
+
+def split_digest(items):
+    """
+    like make_digest(), but also tells which items ended up in which message
+    :param items: list of dicts created by make_digest_item()
+    :return: list of tuples of the indexes of the items and the message
+    """
+    messages = []
+    header = None
+    current = None
+    for i, item in enumerate(items):
+        if "title" not in item or "url" not in item:
+            # no details, announce it on its own
+            messages.append(([i], item["message"]))
+            continue
+
+        max_length = item["max_length"]
+        if header is None:
+            header = "New releases"
+            if item.get("acronym"):
+                header += " of #" + _replace_special_chars(item["acronym"])
+            header += ":"
+
+        title = item["title"]
+        length_for_title = max_length - len(header) - len(item["url"]) - 2
+        if len(title) > length_for_title:
+            title = title[0 : length_for_title - 3] + "..."
+        line = "\n" + title + " " + item["url"]
+
+        if current is not None and len(current[1]) + len(line) > max_length:
+            messages.append(current)
+            current = None
+        if current is None:
+            current = ([], header)
+        current = (current[0] + [i], current[1] + line)
+
+    if current is not None:
+        messages.append(current)
+
+    for _, message in messages:
+        LOG.info(f"{len(message)} chars: {message}")
+    return messages
@@ -0,0 +1,104 @@
+import csv
+import json
+import logging
+import time
+from xmlrpc.client import ProtocolError
+
+LOG = logging.getLogger("BulkOperations")
+
+# arguments which are integers on the command line
+INT_FIELDS = ("ticket", "profile", "fahrplan_id", "project")
+# csv columns starting with this are ticket properties
+PROPERTY_PREFIX = "prop:"
+DEFAULT_RETRIES = 3
+# tasks which may run more than once. The others create tickets, a retry
+# after a lost response would create them twice.
+IDEMPOTENT_TASKS = ("get-properties", "set-properties", "set-done")
+# seconds, doubled after every failed attempt
+RETRY_DELAY = 2
+
+
+def read_operations(path):
+    """
+    read operations from a CSV file with a header row, or from a file with
+    one JSON object per line. Every operation has a task and the arguments
+    of the task, e.g. ticket. Properties are a "prop" object in JSON and
+    columns like "prop:Record.Room" in CSV, empty cells are ignored.
+    :param path: CSV if it ends with .csv, JSON lines otherwise
+    :return: list of (line number, operation)
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            rows = enumerate(map(_from_csv, csv.DictReader(f)), 2)
+        else:
+            rows = (
+                (n, json.loads(line)) for n, line in enumerate(f, 1) if line.strip()
+            )
+        operations = []
+        for n, row in rows:
+            try:
+                operations.append((n, _normalize(row)))
+            except ValueError as e:
+                raise ValueError(f"{path}:{n}: {e}") from e
+        return operations
+
+
+def _from_csv(row):
+    operation = {"prop": {}}
+    for k, v in row.items():
+        if v is None or v == "":
+            continue
+        if k.startswith(PROPERTY_PREFIX):
+            operation["prop"][k[len(PROPERTY_PREFIX) :]] = v
+        else:
+            operation[k] = v
+    return operation
+
+
+def _normalize(operation):
+    if not operation.get("task"):
+        raise ValueError("operation has no task")
+    # the same names as on the command line are accepted
+    operation["task"] = operation["task"].removeprefix("task=")
+    for k in INT_FIELDS:
+        if operation.get(k) not in (None, ""):
+            operation[k] = int(operation[k])
+    return operation
+
+
+def is_transient(e):
+    """
+    network and HTTP errors are worth another try, faults reported by the
+    tracker itself are not
+    """
+    while e is not None:
+        if isinstance(e, (OSError, ProtocolError)):
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+
+def retries_for(operation, retries=DEFAULT_RETRIES):
+    """
+    :return: how often the operation may be retried, 0 if running it twice
+        would have a different effect than running it once
+    """
+    return retries if operation["task"] in IDEMPOTENT_TASKS else 0
+
+
+def with_retries(fn, retries=DEFAULT_RETRIES, delay=RETRY_DELAY):
+    """
+    call fn until it succeeds, retrying transient failures
+    :param retries: maximum number of additional attempts
+    :return: the result of fn
+    """
+    attempt = 1
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt > retries or not is_transient(e):
+                raise
+            LOG.warning(f"attempt {attempt} failed with {e!r}, retrying")
+            time.sleep(delay * 2 ** (attempt - 1))
+            attempt += 1
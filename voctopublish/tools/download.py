@@ -0,0 +1,280 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic
+
+import requests
+
+LOG = logging.getLogger("download")
+
+DEFAULT_CONNECTIONS = 4
+# MiB, each connection downloads segments of this size
+DEFAULT_SEGMENT_SIZE = 64
+BUFFER_SIZE = 1024 * 1024
+# number of bytes compared to check whether a local file is a prefix of the
+# remote file
+PREFIX_CHECK_SIZE = 64 * 1024
+# seconds to connect and to wait for the next data, a stalled connection
+# would block its worker forever otherwise
+TIMEOUT = (10, 60)
+
+# results of check_existing()
+CURRENT = "current"
+RESUME = "resume"
+CHANGED = "changed"
+
+
+class DownloadException(Exception):
+    pass
+
+
+def download(url, target, connections=DEFAULT_CONNECTIONS, segment_size=None, offset=0):
+    """
+    download url to target using multiple concurrent range requests.
+    Falls back to a single request if the server does not support ranges.
+
+    Progress is recorded in a state file next to the target, so an
+    interrupted download resumes where it stopped, as long as the remote
+    file did not change (same size and ETag).
+    :param url:
+    :param target: path of the downloaded file
+    :param connections: number of concurrent connections
+    :param segment_size: size of the segments in MiB
+    :param offset: number of bytes at the start of target which are already
+        downloaded, see check_existing()
+    :return: dict with size, etag and last_modified of the remote file
+    """
+    segment_size = int(segment_size or DEFAULT_SEGMENT_SIZE) << 20
+    remote = probe(url)
+    LOG.debug(f"{url} {remote=}")
+
+    start = monotonic()
+    if remote["size"] is None or not remote["ranges"]:
+        LOG.info("server does not support range requests, using single connection")
+        _download_single(url, target)
+    else:
+        _download_ranges(
+            url, target, remote, max(int(connections), 1), segment_size, offset
+        )
+
+    size = os.path.getsize(target)
+    if remote["size"] is not None and size != remote["size"]:
+        raise DownloadException(
+            f"downloaded {size} bytes, but server announced {remote['size']} bytes"
+        )
+
+    duration = max(monotonic() - start, 0.001)
+    LOG.info(
+        f"downloaded {(size - offset) / 2**20:.1f} MiB in {duration:.1f}s "
+        f"({(size - offset) / 2**20 / duration:.1f} MiB/s)"
+    )
+
+    # remember what we downloaded, so check_existing() can compare it later
+    _save_state(
+        target + ".source",
+        {
+            "url": url,
+            "size": size,
+            "etag": remote["etag"],
+            "last_modified": remote["last_modified"],
+        },
+    )
+    return remote
+
+
+def check_existing(url, target):
+    """
+    compare an already existing target with the remote file
+    :param url:
+    :param target: path of the downloaded file
+    :return: tuple of status and offset. Status is CURRENT if target matches
+        the remote file, RESUME if target is an incomplete download of it
+        which can be continued at offset, CHANGED otherwise.
+    """
+    remote = probe(url)
+    local_size = os.path.getsize(target)
+    LOG.debug(f"{target} has {local_size} bytes, {remote=}")
+
+    if remote["size"] is None:
+        return CHANGED, 0
+
+    state = _load_state(target + ".download")
+    if (
+        state.get("url") == url
+        and state.get("size") == remote["size"]
+        and state.get("etag") == remote["etag"]
+    ):
+        # interrupted download, _download_ranges() knows which parts are
+        # missing. It may have resumed an earlier download itself, in which
+        # case the parts before start are not in the state.
+        return RESUME, state.get("start", 0)
+
+    source = _load_state(target + ".source")
+    if source.get("url") == url and source.get("size") == remote["size"]:
+        if remote["etag"] or source.get("etag"):
+            same = source.get("etag") == remote["etag"]
+        else:
+            same = source.get("last_modified") == remote["last_modified"]
+        if same and local_size == remote["size"]:
+            return CURRENT, 0
+        if not same:
+            return CHANGED, 0
+
+    if local_size == remote["size"] and remote["last_modified"]:
+        # no fingerprint, e.g. downloaded by an external tool. If our file is
+        # newer than the remote one, assume nothing has changed
+        if os.path.getmtime(target) >= parsedate_to_datetime(
+            remote["last_modified"]
+        ).timestamp() and _is_prefix(url, target, local_size, remote):
+            return CURRENT, 0
+
+    if 0 < local_size < remote["size"] and remote["ranges"]:
+        if _is_prefix(url, target, local_size, remote):
+            return RESUME, local_size
+
+    return CHANGED, 0
+
+
+def _is_prefix(url, target, local_size, remote):
+    """
+    check whether the first and last bytes of target match the remote file at
+    the same position
+    """
+    if not remote["ranges"]:
+        return False
+    samples = {(0, min(PREFIX_CHECK_SIZE, local_size) - 1)}
+    samples.add((max(local_size - PREFIX_CHECK_SIZE, 0), local_size - 1))
+    with open(target, "rb") as fh:
+        for first, last in samples:
+            r = requests.get(
+                url, headers={"Range": f"bytes={first}-{last}"}, timeout=TIMEOUT
+            )
+            if r.status_code != 206:
+                return False
+            fh.seek(first)
+            if fh.read(last - first + 1) != r.content:
+                return False
+    return True
+
+
+def probe(url):
+    """
+    get size, ETag and Last-Modified of a remote file and check whether the
+    server supports range requests
+    :return: dict with size, etag, last_modified and ranges
+    """
+    r = requests.head(url, allow_redirects=True, timeout=TIMEOUT)
+    r.raise_for_status()
+    size = r.headers.get("content-length")
+    return {
+        "size": int(size) if size and size.isdigit() else None,
+        "etag": r.headers.get("etag"),
+        "last_modified": r.headers.get("last-modified"),
+        "ranges": r.headers.get("accept-ranges", "").lower() == "bytes",
+    }
+
+
+def _download_single(url, target):
+    with requests.get(url, stream=True, timeout=TIMEOUT) as r:
+        r.raise_for_status()
+        with open(target, "wb") as fh:
+            for chunk in r.iter_content(BUFFER_SIZE):
+                fh.write(chunk)
+
+
+def _download_ranges(url, target, remote, connections, segment_size, start=0):
+    segments = [
+        (offset, min(offset + segment_size, remote["size"]) - 1)
+        for offset in range(start, remote["size"], segment_size)
+    ]
+
+    state_file = target + ".download"
+    state = _load_state(state_file)
+    done = set()
+    if (
+        os.path.exists(target)
+        and state.get("url") == url
+        and state.get("size") == remote["size"]
+        and state.get("etag") == remote["etag"]
+        and state.get("segment_size") == segment_size
+        and state.get("start", 0) == start
+    ):
+        done = set(state.get("done", []))
+        LOG.info(f"resuming download, {len(done)}/{len(segments)} segments done")
+    else:
+        state = {
+            "url": url,
+            "size": remote["size"],
+            "etag": remote["etag"],
+            "segment_size": segment_size,
+            "start": start,
+            "done": [],
+        }
+
+    fd = os.open(target, os.O_RDWR | os.O_CREAT)
+    try:
+        if not done:
+            os.ftruncate(fd, start)
+            # allocate the whole file upfront, so we fail early if the disk
+            # is full and the file does not get fragmented
+            try:
+                os.posix_fallocate(fd, start, remote["size"] - start)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, remote["size"])
+
+        state_lock = Lock()
+
+        def fetch(index):
+            first, last = segments[index]
+            headers = {"Range": f"bytes={first}-{last}"}
+            if remote["etag"] or remote["last_modified"]:
+                # if the file changed, the server sends all of it with status 200
+                headers["If-Range"] = remote["etag"] or remote["last_modified"]
+            with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+                if r.status_code != 206:
+                    raise DownloadException(
+                        f"range request for bytes {first}-{last} returned "
+                        f"{r.status_code}, remote file changed?"
+                    )
+                offset = first
+                for chunk in r.iter_content(BUFFER_SIZE):
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+            if offset != last + 1:
+                raise DownloadException(
+                    f"segment {first}-{last} ended after {offset - first} bytes"
+                )
+            with state_lock:
+                state["done"].append(index)
+                _save_state(state_file, state)
+
+        state["done"] = sorted(done)
+        _save_state(state_file, state)
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            futures = [
+                executor.submit(fetch, i) for i in range(len(segments)) if i not in done
+            ]
+            for f in futures:
+                f.result()
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    os.remove(state_file)
+
+
+def _load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(path, state):
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
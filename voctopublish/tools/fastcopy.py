@@ -0,0 +1,84 @@
+import logging
+import os
+import shutil
+from fcntl import ioctl
+
+LOG = logging.getLogger("fastcopy")
+
+# ioctl to share the extents of a file on CoW filesystems (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def copy_file(source, target, hardlink=False):
+    """
+    copy source to target, using the cheapest method the filesystems offer:
+    a hardlink (if enabled and both are on the same filesystem), a reflink,
+    an in-kernel copy via copy_file_range() or a regular copy.
+    :param source:
+    :param target:
+    :param hardlink: allow hardlinking source to target
+    :return: name of the method used
+    """
+    if os.path.exists(target):
+        os.remove(target)
+
+    if hardlink and _same_filesystem(source, target):
+        try:
+            os.link(source, target)
+            return _done("hardlink", source, target)
+        except OSError as e:
+            LOG.debug(f"could not hardlink {source}: {e!r}")
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            ioctl(dst.fileno(), FICLONE, src.fileno())
+            dst.close()
+            return _done("reflink", source, target)
+        except OSError as e:
+            LOG.debug(f"could not reflink {source}: {e!r}")
+
+        if hasattr(os, "copy_file_range"):
+            try:
+                size = os.fstat(src.fileno()).st_size
+                copied = 0
+                while copied < size:
+                    n = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+                if copied == size:
+                    dst.close()
+                    return _done("copy_file_range", source, target)
+            except OSError as e:
+                LOG.debug(f"could not copy_file_range {source}: {e!r}")
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+
+    # uses sendfile() where available
+    shutil.copyfile(source, target)
+    return _done("copy", source, target)
+
+
+def is_copy_of(source, target):
+    """
+    check whether target is an unchanged copy of source made by copy_file(),
+    based on size and modification time
+    """
+    try:
+        src, dst = os.stat(source), os.stat(target)
+    except OSError:
+        return False
+    return src.st_size == dst.st_size and src.st_mtime_ns == dst.st_mtime_ns
+
+
+def _same_filesystem(source, target):
+    return os.stat(source).st_dev == os.stat(os.path.dirname(target) or ".").st_dev
+
+
+def _done(method, source, target):
+    # keep the modification time, so is_copy_of() can recognise the copy
+    st = os.stat(source)
+    os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+    LOG.info(f"imported {source} to {target} using {method}")
+    return method
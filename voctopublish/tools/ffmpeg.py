@@ -1,6 +1,8 @@
+from contextlib import contextmanager
 from json import loads
 from logging import getLogger
-from subprocess import PIPE, CalledProcessError, check_output
+from subprocess import PIPE, CalledProcessError, Popen, check_output
+from tempfile import TemporaryFile
 
 LOG = getLogger("ffmpeg")
 
@@ -31,6 +33,94 @@ def ffmpeg(*args):
     return _run(call)
 
 
+# output formats which can be written without seeking, by file extension
+STREAM_FORMATS = {
+    "mp4": ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"],
+    "m4a": ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"],
+    "webm": ["-f", "webm"],
+    "mkv": ["-f", "matroska"],
+    "mka": ["-f", "matroska"],
+    "ts": ["-f", "mpegts"],
+}
+
+
+def stream_format(extension):
+    """
+    :param extension: file extension of the output, e.g. the profile extension
+    :return: ffmpeg arguments selecting a format which can be streamed
+    """
+    try:
+        return STREAM_FORMATS[extension.lower()]
+    except KeyError:
+        raise ValueError(f"don't know how to stream .{extension} files") from None
+
+
+class FFmpegStream:
+    """
+    readable output of ffmpeg_stream(). Reaching the end of it does not
+    mean ffmpeg succeeded, call check() before making the result visible.
+    """
+
+    def __init__(self, proc, call, stderr):
+        self.proc = proc
+        self.call = call
+        self.stderr = stderr
+        self.returncode = None
+
+    def read(self, size=-1):
+        return self.proc.stdout.read(size)
+
+    def check(self):
+        """
+        wait for ffmpeg to exit, only call this after read() returned b"".
+        Raises CalledProcessError if ffmpeg failed, e.g. the output is
+        truncated.
+        """
+        if self.returncode is None:
+            self.proc.stdout.close()
+            self.returncode = self.proc.wait()
+        if self.returncode != 0:
+            self.stderr.seek(0)
+            e = CalledProcessError(
+                self.returncode, self.call, stderr=self.stderr.read()
+            )
+            LOG.error(f"error while running {self.call!r}")
+            LOG.debug(f"{e.stderr=}")
+            raise e
+
+
+@contextmanager
+def ffmpeg_stream(*args):
+    """
+    run ffmpeg with its output going to a pipe and yield a FFmpegStream to
+    read it. The last arguments should select a format which can be written
+    without seeking, see stream_format().
+    Raises CalledProcessError if ffmpeg fails.
+    """
+    call = [
+        "ffmpeg",
+        "-hide_banner",
+        "-nostdin",
+        "-loglevel",
+        "error",
+        *[str(i) for i in args],
+        "pipe:1",
+    ]
+    LOG.debug(f"running: {call!r}")
+    # stderr goes to a file, a full stderr pipe would block ffmpeg
+    with TemporaryFile() as stderr:
+        proc = Popen(call, stdout=PIPE, stderr=stderr)
+        stream = FFmpegStream(proc, call, stderr)
+        try:
+            yield stream
+        except BaseException:
+            proc.kill()
+            proc.stdout.close()
+            proc.wait()
+            raise
+        stream.check()
+
+
 def ffprobe_json(infile):
     call = [
         "ffprobe",
@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+from contextlib import contextmanager
+from fcntl import LOCK_EX, LOCK_UN, flock
+from hashlib import sha256
+from threading import Lock
+
+LOG = logging.getLogger("JsonStore")
+
+# entries of caches without a file, shared by all instances in this process
+_MEMORY = {}
+# flock() only works between processes, threads of the same process need a
+# lock of their own. Every file gets a separate one, so a slow user of one
+# store doesn't block the others.
+_THREAD_LOCKS = {}
+_THREAD_LOCKS_LOCK = Lock()
+
+
+def _thread_lock(path):
+    with _THREAD_LOCKS_LOCK:
+        return _THREAD_LOCKS.setdefault(path, Lock())
+
+
+class JsonStore:
+    """
+    Small JSON key-value store for state shared between tickets and
+    processes, like cached OAuth access tokens or the YouTube quota ledger.
+
+    The file is guarded by an exclusive flock() on a separate lock file, so
+    concurrent workers on the same machine see a consistent state. Keep the
+    store locked only briefly, network requests belong outside of
+    entries(). If path is empty, entries are only kept in memory.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path) if path else None
+
+    @staticmethod
+    def key(secret):
+        """
+        we don't want to store secrets like refresh tokens in the file, so
+        entries are keyed by a hash of them
+        """
+        return sha256(secret.encode()).hexdigest()
+
+    @contextmanager
+    def entries(self):
+        """
+        lock the cache and yield a dict of all entries. Changes to the dict
+        are written back when the context is left without an exception.
+        """
+        with _thread_lock(self.path):
+            if not self.path:
+                yield _MEMORY
+                return
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".lock", "w") as lockfile:
+                flock(lockfile, LOCK_EX)
+                try:
+                    entries = self._load()
+                    yield entries
+                    self._save(entries)
+                finally:
+                    flock(lockfile, LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            LOG.warning(f"{self.path} is corrupt, starting from scratch")
+            return {}
+
+    def _save(self, entries):
+        tmp = self.path + ".tmp"
+        # may contain access tokens, don't make them readable for others
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
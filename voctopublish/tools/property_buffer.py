@@ -0,0 +1,50 @@
+import logging
+
+LOG = logging.getLogger("PropertyBuffer")
+
+
+class PropertyBuffer:
+    """
+    collects ticket property writes and sends them to the tracker in a
+    single call when flush() gets called. Values the ticket already has on
+    the tracker are dropped.
+    """
+
+    def __init__(self, c3tt, ticket_id, known=None):
+        """
+        :param c3tt: C3TTClient
+        :param ticket_id:
+        :param known: properties the ticket currently has on the tracker
+        """
+        self.c3tt = c3tt
+        self.ticket_id = ticket_id
+        self._known = {k.casefold(): str(v) for k, v in (known or {}).items()}
+        self._pending = {}
+
+    def set(self, properties):
+        """
+        queue properties for the next flush()
+        :param properties: dict of property name => value
+        """
+        for k, v in properties.items():
+            if self._known.get(k.casefold()) == str(v):
+                LOG.debug(f"{k!r} already is {v!r}, not writing it again")
+                self._pending.pop(k, None)
+                continue
+            self._pending[k] = v
+
+    @property
+    def pending(self):
+        return dict(self._pending)
+
+    def flush(self):
+        """
+        write all queued properties to the tracker
+        """
+        if not self._pending:
+            return
+        LOG.info(f"writing {len(self._pending)} properties to ticket {self.ticket_id}")
+        self.c3tt.set_ticket_properties(self.ticket_id, self._pending)
+        for k, v in self._pending.items():
+            self._known[k.casefold()] = str(v)
+        self._pending = {}
@@ -18,8 +18,6 @@
 
 import math
 
-from PIL import Image, ImageStat
-
 # see http://dx.doi.org/10.1109/ICMT.2011.6002001 for algorithms
 
 
@@ -64,6 +62,9 @@ def luminance_variance(stat):
 
 
 def calc_score(path):
+    # pillow is only needed while generating thumbnails
+    from PIL import Image, ImageStat
+
     img = Image.open(path)
     gray = img.convert(mode="L")
     gray_hist = gray.histogram()
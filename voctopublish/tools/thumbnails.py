@@ -55,82 +55,49 @@ class ThumbnailGenerator:
             raise FileNotFoundError(self.path)
 
         source = join(self.ticket.publishing_path, self.ticket.local_filename)
-        logging.info(f"generating thumbs for {source}")
-
-        try:
-            length = int(float(ffprobe_json(source)["format"]["duration"]))
-        except Exception as e:
-            raise ThumbnailException(
-                f"ERROR: could not get duration from {source}: {e!r}"
-            ) from e
-
-        with TemporaryDirectory() as tmpdir:
-            logging.debug("TemporaryDirectory is " + str(tmpdir))
-
-            # now extract candidates and convert to non-anamorphic images
-            # we use equidistant sampling, but skip parts of the file that
-            # might contain pre-/postroles
-            # also, use higher resolution sampling at the beginning, as
-            # there's usually some interesting stuff there
-
-            if length > 20:
-                scores = {}
-                interval = 180
-                candidates = [20, 30, 40]  # some fixed candidates we always want to hit
-                logging.debug(
-                    "length of video used for thumbnail generation " + str(length)
-                )
-                candidates.extend(
-                    list(range(15, length - 60, interval))
-                )  # pick some more candidates based on the file length
-                try:
-                    for pos in candidates:
-                        candidate = join(tmpdir, str(pos) + ".png")
-                        r = ffmpeg(
-                            "-ss",
-                            pos,
-                            "-i",
-                            source,
-                            "-an",
-                            "-r",
-                            "1",
-                            "-filter:v",
-                            "scale=sar*iw:ih",
-                            "-vframes",
-                            "1",
-                            "-f",
-                            "image2",
-                            "-pix_fmt",
-                            "yuv420p",
-                            "-vcodec",
-                            "png",
-                            candidate,
-                        )
-                        if isfile(candidate):
-                            scores[candidate] = calc_score(candidate)
-                        else:
-                            logging.warning(
-                                "ffmpeg was not able to create candidate for "
-                                + str(candidate)
-                            )
-                except CalledProcessError as e_:
-                    raise ThumbnailException(
-                        "ffmpeg exited with the following error, while extracting candidates for thumbnails. "
-                        + e_.output.decode("utf-8")
-                    ) from e_
-                except Exception as e_:
-                    raise ThumbnailException(
-                        "Could not extract candidates: " + str(r)
-                    ) from e_
-
-                sorted_scores = sorted(scores.items(), key=itemgetter(1), reverse=True)
-                winner = sorted_scores[0][0]
-                logging.debug("Winner: " + winner)
-
-                move(winner, self.path)
-            else:
-                try:
-                    ffmpeg(
+        extract_thumbnail(source, self.path)
+
+
+def extract_thumbnail(source, target):
+    """
+    pick the most interesting frame of a video and write it to target as png
+    :param source: path or url of the video
+    :param target:
+    """
+    logging.info(f"generating thumbs for {source}")
+
+    try:
+        length = int(float(ffprobe_json(source)["format"]["duration"]))
+    except Exception as e:
+        raise ThumbnailException(
+            f"ERROR: could not get duration from {source}: {e!r}"
+        ) from e
+
+    with TemporaryDirectory() as tmpdir:
+        logging.debug("TemporaryDirectory is " + str(tmpdir))
+
+        # now extract candidates and convert to non-anamorphic images
+        # we use equidistant sampling, but skip parts of the file that
+        # might contain pre-/postroles
+        # also, use higher resolution sampling at the beginning, as
+        # there's usually some interesting stuff there
+
+        if length > 20:
+            scores = {}
+            interval = 180
+            candidates = [20, 30, 40]  # some fixed candidates we always want to hit
+            logging.debug(
+                "length of video used for thumbnail generation " + str(length)
+            )
+            candidates.extend(
+                list(range(15, length - 60, interval))
+            )  # pick some more candidates based on the file length
+            try:
+                for pos in candidates:
+                    candidate = join(tmpdir, str(pos) + ".png")
+                    r = ffmpeg(
+                        "-ss",
+                        pos,
                         "-i",
                         source,
                         "-an",
@@ -146,12 +113,54 @@ class ThumbnailGenerator:
                         "yuv420p",
                         "-vcodec",
                         "png",
-                        self.path,
+                        candidate,
                     )
-                except Exception as e_:
-                    raise ThumbnailException from e_
+                    if isfile(candidate):
+                        scores[candidate] = calc_score(candidate)
+                    else:
+                        logging.warning(
+                            "ffmpeg was not able to create candidate for "
+                            + str(candidate)
+                        )
+            except CalledProcessError as e_:
+                raise ThumbnailException(
+                    "ffmpeg exited with the following error, while extracting candidates for thumbnails. "
+                    + e_.output.decode("utf-8")
+                ) from e_
+            except Exception as e_:
+                raise ThumbnailException(
+                    "Could not extract candidates: " + str(r)
+                ) from e_
+
+            sorted_scores = sorted(scores.items(), key=itemgetter(1), reverse=True)
+            winner = sorted_scores[0][0]
+            logging.debug("Winner: " + winner)
+
+            move(winner, target)
+        else:
+            try:
+                ffmpeg(
+                    "-i",
+                    source,
+                    "-an",
+                    "-r",
+                    "1",
+                    "-filter:v",
+                    "scale=sar*iw:ih",
+                    "-vframes",
+                    "1",
+                    "-f",
+                    "image2",
+                    "-pix_fmt",
+                    "yuv420p",
+                    "-vcodec",
+                    "png",
+                    target,
+                )
+            except Exception as e_:
+                raise ThumbnailException from e_
 
-            logging.info("thumbnails generated")
+        logging.info("thumbnails generated")
 
 
 class ThumbnailException(Exception):
@@ -15,12 +15,13 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import importlib
+import json
 import logging
 import os
-import shutil
 import socket
 import sys
-import urllib.request
+import urllib.parse
 from subprocess import CalledProcessError, check_output
 from time import sleep
 
@@ -30,17 +31,14 @@ try:
 except ImportError:
     from rtoml import load as toml_load
 
-import api_client.bluesky_client as bluesky
-import api_client.googlechat_client as googlechat
-import api_client.mastodon_client as mastodon
-import api_client.webhook_client as webhook
-from api_client.rclone_client import RCloneClient
-from api_client.voctoweb_client import VoctowebClient
-from api_client.youtube_client import YoutubeAPI
+# clients of the publishing targets and the libraries they need take long
+# to import, they get imported when a ticket actually needs them
 from c3tt_rpc_client import C3TTClient
 from model.ticket_module import PublishingTicket, RecordingTicket
-from tools.ffmpeg import ffmpeg
-from tools.thumbnails import ThumbnailGenerator
+from tools.announcement_queue import AnnouncementQueue, AnnouncementSender
+from tools.fastcopy import copy_file, is_copy_of
+from tools.ffmpeg import ffmpeg, ffmpeg_stream, stream_format
+from tools.property_buffer import PropertyBuffer
 
 MY_PATH = os.path.abspath(os.path.dirname(__file__))
 POSSIBLE_CONFIG_PATHS = [
@@ -49,6 +47,8 @@ POSSIBLE_CONFIG_PATHS = [
     os.path.join(MY_PATH, "voctopublish.conf"),
     os.path.join(MY_PATH, "client.conf"),
 ]
+# quota day on which publishing a ticket to YouTube has been deferred
+DEFERRED_PROPERTY = "Voctopublish.YouTubeDeferred"
 
 for path in POSSIBLE_CONFIG_PATHS:
     if path and os.path.isfile(path):
@@ -83,6 +83,7 @@ class Worker:
         self.ticket = None
         self.ticket_id = None
         self.thumbs = None
+        self.properties = None
 
         self.worker_type = CONFIG["general"]["worker_type"]
         if self.worker_type == "releasing":
@@ -145,58 +146,122 @@ class Worker:
                     f"Output path {self.ticket.publishing_path} is not writable"
                 )
 
-        self.thumbs = ThumbnailGenerator(self.ticket, CONFIG)
-        if not self.thumbs.exists and (
-            (self.ticket.voctoweb_enable and self.ticket.mime_type.startswith("video"))
-            or (self.ticket.youtube_enable and self.ticket.youtube_enable)
+        # the other targets have been published when YouTube got deferred
+        resumed = bool(self.ticket.youtube_deferred)
+        if resumed:
+            self.logger.info(
+                f"resuming ticket deferred on {self.ticket.youtube_deferred}, "
+                "only publishing to YouTube"
+            )
+
+        # check the YouTube quota before doing any expensive work. If it is
+        # not enough, the other targets get published and the ticket stays
+        # assigned to us until the quota has been reset.
+        youtube_deferred = None
+        quota = None
+        if (
+            self.ticket.youtube_enable
+            and not self._youtube_already_published()
+            and not self._youtube_metadata_only()
         ):
-            self.thumbs.generate()
+            import api_client.youtube_client as youtube
 
-        # voctoweb
-        self.logger.debug(f"#voctoweb {self.ticket.voctoweb_enable}")
-        if self.ticket.voctoweb_enable:
-            self._publish_to_voctoweb()
+            quota = youtube.YoutubeAPI(
+                self.ticket,
+                None,
+                CONFIG,
+                CONFIG["youtube"]["client_id"],
+                CONFIG["youtube"]["secret"],
+            )
+            try:
+                quota.check_quota()
+            except youtube.YouTubeQuotaExceeded as e_:
+                self.logger.warning(f"deferring YouTube: {e_}")
+                youtube_deferred = youtube.quota_day()
+                quota = None
 
-        # YouTube
-        self.logger.debug(f"#youtube {self.ticket.youtube_enable}")
-        if self.ticket.youtube_enable:
-            if (
-                self.ticket.has_youtube_url
-                and self.ticket.youtube_update != "force"
-                and len(self.ticket.languages) <= 1
-            ):
-                self.logger.debug(
-                    f"{self.ticket.youtube_urls=} {self.ticket.youtube_update=}"
+        # give back what publishing to YouTube didn't use of the reserved quota
+        try:
+            from tools.thumbnails import ThumbnailGenerator
+
+            self.thumbs = ThumbnailGenerator(self.ticket, CONFIG)
+            if not self.thumbs.exists and (
+                (
+                    self.ticket.voctoweb_enable
+                    and self.ticket.mime_type.startswith("video")
                 )
-                if self.ticket.youtube_update != "ignore":
-                    raise PublisherException(
-                        "YouTube URLs already exist in ticket, wont publish to YouTube."
-                    )
-            else:
-                self._publish_to_youtube()
+                or (self.ticket.youtube_enable and self.ticket.youtube_enable)
+            ):
+                self.thumbs.generate()
+
+            # voctoweb
+            self.logger.debug(f"#voctoweb {self.ticket.voctoweb_enable}")
+            if self.ticket.voctoweb_enable and not resumed:
+                self._publish_to_voctoweb()
+
+            # YouTube
+            self.logger.debug(f"#youtube {self.ticket.youtube_enable}")
+            if self.ticket.youtube_enable and not youtube_deferred:
+                import api_client.youtube_client as youtube
+
+                try:
+                    if self._youtube_metadata_only():
+                        self._update_youtube_metadata()
+                    elif self._youtube_already_published():
+                        self.logger.debug(
+                            f"{self.ticket.youtube_urls=} {self.ticket.youtube_update=}"
+                        )
+                        if self.ticket.youtube_update != "ignore":
+                            raise PublisherException(
+                                "YouTube URLs already exist in ticket, wont publish to YouTube."
+                            )
+                    else:
+                        self._publish_to_youtube()
+                except youtube.YouTubeQuotaExceeded as e_:
+                    # someone else used up the quota of our client id
+                    self.logger.warning(f"deferring YouTube: {e_}")
+                    youtube_deferred = youtube.quota_day()
+        finally:
+            if quota:
+                quota.release_quota()
 
         self.logger.debug(f"#rclone {self.ticket.rclone_enable}")
         rclone = None
-        if self.ticket.rclone_enable:
+        if self.ticket.rclone_enable and not resumed:
             if self.ticket.master or not self.ticket.rclone_only_master:
+                # rclone may run for a long time, keep what we have so far
+                self.properties.flush()
+                from api_client.rclone_client import FAILED, RCloneClient
+
                 rclone = RCloneClient(self.ticket, CONFIG)
                 ret = rclone.upload()
                 if ret not in (0, 9):
                     raise PublisherException(f"rclone failed with exit code {ret}")
-                self.c3tt.set_ticket_properties(
-                    self.ticket_id,
+                self.properties.set(
                     {
                         "Rclone.DestinationFileName": rclone.destination,
                         "Rclone.ReturnCode": str(ret),
                     },
                 )
+                artifacts = rclone.upload_artifacts()
+                self.properties.set(rclone.artifact_properties(artifacts))
+                if FAILED in artifacts.values():
+                    self.properties.flush()
+                    raise PublisherException("rclone failed to copy some artifacts")
             else:
                 self.logger.debug(
                     "skipping rclone because Publishing.Rclone.OnlyMaster is set to 'yes'"
                 )
 
-        if self.ticket.webhook_url:
-            if self.ticket.master or not self.ticket.webhook_only_master:
+        if self.ticket.webhook_url and not resumed:
+            if (
+                self.ticket.master or not self.ticket.webhook_only_master
+            ) and self._webhook_in_background():
+                self._queue_webhook(rclone)
+            elif self.ticket.master or not self.ticket.webhook_only_master:
+                self.properties.flush()
+                import api_client.webhook_client as webhook
+
                 result = webhook.send(
                     self.ticket,
                     CONFIG,
@@ -211,28 +276,124 @@ class Worker:
                         f"POSTing webhook to {self.ticket.webhook_url} failed with http status code {result}"
                     )
                 elif isinstance(result, int):
-                    self.c3tt.set_ticket_properties(
-                        self.ticket_id,
-                        {
-                            "Webhook.StatusCode": result,
-                        },
-                    )
+                    self.properties.set({"Webhook.StatusCode": result})
+
+        if youtube_deferred:
+            # neither done nor failed, get_ticket_from_tracker() picks the
+            # ticket up again once the quota has been reset
+            self.properties.set({DEFERRED_PROPERTY: youtube_deferred})
+            self.properties.flush()
+            self.logger.info(f"deferred publishing to YouTube on {youtube_deferred}")
+            return
+        if resumed:
+            self.properties.set({DEFERRED_PROPERTY: ""})
 
+        self.properties.flush()
         self.c3tt.set_ticket_done(self.ticket_id)
 
+        if self.ticket.master:
+            try:
+                self._queue_announcements()
+            except Exception:
+                # we don't care if announcing fails here.
+                self.logger.exception("could not queue announcements")
+
+        self.logger.debug("#done")
+
+    def _queue_announcements(self):
+        """
+        render the announcements of this release and put them into the
+        announcement queue. They get delivered by the AnnouncementSender,
+        so we don't wait for slow or broken instances here.
+        """
+        from tools.announcements import make_digest_item
+
+        queue = announcement_queue()
+        # releases of the same conference within this many seconds get
+        # announced together in a digest
+        window = CONFIG.get("announcements", {}).get("coalesce_window", 0)
+
         # Mastodon
-        if self.ticket.mastodon_enable and self.ticket.master:
-            mastodon.send_toot(self.ticket, CONFIG)
+        if self.ticket.mastodon_enable:
+            import api_client.mastodon_client as mastodon
+
+            message = mastodon.make_toot(self.ticket, CONFIG)
+            if message:
+                queue.put(
+                    "mastodon",
+                    make_digest_item(self.ticket, CONFIG, message, 500),
+                    self.ticket.acronym,
+                    window,
+                )
 
         # Bluesky
-        if self.ticket.bluesky_enable and self.ticket.master:
-            bluesky.send_post(self.ticket, CONFIG)
+        if self.ticket.bluesky_enable:
+            import api_client.bluesky_client as bluesky
+
+            message = bluesky.make_post(self.ticket, CONFIG)
+            if message:
+                queue.put(
+                    "bluesky",
+                    make_digest_item(self.ticket, CONFIG, message, 280),
+                    self.ticket.acronym,
+                    window,
+                )
 
         # Google Chat (former Hangouts Chat)
-        if self.ticket.googlechat_webhook_url and self.ticket.master:
-            googlechat.send_chat_message(self.ticket, CONFIG)
+        if self.ticket.googlechat_webhook_url:
+            import api_client.googlechat_client as googlechat
 
-        self.logger.debug("#done")
+            queue.put("googlechat", googlechat.make_chat_message(self.ticket, CONFIG))
+
+    def _webhook_in_background(self):
+        """
+        :return: True if the webhook should be delivered from the outbox. Not
+            possible with Publishing.Webhook.FailOnError, which needs the result.
+        """
+        return (
+            CONFIG.get("webhook", {}).get("background", False)
+            and not self.ticket.webhook_fail_on_error
+        )
+
+    def _queue_webhook(self, rclone):
+        """
+        put the webhook into the outbox, it gets delivered by the webhook senders
+        """
+        import api_client.webhook_client as webhook
+
+        settings = CONFIG.get("webhook", {})
+        url = self.ticket.webhook_url
+        batch = url in settings.get("batch_urls", [])
+        webhook_outbox().put(
+            "webhook",
+            webhook.make_request(
+                self.ticket,
+                CONFIG,
+                getattr(self, "voctoweb_filename", None),
+                getattr(self, "voctoweb_language", self.ticket.language),
+                rclone,
+            ),
+            group=url if batch else None,
+            window=settings.get("batch_window", DEFAULT_WEBHOOK_BATCH_WINDOW),
+            collect=True,
+            target=url,
+        )
+
+    def _youtube_already_published(self):
+        """
+        :return: True if the ticket has YouTube urls which should not be replaced
+        """
+        return (
+            self.ticket.has_youtube_url
+            and self.ticket.youtube_update != "force"
+            and len(self.ticket.languages) <= 1
+        )
+
+    def _youtube_metadata_only(self):
+        """
+        :return: True if only the metadata of existing YouTube videos should be updated
+        """
+        return self.ticket.has_youtube_url and self.ticket.youtube_update == "metadata"
 
     def get_ticket_from_tracker(self):
         """
@@ -240,8 +401,11 @@ class Worker:
         :return: a ticket object or None in case no ticket is available
         """
         self.logger.info("requesting ticket from tracker")
-        ticket_meta = self.c3tt.assign_next_unassigned_for_state(
-            self.ticket_type, self.to_state, {"EncodingProfile.Slug": "relive"}
+        ticket_meta = (
+            self._deferred_ticket()
+            or self.c3tt.assign_next_unassigned_for_state(
+                self.ticket_type, self.to_state, {"EncodingProfile.Slug": "relive"}
+            )
         )
         if ticket_meta:
             ticket_id = ticket_meta["id"]
@@ -253,8 +417,10 @@ class Worker:
             except Exception as e_:
                 self.c3tt.set_ticket_failed(ticket_id, e_)
                 raise e_
+            self.properties = PropertyBuffer(self.c3tt, ticket_id, ticket_properties)
             if self.ticket_type == "encoding":
                 self.ticket = PublishingTicket(ticket_properties, ticket_id, CONFIG)
+                self.ticket.validate()
             elif self.ticket_type == "recording":
                 self.ticket = RecordingTicket(ticket_properties, ticket_id, CONFIG)
             else:
@@ -269,11 +435,40 @@ class Worker:
                 "No ticket of type " + self.ticket_type + " for state " + self.to_state
             )
 
+    def _deferred_ticket(self):
+        """
+        :return: meta data of the ticket assigned to us whose YouTube stage has
+            been deferred, if the quota has been reset since then
+        """
+        if self.ticket_type != "encoding":
+            return None
+        ticket_meta = self.c3tt.get_assigned_for_state(
+            self.ticket_type, self.to_state, {"EncodingProfile.Slug": "relive"}
+        )
+        if not ticket_meta:
+            return None
+        deferred = self.c3tt.get_ticket_properties(ticket_meta["id"]).get(
+            DEFERRED_PROPERTY
+        )
+        if not deferred:
+            return None
+
+        from api_client.youtube_client import quota_day
+
+        if deferred == quota_day():
+            self.logger.debug(
+                f"ticket {ticket_meta['id']} waits for the YouTube quota to be reset"
+            )
+            return None
+        return ticket_meta
+
     def _publish_to_voctoweb(self):
         """
         Create an event on a voctoweb instance. This includes creating a recording for each media file.
         """
         self.logger.info("publishing to voctoweb")
+        from api_client.voctoweb_client import VoctowebClient
+
         try:
             vw = VoctowebClient(
                 self.ticket,
@@ -304,9 +499,9 @@ class Worker:
                     self.logger.debug("response: " + str(r.json()))
                     try:
                         # TODO only set recording id when new recording was created, and not when it was only updated
-                        self.c3tt.set_ticket_properties(
-                            self.ticket_id, {"Voctoweb.EventId": r.json()["id"]}
-                        )
+                        # write it right away, a retry would create a second event otherwise
+                        self.properties.set({"Voctoweb.EventId": r.json()["id"]})
+                        self.properties.flush()
                     except Exception as e_:
                         raise PublisherException(
                             "failed to Voctoweb EventID to ticket"
@@ -359,9 +554,8 @@ class Worker:
                     vw.generate_timelens()
                     vw.upload_timelens()
                     if source_hash is not None:
-                        self.c3tt.set_ticket_properties(
-                            self.ticket_id,
-                            {"Publishing.Voctoweb.SourceFileHash": source_hash},
+                        self.properties.set(
+                            {"Publishing.Voctoweb.SourceFileHash": source_hash}
                         )
 
             # in case of a multi-language release we create here the single language files
@@ -414,9 +608,7 @@ class Worker:
 
         # when the ticket was created, and not only updated: write recording_id to ticket
         if recording_id:
-            self.c3tt.set_ticket_properties(
-                self.ticket_id, {"Voctoweb.RecordingId.Master": recording_id}
-            )
+            self.properties.set({"Voctoweb.RecordingId.Master": recording_id})
 
     def _mux_to_single_language(self, vw):
         """
@@ -425,6 +617,7 @@ class Worker:
         :return:
         """
         self.logger.debug("Languages: " + str(self.ticket.languages))
+        master_details = None
         for language in self.ticket.languages:
             out_filename = (
                 self.ticket.fahrplan_id
@@ -442,33 +635,65 @@ class Worker:
                 + self.ticket.profile_extension
             )
 
-            self.logger.info(f"remuxing {self.ticket.local_filename} to {out_path}")
+            source = os.path.join(
+                self.ticket.publishing_path, self.ticket.local_filename
+            )
+            file_details = None
+
+            if CONFIG["voctoweb"].get("streaming_remux", False):
+                # streamable formats like fragmented mp4 can be written without
+                # seeking, so ffmpeg can write them directly to the voctoweb storage
+                self.logger.info(f"streaming audio track {language} of {source}")
+                if master_details is None:
+                    master_details = []
+                    vw._get_file_details(self.ticket.local_filename, master_details)
+                try:
+                    with ffmpeg_stream(
+                        "-i",
+                        source,
+                        "-map",
+                        "0:0",
+                        "-map",
+                        f"0:a:{language}",
+                        "-c",
+                        "copy",
+                        *stream_format(self.ticket.profile_extension),
+                    ) as stream:
+                        size = vw.upload_stream(
+                            stream, filename, self.ticket.folder, stream.check
+                        )
+                except CalledProcessError as e_:
+                    raise PublisherException(f"error remuxing {source}") from e_
+                except Exception as e_:
+                    raise PublisherException(f"error uploading {filename}") from e_
+                # length and resolution are the same as in the master file
+                file_details = [size, *master_details[1:]]
+            else:
+                self.logger.info(f"remuxing {source} to {out_path}")
 
-            try:
-                ffmpeg(
-                    "-i",
-                    os.path.join(
-                        self.ticket.publishing_path, self.ticket.local_filename
-                    ),
-                    "-map",
-                    "0:0",
-                    "-map",
-                    f"0:a:{language}",
-                    "-c",
-                    "copy",
-                    "-movflags",
-                    "faststart",
-                    out_path,
-                )
-            except CalledProcessError as e_:
-                raise PublisherException(
-                    f"error remuxing {self.ticket.local_filename} to {out_path}"
-                ) from e_
+                try:
+                    ffmpeg(
+                        "-i",
+                        source,
+                        "-map",
+                        "0:0",
+                        "-map",
+                        f"0:a:{language}",
+                        "-c",
+                        "copy",
+                        "-movflags",
+                        "faststart",
+                        out_path,
+                    )
+                except CalledProcessError as e_:
+                    raise PublisherException(
+                        f"error remuxing {self.ticket.local_filename} to {out_path}"
+                    ) from e_
 
-            try:
-                vw.upload_file(out_path, filename, self.ticket.folder)
-            except Exception as e_:
-                raise PublisherException(f"error uploading {out_path}") from e_
+                try:
+                    vw.upload_file(out_path, filename, self.ticket.folder)
+                except Exception as e_:
+                    raise PublisherException(f"error uploading {out_path}") from e_
 
             try:
                 recording_id = vw.create_recording(
@@ -479,6 +704,7 @@ class Worker:
                     hq=True,
                     html5=True,
                     single_language=True,
+                    file_details=file_details,
                 )
             except Exception as e_:
                 raise PublisherException("creating recording failed") from e_
@@ -486,8 +712,7 @@ class Worker:
             try:
                 # when the ticket was created, and not only updated: write recording_id to ticket
                 if recording_id:
-                    self.c3tt.set_ticket_properties(
-                        self.ticket_id,
+                    self.properties.set(
                         {
                             "Voctoweb.RecordingId."
                             + self.ticket.languages[language]: str(recording_id)
@@ -501,6 +726,9 @@ class Worker:
         Publish the file to YouTube.
         """
         self.logger.debug("publishing to youtube")
+        # uploading takes long and fails more often than anything else
+        self.properties.flush()
+        from api_client.youtube_client import YoutubeAPI
 
         yt = YoutubeAPI(
             self.ticket,
@@ -516,7 +744,9 @@ class Worker:
         for i, youtubeUrl in enumerate(youtube_urls):
             props["YouTube.Url" + str(i)] = youtubeUrl
 
-        self.c3tt.set_ticket_properties(self.ticket_id, props)
+        # write the URLs right away, a retry would upload the videos again otherwise
+        self.properties.set(props)
+        self.properties.flush()
         self.ticket.youtube_urls = props
 
         # now, after we reported everything back to the tracker, we try to add the videos to our own playlists
@@ -541,11 +771,30 @@ class Worker:
             video_id = url.split("=", 2)[1]
             yt_voctoweb.add_to_playlists(video_id, self.ticket.youtube_playlists)
 
+    def _update_youtube_metadata(self):
+        """
+        Update title, description etc. of the videos already on YouTube instead of uploading them again.
+        """
+        self.logger.debug("updating metadata on youtube")
+        from api_client.youtube_client import YoutubeAPI
+
+        yt = YoutubeAPI(
+            self.ticket,
+            self.thumbs,
+            CONFIG,
+            CONFIG["youtube"]["client_id"],
+            CONFIG["youtube"]["secret"],
+        )
+        yt.setup(self.ticket.youtube_token)
+        yt.sync_metadata()
+
     def download(self):
         """
         download or copy a file for processing
         :return:
         """
+        import tools.download as downloader
+
         # we name our input video file uncut ts so tracker will find it. This is not the nicest way to go
         # TODO find a better integration in to the pipeline
         path = os.path.join(
@@ -563,11 +812,6 @@ class Worker:
                 self.logger.exception(f"could not create directory path {path}")
                 raise PublisherException(e)
 
-        if os.path.exists(file) and not self.ticket.redownload_enabled:
-            raise PublisherException(
-                f"video file at {path} already exists, please remove file"
-            )
-
         url = self.ticket.download_url
         url_decoded = urllib.parse.unquote(url)
         if len(url) > len(url_decoded):
@@ -576,18 +820,33 @@ class Worker:
             )
             url = url_decoded
 
+        offset = 0
+        if os.path.exists(file) and not self.ticket.redownload_enabled:
+            status, offset = self._check_existing_file(url, file)
+            if status == downloader.CURRENT:
+                self.logger.info(f"{file} is up to date, skipping download")
+            elif status == downloader.RESUME:
+                self.logger.info(f"resuming download of {file} at byte {offset}")
+            else:
+                self.logger.info(f"{url} has changed, downloading it again")
+        else:
+            status = downloader.CHANGED
+
+        if status == downloader.CURRENT:
+            pass
+        elif self._remux_enabled(url):
+            self._remux_file(url, file)
         # if it's a URL it probably will start with http ....
-        if self.ticket.download_url.startswith(
+        elif self.ticket.download_url.startswith(
             "http"
         ) or self.ticket.download_url.startswith("ftp"):
-            self._download_file(url, file)
+            self._download_file(url, file, offset)
         else:
             self._copy_file(url, file)
 
         # set recording language TODO multilang
         try:
-            self.c3tt.set_ticket_properties(
-                self.ticket_id,
+            self.properties.set(
                 {
                     "Record.Language": self.ticket.language,
                     "Record.Room": self.ticket.fuse_room,
@@ -603,39 +862,208 @@ class Worker:
             )
 
         # tell the tracker that we finished the import
+        self.properties.flush()
         self.c3tt.set_ticket_done(self.ticket_id)
 
+    def _check_existing_file(self, source, target):
+        """
+        compare an existing uncut.ts with its source
+        :return: tuple of status (CURRENT, RESUME or CHANGED) and the offset
+            to resume the download at
+        """
+        import tools.download as downloader
+
+        if self._remux_enabled(source):
+            # the remuxed file differs from its source, compare the
+            # fingerprint of the source we remuxed instead
+            try:
+                with open(target + ".remux") as f:
+                    remuxed = json.load(f)
+            except (OSError, ValueError):
+                return downloader.CHANGED, 0
+            fingerprint = self._source_fingerprint(source)
+            if fingerprint and remuxed == dict(
+                fingerprint, remuxed_size=os.path.getsize(target)
+            ):
+                return downloader.CURRENT, 0
+            return downloader.CHANGED, 0
+
+        if not source.startswith("http") and not source.startswith("ftp"):
+            if is_copy_of(source, target):
+                return downloader.CURRENT, 0
+            return downloader.CHANGED, 0
+
+        if source.startswith("http"):
+            import requests
+
+            try:
+                status, offset = downloader.check_existing(
+                    urllib.parse.quote(source, safe=":/"), target
+                )
+            except (requests.RequestException, OSError) as e:
+                raise PublisherException(f"could not check {source}") from e
+            if status != downloader.RESUME or self._python_download():
+                return status, offset
+            return downloader.CHANGED, 0
+
+        raise PublisherException(
+            f"video file at {target} already exists, please remove file"
+        )
+
+    def _python_download(self):
+        """
+        :return: True if files get downloaded by tools.download instead of an external command
+        """
+        return self.ticket.download_command in (None, True, False) or isinstance(
+            self.ticket.download_command, dict
+        )
+
+    @staticmethod
+    def _remux_enabled(source):
+        """
+        :return: True if source is not MPEG-TS and should be converted while importing it
+        """
+        if not CONFIG.get("download", {}).get("remux", False):
+            return False
+        path = urllib.parse.urlparse(source).path if "://" in source else source
+        return os.path.splitext(path)[1].lower() not in (".ts", ".mts", ".m2ts")
+
+    def _remux_file(self, source, target):
+        """
+        let ffmpeg read source (a URL or a local path) and remux it to MPEG-TS
+        while the data arrives, instead of downloading it first and
+        converting it afterwards.
+        :return:
+        """
+        fingerprint = self._source_fingerprint(source)
+        if "://" in source:
+            source = urllib.parse.quote(source, safe=":/")
+        self.logger.info(f"remuxing {source} to {target}")
+        # the fingerprint of an earlier plain download does not describe the
+        # remuxed file. The target may be a hardlink to the source, ffmpeg
+        # would truncate the source when overwriting it.
+        for path in (target + ".source", target + ".remux", target):
+            if os.path.exists(path):
+                os.remove(path)
+
+        verify = CONFIG.get("download", {}).get("verify", False)
+        args = []
+        if verify:
+            # abort on the first broken packet or frame
+            args += ["-xerror", "-err_detect", "explode"]
+        args += ["-i", source, "-map", "0", "-c", "copy", "-f", "mpegts", target]
+        if verify:
+            # decode everything once, so broken streams get noticed during the import
+            args += ["-map", "0", "-f", "null", "-"]
+
+        try:
+            ffmpeg(*args)
+        except CalledProcessError as e:
+            if os.path.exists(target):
+                os.remove(target)
+            raise PublisherException(f"could not remux {source}") from e
+
+        # remember what we remuxed, so _check_existing_file() can compare it later
+        if fingerprint:
+            fingerprint["remuxed_size"] = os.path.getsize(target)
+            with open(target + ".remux.tmp", "w") as f:
+                json.dump(fingerprint, f)
+            os.replace(target + ".remux.tmp", target + ".remux")
+
+    def _source_fingerprint(self, source):
+        """
+        :param source: URL or local path of a file to import
+        :return: dict identifying the current version of source, None if it
+            can't be identified
+        """
+        if "://" not in source:
+            try:
+                st = os.stat(source)
+            except OSError:
+                return None
+            return {"source": source, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if not source.startswith("http"):
+            return None
+
+        import requests
+        import tools.download as downloader
+
+        try:
+            remote = downloader.probe(urllib.parse.quote(source, safe=":/"))
+        except requests.RequestException as e:
+            raise PublisherException(f"could not check {source}") from e
+        if remote["size"] is None or not (remote["etag"] or remote["last_modified"]):
+            return None
+        return {
+            "source": source,
+            "size": remote["size"],
+            "etag": remote["etag"],
+            "last_modified": remote["last_modified"],
+        }
+
     @staticmethod
     def _copy_file(source, target):
         """
         copy a file from a local folder to the fake fuse and name it uncut.ts
         this hack to import files not produced with the tracker into the workflow to publish it on the voctoweb / youtube
+        if possible, the file gets hardlinked or reflinked instead of copied
         :return:
         """
         try:
-            shutil.copyfile(source, target)
+            copy_file(
+                source,
+                target,
+                hardlink=CONFIG.get("download", {}).get("hardlink", False),
+            )
         except IOError as e_:
             raise PublisherException(e_)
 
-    def _download_file(self, source, target):
+    def _download_file(self, source, target, offset=0):
         """
         download a file from a http / https / ftp URL and place it as an uncut.ts in the fuse folder.
         this hack to import files not produced with the tracker into the workflow to publish it on the voctoweb / youtube
+        :param offset: number of bytes already downloaded to target
         :return:
         """
         self.logger.info("Downloading file from: " + source)
-        if self.ticket.download_command in (None, True, False):
-            with open(target, "wb") as fh:
-                with urllib.request.urlopen(
-                    urllib.parse.quote(source, safe=":/")
-                ) as df:
-                    # original version tried to write whole file to ram and ran out of memory
-                    # read in 16 kB chunks instead
-                    while True:
-                        chunk = df.read(16384)
-                        if not chunk:
-                            break
-                        fh.write(chunk)
+        if self._python_download():
+            if source.startswith("ftp"):
+                import urllib.request
+
+                with open(target, "wb") as fh:
+                    with urllib.request.urlopen(
+                        urllib.parse.quote(source, safe=":/")
+                    ) as df:
+                        # original version tried to write whole file to ram and ran out of memory
+                        # read in 16 kB chunks instead
+                        while True:
+                            chunk = df.read(16384)
+                            if not chunk:
+                                break
+                            fh.write(chunk)
+            else:
+                import requests
+                import tools.download as downloader
+
+                options = self.ticket.download_command
+                if not isinstance(options, dict):
+                    options = {}
+                try:
+                    downloader.download(
+                        urllib.parse.quote(source, safe=":/"),
+                        target,
+                        connections=options.get(
+                            "connections", downloader.DEFAULT_CONNECTIONS
+                        ),
+                        segment_size=options.get("segment_size"),
+                        offset=offset,
+                    )
+                except (
+                    downloader.DownloadException,
+                    requests.RequestException,
+                    OSError,
+                ) as e:
+                    raise PublisherException(f"could not download {source}") from e
         else:
             command = []
             for part in self.ticket.download_command:
@@ -661,6 +1089,75 @@ class PublisherException(Exception):
     pass
 
 
+def _deferred(module, function):
+    """
+    :return: function which imports module when it gets called
+    """
+
+    def call(*args, **kwargs):
+        return getattr(importlib.import_module(module), function)(*args, **kwargs)
+
+    return call
+
+
+# functions which deliver queued announcements, see Worker._queue_announcements()
+ANNOUNCEMENT_SERVICES = {
+    "mastodon": _deferred("api_client.mastodon_client", "post_toot"),
+    "bluesky": _deferred("api_client.bluesky_client", "post"),
+    "googlechat": _deferred("api_client.googlechat_client", "post_chat_message"),
+}
+
+
+def announcement_queue():
+    return AnnouncementQueue(CONFIG.get("announcements", {}).get("queue"))
+
+
+def announcement_sender():
+    return AnnouncementSender(announcement_queue(), CONFIG, ANNOUNCEMENT_SERVICES)
+
+
+DEFAULT_WEBHOOK_OUTBOX = "~/.cache/voctopublish/webhooks.sqlite"
+DEFAULT_WEBHOOK_BATCH_WINDOW = 10
+
+
+def webhook_outbox():
+    return AnnouncementQueue(
+        CONFIG.get("webhook", {}).get("outbox", DEFAULT_WEBHOOK_OUTBOX)
+    )
+
+
+def webhook_senders():
+    """
+    :return: list of senders which deliver webhooks from the outbox concurrently
+    """
+    settings = CONFIG.get("webhook", {})
+    outbox = webhook_outbox()
+    return [
+        AnnouncementSender(
+            outbox,
+            CONFIG,
+            {"webhook": _deferred("api_client.webhook_client", "deliver")},
+            settings={
+                "concurrency": {"webhook": settings.get("max_per_url", 2)},
+                "max_attempts": settings.get("max_attempts", 10),
+            },
+            combine=_deferred("api_client.webhook_client", "combine"),
+            name=f"WebhookSender-{i}",
+        )
+        for i in range(settings.get("workers", 4))
+    ]
+
+
+def background_senders():
+    """
+    :return: list of senders for everything which gets delivered in the background
+    """
+    senders = [announcement_sender()]
+    if CONFIG.get("webhook", {}).get("background", False):
+        senders += webhook_senders()
+    return senders
+
+
 def process_single_ticket():
     w = None
     try:
@@ -678,6 +1175,12 @@ def process_single_ticket():
     except Exception as e:
         if w and w.ticket_id:
             exc_type, exc_obj, exc_tb = sys.exc_info()
+            if w.properties:
+                # keep ids of everything which got published before the error
+                try:
+                    w.properties.flush()
+                except Exception:
+                    logging.exception(f"could not write properties of {w.ticket_id}")
             w.c3tt.set_ticket_failed(w.ticket_id, f"{exc_type.__name__}: {e}")
             logging.exception(f"could not process ticket {w.ticket_id}")
         else:
@@ -689,6 +1192,9 @@ if __name__ == "__main__":
     run_mode = CONFIG["general"].get("run_mode", "single")
 
     if run_mode == "loop_until_empty" or run_mode == "loop_forever":
+        senders = background_senders()
+        for sender in senders:
+            sender.start()
         while True:
             have_processed_ticket = process_single_ticket()
             if have_processed_ticket:
@@ -699,11 +1205,22 @@ if __name__ == "__main__":
                 # no tickets processed right now, so wait longer
                 sleep(30)
             else:
-                # no tickets processed right now, so we exit cleanly
+                # no tickets processed right now, so we exit cleanly.
+                # Announcements which could not be delivered yet stay in the
+                # queue for the next run.
+                for sender in senders:
+                    sender.stop()
+                for sender in senders:
+                    sender.join()
+                    sender.deliver_due()
                 sys.exit(0)
 
     elif run_mode == "single":
         process_single_ticket()
+        # the ticket is already done at this point, so this doesn't hold up
+        # the tracker. Failed announcements get retried on the next run.
+        for sender in background_senders():
+            sender.deliver_due()
         sys.exit(0)
 
     else: